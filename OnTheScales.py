@@ -1,12 +1,18 @@
 import streamlit as st
+import pandas as pd
 import functions.utils as ut
 import functions.user as user
+import functions.data as data
 import functions.figures as fgs
+import functions.smoothing as smoothing
+import functions.kiosk as kiosk
+import functions.recent as recent
 
 # init default values
 ut.init_vars()
 ut.default_style()
 ut.create_menu()
+ut.live_updates()
 
 # ----- current user -----
 col_title = st.columns(2, gap="small", vertical_alignment="bottom")
@@ -19,25 +25,82 @@ with col_title[1]:
     if goto_measurement:
         ut.switch_page("measurements")
 
+# value of days with several measurements, handling of outliers and smoothing, used by all figures
+col_series = st.columns(3, gap="small")
+with col_series[0]:
+    st.segmented_control(
+        "daily value:",
+        options=["first", "mean", "min"],
+        key="daily_how",
+        on_change=ut.keep_selected,
+        args=("daily_how", "first"),
+    )
+with col_series[1]:
+    st.segmented_control(
+        "outliers:",
+        options=["highlight", "exclude"],
+        key="outlier_how",
+        on_change=ut.keep_selected,
+        args=("outlier_how", "highlight"),
+    )
+with col_series[2]:
+    st.segmented_control(
+        "smoothing:",
+        options=["off", "ewma", "kalman"],
+        key="smooth_how",
+        on_change=ut.keep_selected,
+        args=("smooth_how", "off"),
+    )
+
+# daily series of measurements, shared by all figures and kept for switching back to this user
+db_daily = data.recent_daily(
+    st.session_state.user_name,
+    st.session_state.db_version,
+    st.session_state.daily_how,
+    st.session_state.outlier_how,
+)
+
 
 # ----- main figure -----
 # create fragment 4 main_figure
 @st.fragment()
 def fragment_main_figure():
     with st.container(border=True):
-        # create figure
-        fig_chrono = fgs.main()
+        # create figure, or take the one kept of this user
+        fig_chrono = recent.get(
+            st.session_state.user_name,
+            st.session_state.db_version,
+            (
+                "fig_chrono",
+                st.session_state.daily_how,
+                st.session_state.outlier_how,
+                st.session_state.smooth_how,
+                st.session_state.user_kg,
+                st.session_state.fig_main_style,
+            ),
+            lambda: fgs.main(
+                db_daily,
+                st.session_state.user_kg,
+                st.session_state.fig_main_style,
+                (
+                    smoothing.smoothed(
+                        st.session_state.user_name,
+                        st.session_state.db_version,
+                        st.session_state.daily_how,
+                        st.session_state.outlier_how,
+                        st.session_state.smooth_how,
+                    )
+                    if st.session_state.smooth_how != "off" and db_daily.shape[0] > 0
+                    else None
+                ),
+            ),
+        )
 
         # draw and show figure
         if fig_chrono is None:
             st.markdown("_No measurements stored yet._")
         else:
-            st.plotly_chart(
-                fig_chrono,
-                use_container_width=True,
-                config={"displayModeBar": False},
-                key="fig_chrono",
-            )
+            ut.chart(fig_chrono, "fig_chrono")
 
         # add selectbox for figure styling
         st.divider()
@@ -53,74 +116,128 @@ fragment_main_figure()
 ut.h_spacer(1)
 st.subheader("trend & predict")
 
-# create trend figure and get trend
-fig_trend, trend = fgs.trend()
-
-with st.container(border=True):
-    if fig_trend is None:
-        st.markdown("_No, or not enough, measurements stored yet._")
-    else:
-        # show current change rate of weight
-        c1, c2, c3 = st.columns([3, 2, 2])
-        c1.markdown(
-            "**$\Delta$kg {txt}:**".format(
-                txt=(
-                    "since {date}".format(
-                        date=st.session_state.trend_start.date().strftime("%d.%m.%Y")
-                    )
-                    if st.session_state.trend_how == "start date"
-                    else "in last {weeks} weeks".format(
-                        weeks=st.session_state.trend_range
+
+# create fragment 4 trend, changing trend options only reruns this card
+@st.fragment()
+def fragment_trend():
+    # create trend figure and get trend, needs measurements on two days at least
+    fig_trend = None
+    if db_daily.shape[0] > 1:
+        fig_trend, model = fgs.trend_card(
+            st.session_state.user_name,
+            st.session_state.db_version,
+            st.session_state.daily_how,
+            st.session_state.outlier_how,
+            (
+                st.session_state.smooth_how
+                if st.session_state.trend_input == "smoothed"
+                else "off"
+            ),
+            st.session_state.trend_how,
+            st.session_state.trend_start,
+            st.session_state.trend_range,
+            st.session_state.user_kg,
+        )
+
+    with st.container(border=True):
+        if fig_trend is None:
+            st.markdown("_No, or not enough, measurements stored yet._")
+        else:
+            # show current change rate of weight
+            c1, c2, c3 = st.columns([3, 2, 2])
+            c1.markdown(
+                "**$\Delta$kg {txt}:**".format(
+                    txt=(
+                        "since {date}".format(
+                            date=pd.Timestamp(st.session_state.trend_start).strftime(
+                                "%d.%m.%Y"
+                            )
+                        )
+                        if st.session_state.trend_how == "start date"
+                        else "in last {weeks} weeks".format(
+                            weeks=st.session_state.trend_range
+                        )
                     )
                 )
             )
-        )
-        c2.markdown(f"_{round(trend*10**9*60*60*24*7, 2)} kg/week_")
-        c3.markdown(f"_{round(trend*10**9*60*60*24*30, 2)} kg/month_")
-
-        # draw and show trend
-        st.plotly_chart(
-            fig_trend,
-            use_container_width=True,
-            config={"displayModeBar": False},
-            key="fig_trend",
-        )
+            c2.markdown(f"_{round(model['slope'] * 7, 2)} kg/week_")
+            c3.markdown(f"_{round(model['slope'] * 30, 2)} kg/month_")
 
-    # add columns for figure options
-    st.divider()
-    col_trend = st.columns(2, gap="small")
+            # draw and show trend
+            ut.chart(fig_trend, "fig_trend")
 
-    # radio button to select how to define starting point
-    with col_trend[0]:
-        st.segmented_control(
-            "trend based on:",
-            options=["start date", "date range"],
-            key="trend_how",
-            on_change=user.update_trend,
-        )
+            # rates of several windows side by side
+            with st.expander("rates of other windows"):
+                st.dataframe(
+                    fgs.trend_summary(
+                        st.session_state.user_name,
+                        st.session_state.db_version,
+                        st.session_state.daily_how,
+                        st.session_state.outlier_how,
+                        (
+                            st.session_state.smooth_how
+                            if st.session_state.trend_input == "smoothed"
+                            else "off"
+                        ),
+                        st.session_state.trend_start,
+                    ),
+                    hide_index=True,
+                    use_container_width=True,
+                    column_config={
+                        "since": st.column_config.DateColumn(format="DD.MM.YYYY")
+                    },
+                )
 
-    # select _start date_
-    with col_trend[1]:
-        if st.session_state.trend_how == "start date":
-            st.date_input(
-                "select 'start date':",
-                format="DD.MM.YYYY",
-                key="trend_start",
+        # add columns for figure options
+        st.divider()
+        col_trend = st.columns(3, gap="small")
+
+        # radio button to select how to define starting point
+        with col_trend[0]:
+            st.segmented_control(
+                "trend based on:",
+                options=["start date", "date range"],
+                key="trend_how",
                 on_change=user.update_trend,
             )
 
-        # select _date range_
-        if st.session_state.trend_how == "date range":
-            st.number_input(
-                "select 'range' - in weeks:",
-                format="%d",
-                min_value=1,
-                max_value=100,
-                step=1,
-                key="trend_range",
-                on_change=user.update_trend,
+        # select _start date_
+        with col_trend[1]:
+            if st.session_state.trend_how == "start date":
+                st.date_input(
+                    "select 'start date':",
+                    format="DD.MM.YYYY",
+                    key="trend_start",
+                    on_change=user.update_trend,
+                )
+
+            # select _date range_
+            if st.session_state.trend_how == "date range":
+                st.number_input(
+                    "select 'range' - in weeks:",
+                    format="%d",
+                    min_value=1,
+                    max_value=100,
+                    step=1,
+                    key="trend_range",
+                    on_change=user.update_trend,
+                )
+
+        # select input of trend, smoothed weights need smoothing turned on
+        with col_trend[2]:
+            st.segmented_control(
+                "trend input:",
+                options=["weight", "smoothed"],
+                key="trend_input",
+                disabled=st.session_state.smooth_how == "off",
+                on_change=ut.keep_selected,
+                args=("trend_input", "weight"),
             )
 
+
+# run trend fragment
+fragment_trend()
+
 # ----- body composition figure -----
 ut.h_spacer(1)
 st.subheader("body composition")
@@ -130,18 +247,32 @@ st.subheader("body composition")
 @st.fragment()
 def fragemnt_body_comp_figure():
     with st.container(border=True):
-        # draw figure
-        fig_body_comp = fgs.body_comp()
+        # draw figure, or take the one kept of this user
+        fig_body_comp = recent.get(
+            st.session_state.user_name,
+            st.session_state.db_version,
+            (
+                "fig_body_comp",
+                st.session_state.daily_how,
+                st.session_state.outlier_how,
+                st.session_state.user_kg,
+                st.session_state.fig_body_comp_type,
+                st.session_state.fig_body_comp_style,
+                st.session_state.fig_body_comp_weight,
+            ),
+            lambda: fgs.body_comp(
+                db_daily,
+                st.session_state.user_kg,
+                st.session_state.fig_body_comp_type,
+                st.session_state.fig_body_comp_style,
+                st.session_state.fig_body_comp_weight == "weight & target",
+            ),
+        )
 
         if fig_body_comp is None:
             st.markdown("_No measurements stored yet._")
         else:
-            st.plotly_chart(
-                fig_body_comp,
-                use_container_width=True,
-                config={"displayModeBar": False},
-                key="fig_body_comp",
-            )
+            ut.chart(fig_body_comp, "fig_body_comp")
 
         # add columns for figure options
         st.divider()
@@ -172,3 +303,27 @@ def fragemnt_body_comp_figure():
 
 # run body comp figure fragment_main_figure
 fragemnt_body_comp_figure()
+
+# ----- weekday & seasonal figure, left out in kiosk mode -----
+if not kiosk.ENABLED:
+    ut.h_spacer(1)
+    st.subheader("weekday & season")
+
+    with st.container(border=True):
+        fig_seasonal = (
+            fgs.seasonal(
+                fgs.decomposition(
+                    st.session_state.user_name,
+                    st.session_state.db_version,
+                    st.session_state.daily_how,
+                    st.session_state.outlier_how,
+                )
+            )
+            if db_daily.shape[0] > 0
+            else None
+        )
+
+        if fig_seasonal is None:
+            st.markdown("_No, or not enough, measurements stored yet._")
+        else:
+            ut.chart(fig_seasonal, "fig_seasonal")
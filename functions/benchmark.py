@@ -0,0 +1,240 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger("OnTheScales.benchmark")
+
+# root of the app, its modules are imported from here by the measured processes
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# render settings of the app's defaults, with the heaviest smoothing
+SETTINGS = {"daily_how": "first", "outlier": "highlight", "smooth": "kalman"}
+
+
+def household(folder: str, users: int, years: int, seed: int = 0) -> None:
+    """
+    Writes a synthetic household to folder/data: users.csv and one .csv per user with one to three measurements a day
+
+    Args:
+        folder (str): directory to write to
+        users (int): number of users
+        years (int): years of measurements per user
+        seed (int): seed of random numbers
+
+    Returns:
+        None
+    """
+
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.join(folder, "data"), exist_ok=True)
+    end = pd.Timestamp.now().normalize()
+    days = pd.date_range(end=end, periods=years * 365, freq="D")
+
+    rows = []
+    for i in range(users):
+        name = f"user{i}"
+        per_day = rng.integers(1, 4, days.shape[0])
+        dates = (
+            np.repeat(days.values, per_day)
+            + pd.to_timedelta(
+                rng.integers(6 * 3600, 22 * 3600, per_day.sum()), unit="s"
+            ).values
+        )
+        n = dates.shape[0]
+        weight = 85 + np.cumsum(rng.normal(-0.002, 0.05, n)) + rng.normal(0, 0.4, n)
+        pd.DataFrame(
+            {
+                "date": pd.DatetimeIndex(dates).strftime("%Y-%m-%dT%H:%M:%S"),
+                "weight": weight.round(1),
+                "fat": (25 + rng.normal(0, 0.5, n)).round(1),
+                "water": (50 + rng.normal(0, 0.5, n)).round(1),
+                "muscle": (35 + rng.normal(0, 0.5, n)).round(1),
+            }
+        ).to_csv(os.path.join(folder, "data", name + ".csv"), index=False)
+        rows.append([name, 180, 75.0, "date range", days[0].date().isoformat(), 12])
+
+    pd.DataFrame(
+        rows,
+        columns=["name", "height", "target", "trend_how", "trend_start", "trend_range"],
+    ).to_csv(os.path.join(folder, "data", "users.csv"), index=False)
+
+
+def measure(passes: int = 2) -> dict:
+    """
+    Renders the dashboard of every user in turn, as the app does on switching users, in the current process and directory
+
+    The first pass reads every user from disk, later passes switch between recently used users.
+
+    Args:
+        passes (int): number of passes over all users
+
+    Returns:
+        dict: "kiosk" mode, render times in ms of "first" and "later" passes, mean "points" and "payload" in bytes of a user's charts, and "memory_mb" and "peak_mb" of the process
+    """
+
+    import plotly.io as pio
+    import streamlit.logger as st_logger
+    import functions.user as user
+    import functions.data as data
+    import functions.figures as fgs
+    import functions.smoothing as smoothing
+    import functions.kiosk as kiosk
+    import functions.recent as recent
+
+    # quiet bare-mode warnings of streamlit, there is no session
+    st_logger.set_log_level("error")
+
+    users = user.load_db().to_dict("records")
+    times = {"first": [], "later": []}
+    points, payload = [], []
+    for i in range(passes):
+        for usr in users:
+            t0 = time.perf_counter()
+            name = usr["name"]
+            data.load_db(name)
+            version = data.version(name)
+            daily = data.recent_daily(
+                name, version, SETTINGS["daily_how"], SETTINGS["outlier"]
+            )
+            smoothed = smoothing.smoothed(name, version, *SETTINGS.values())
+            fig_trend, _ = fgs.trend_card(
+                name,
+                version,
+                *SETTINGS.values(),
+                usr["trend_how"],
+                usr["trend_start"],
+                usr["trend_range"],
+                usr["target"],
+            )
+            figs = [
+                fig_trend,
+                recent.get(
+                    name,
+                    version,
+                    "fig_chrono",
+                    lambda: fgs.main(daily, usr["target"], "both", smoothed),
+                ),
+                recent.get(
+                    name,
+                    version,
+                    "fig_body_comp",
+                    lambda: fgs.body_comp(daily, usr["target"], "%", "lines", False),
+                ),
+            ]
+            figs = [fig for fig in figs if fig is not None]
+            sent = [pio.to_json(fig, validate=False) for fig in figs]
+            times["first" if i == 0 else "later"].append(
+                (time.perf_counter() - t0) * 1000
+            )
+            points.append(
+                sum(len(t.x) for fig in figs for t in fig.data if t.x is not None)
+            )
+            payload.append(sum(len(s) for s in sent))
+
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "kiosk": kiosk.ENABLED,
+        "first": times["first"],
+        "later": times["later"],
+        "points": float(np.mean(points)),
+        "payload": float(np.mean(payload)),
+        "memory_mb": kiosk.memory_mb(),
+        "peak_mb": peak / 2**20 if sys.platform == "darwin" else peak / 2**10,
+    }
+
+
+def run(folder: str, kiosk: bool, memory_mb: int) -> dict:
+    """
+    Measures one mode in a fresh process, so imports and caches of other runs do not count
+
+    Args:
+        folder (str): directory of the household, see household()
+        kiosk (bool): measure kiosk mode
+        memory_mb (int): memory ceiling of kiosk mode, see kiosk.MEMORY_MB
+
+    Returns:
+        dict: results, see measure()
+    """
+
+    env = {
+        **os.environ,
+        "ONTHESCALES_KIOSK": "1" if kiosk else "0",
+        "ONTHESCALES_MEMORY_MB": str(memory_mb),
+        "PYTHONPATH": os.pathsep.join([ROOT, os.environ.get("PYTHONPATH", "")]),
+    }
+    out = subprocess.run(
+        [sys.executable, "-m", "functions.benchmark", "--measure"],
+        cwd=folder,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(out.stdout.splitlines()[-1])
+
+
+if __name__ == "__main__":
+    # usage: python -m functions.benchmark [--users 4] [--years 5] [--memory-mb 300] [--latency-ms 1000]
+    parser = argparse.ArgumentParser(
+        prog="python -m functions.benchmark",
+        description="Compares memory and render latency of normal and kiosk mode on a synthetic household, fails if kiosk mode misses its targets.",
+    )
+    parser.add_argument("--users", type=int, default=4, help="number of users")
+    parser.add_argument("--years", type=int, default=5, help="years of data per user")
+    parser.add_argument(
+        "--memory-mb", type=int, default=300, help="memory ceiling of kiosk mode"
+    )
+    parser.add_argument(
+        "--latency-ms",
+        type=float,
+        default=1000,
+        help="slowest render of a user allowed in kiosk mode",
+    )
+    parser.add_argument("--measure", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure()))
+        sys.exit(0)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
+    with tempfile.TemporaryDirectory() as folder:
+        household(folder, args.users, args.years)
+        results = {
+            mode: run(folder, mode == "kiosk", args.memory_mb)
+            for mode in ["normal", "kiosk"]
+        }
+
+    for mode, r in results.items():
+        log.info(
+            "%s: render first %.0f ms (max %.0f), switch %.0f ms (max %.0f), "
+            "%.0f points, %.0f kB of charts per user, memory %.0f MB (peak %.0f MB)",
+            mode,
+            np.median(r["first"]),
+            max(r["first"]),
+            np.median(r["later"]),
+            max(r["later"]),
+            r["points"],
+            r["payload"] / 1024,
+            r["memory_mb"],
+            r["peak_mb"],
+        )
+
+    kiosk = results["kiosk"]
+    missed = []
+    if kiosk["peak_mb"] > args.memory_mb:
+        missed.append(f"peak memory {kiosk['peak_mb']:.0f} MB > {args.memory_mb} MB")
+    if max(kiosk["first"]) > args.latency_ms:
+        missed.append(f"render {max(kiosk['first']):.0f} ms > {args.latency_ms:.0f} ms")
+    for m in missed:
+        log.error("kiosk mode missed target: %s", m)
+    sys.exit(1 if missed else 0)
@@ -0,0 +1,189 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+import streamlit as st
+from datetime import datetime, time
+import functions.writer as writer
+
+# summary of each user's measurements, in a sub-directory, so no user's .csv file can take its place
+PATH = os.path.join("data", "catalog", "catalog.csv")
+COLUMNS = ["name", "count", "first", "last", "weight", "trend"]
+
+# data version each row was summarized from, saved with the rows, see data.version(); the recorded version of data saved by the app stays the same after a restart
+VERSION = "version"
+
+
+def summarize(
+    name: str, db: pd.DataFrame, how: str, start: datetime, weeks: int
+) -> dict:
+    """
+    Summarizes the measurements of a user: count, first/last date, latest weight and current trend
+
+    Args:
+        name (str): name of user
+        db (pd.DataFrame): user's measurements, sorted by date
+        how (str): how the trend window is defined, "start date" | "date range"
+        start (datetime): start date of trend window, used if how is "start date"
+        weeks (int): length of trend window in weeks, used if how is "date range"
+
+    Returns:
+        dict: one row of the catalog
+    """
+
+    if db.shape[0] == 0:
+        return dict(
+            name=name, count=0, first=pd.NaT, last=pd.NaT, weight=np.nan, trend=np.nan
+        )
+
+    # trend window, as on the graphs page
+    dates = db["date"].values
+    if how == "start date":
+        first = np.datetime64(
+            datetime.combine(pd.Timestamp(start).date(), time(0, 0, 0))
+        )
+    else:
+        first = dates[-1] - np.timedelta64(int(weeks) * 7, "D")
+    in_window = dates >= first
+
+    # slope of linear fit, in kg/week
+    trend = np.nan
+    if in_window.sum() > 1:
+        x = dates[in_window].astype("datetime64[ns]").astype(np.int64) / (
+            7 * 24 * 3600 * 10**9
+        )
+        trend = round(np.polyfit(x - x[0], db["weight"].values[in_window], 1)[0], 2)
+
+    return dict(
+        name=name,
+        count=db.shape[0],
+        first=db["date"].iloc[0],
+        last=db["date"].iloc[-1],
+        weight=db["weight"].iloc[-1],
+        trend=trend,
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def _catalog() -> dict:
+    """
+    Loads the saved catalog once per process, shared by all sessions. Rows are revalidated against the users' data on every load(), see there.
+
+    Returns:
+        dict: {"lock": threading.Lock, "rows": dict of catalog rows by user name}
+    """
+
+    rows = {}
+    if os.path.exists(PATH):
+        db = pd.read_csv(PATH, parse_dates=["first", "last"])
+        if VERSION in db.columns:
+            rows = {row["name"]: row for row in db.to_dict("records")}
+
+    return {"lock": threading.Lock(), "rows": rows}
+
+
+def _save(rows: dict) -> None:
+    """
+    Saves catalog rows in background, must be called with the lock held
+    """
+
+    os.makedirs(os.path.dirname(PATH), exist_ok=True)
+    writer.save(PATH, pd.DataFrame(list(rows.values()), columns=[*COLUMNS, VERSION]))
+
+
+def load() -> pd.DataFrame:
+    """
+    Returns the catalog of all users
+
+    Each row is checked against the user's data version, which survives restarts, see data.version(). Rows of users whose data changed outside the app, e.g. by a sync or manual edit, or who are missing are summarized afresh, rows of removed users dropped.
+
+    Returns:
+        pd.DataFrame: one row per user, see COLUMNS
+    """
+
+    # both import this module
+    import functions.data as data
+    import functions.user as user
+
+    users = user.load_db()
+    catalog = _catalog()
+    with catalog["lock"]:
+        kept = dict(catalog["rows"])
+
+    fresh = {}
+    for usr in users.to_dict("records"):
+        version = data.version(usr["name"])
+        row = kept.get(usr["name"])
+        if row is not None and row[VERSION] == version:
+            continue
+        row = summarize(
+            usr["name"],
+            data.read_db(usr["name"], version),
+            usr["trend_how"],
+            usr["trend_start"],
+            usr["trend_range"],
+        )
+        fresh[usr["name"]] = {**row, VERSION: version}
+
+    removed = set(kept) - set(users["name"])
+    with catalog["lock"]:
+        if fresh or removed:
+            catalog["rows"].update(fresh)
+            for name in removed:
+                catalog["rows"].pop(name, None)
+            _save(catalog["rows"])
+        rows = [catalog["rows"][name] for name in users["name"]]
+
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+
+def update(
+    name: str,
+    db: pd.DataFrame,
+    how: str,
+    start: datetime,
+    weeks: int,
+    version: int | None = None,
+) -> None:
+    """
+    Updates the catalog row of a single user, from the user's measurements already in memory, and saves catalog in background
+
+    Args:
+        name (str): name of user
+        db (pd.DataFrame): user's measurements, sorted by date
+        how (str): how the trend window is defined, "start date" | "date range"
+        start (datetime): start date of trend window, used if how is "start date"
+        weeks (int): length of trend window in weeks, used if how is "date range"
+        version (int|None): data version of db, defaults to the user's current one, see data.version()
+
+    Returns:
+        None
+    """
+
+    if version is None:
+        import functions.data as data
+
+        version = data.version(name)
+    row = {**summarize(name, db, how, start, weeks), VERSION: version}
+
+    catalog = _catalog()
+    with catalog["lock"]:
+        catalog["rows"][name] = row
+        _save(catalog["rows"])
+
+
+def remove(name: str) -> None:
+    """
+    Removes a user from the catalog and saves catalog in background
+
+    Args:
+        name (str): name of user
+
+    Returns:
+        None
+    """
+
+    catalog = _catalog()
+    with catalog["lock"]:
+        catalog["rows"].pop(name, None)
+        _save(catalog["rows"])
@@ -0,0 +1,213 @@
+import os
+import sys
+import pickle
+import threading
+import subprocess
+import multiprocessing
+import numpy as np
+import pandas as pd
+import streamlit as st
+from concurrent.futures import ProcessPoolExecutor
+import functions.data as data
+import functions.writer as writer
+import functions.schema as schema
+import functions.kiosk as kiosk
+
+# columns of the per-user summary
+COLUMNS = [
+    "name",
+    "start",
+    "weight",
+    "change",
+    "change_pct",
+    "rate",
+    "target",
+    "progress",
+]
+
+# .csv data of all stale users above which they are prepared in a process pool: starting the helper takes about half a second, preparing takes about 10 ms per MB
+PARALLEL_BYTES = 64 * 2**20
+
+
+def prepare(path: str, target: float) -> tuple[pd.DataFrame, dict]:
+    """
+    Aligns the history of one user for comparison: weekly weights and change since the first measurement
+
+    Runs in a worker process of prepare_all(), so it only depends on the .csv file, not on the app's caches.
+
+    Args:
+        path (str): path of user's .csv file
+        target (float): target weight of user
+
+    Returns:
+        tuple[pd.DataFrame, dict]: weekly series with "week" since start, "date", "weight", "change" in kg, "change_pct" and "rate" in kg/week, and summary row, see COLUMNS
+    """
+
+    db = schema.load(path, schema.MEASUREMENTS)
+    if "outlier" in db.columns:
+        db = db[~db["outlier"].fillna(False).astype(bool)]
+    db = db.sort_values(by="date", ignore_index=True)
+
+    if db.shape[0] == 0:
+        return (
+            pd.DataFrame(
+                columns=["week", "date", "weight", "change", "change_pct", "rate"]
+            ),
+            {},
+        )
+
+    # weekly mean, aligned to week of first measurement
+    first = db["date"].iloc[0].normalize()
+    week = (db["date"] - first).dt.days // 7
+    weekly = db.groupby(week)["weight"].mean().rename_axis("week").reset_index()
+    weekly["date"] = first + pd.to_timedelta(weekly["week"] * 7, unit="D")
+
+    # change since start, and rate between weeks with measurements
+    start = weekly["weight"].iloc[0]
+    weekly["change"] = (weekly["weight"] - start).round(2)
+    weekly["change_pct"] = (100 * weekly["change"] / start).round(2)
+    weekly["rate"] = (weekly["weight"].diff() / weekly["week"].diff()).round(2)
+
+    # rate of last 4 weeks, by linear fit
+    recent = weekly[weekly["week"] >= weekly["week"].iloc[-1] - 4]
+    rate = (
+        np.polyfit(recent["week"], recent["weight"], 1)[0]
+        if recent.shape[0] > 1
+        else np.nan
+    )
+
+    current = db["weight"].iloc[-1]
+    summary = dict(
+        start=first,
+        weight=current,
+        change=round(current - db["weight"].iloc[0], 1),
+        change_pct=round(
+            100 * (current - db["weight"].iloc[0]) / db["weight"].iloc[0], 1
+        ),
+        rate=round(rate, 2),
+        target=target,
+        progress=(
+            round(
+                100
+                * (db["weight"].iloc[0] - current)
+                / (db["weight"].iloc[0] - target),
+                1,
+            )
+            if db["weight"].iloc[0] != target
+            else 100.0
+        ),
+    )
+
+    return weekly[["week", "date", "weight", "change", "change_pct", "rate"]], summary
+
+
+def prepare_all(jobs: dict) -> dict:
+    """
+    Prepares several users in a process pool of a helper process, see prepare()
+
+    The pool is not started within the app: forked workers would inherit locks held by the app's threads at the time, e.g. of logging, and spawned ones would re-run the page script, which streamlit registers as main module. The helper is a fresh interpreter running this module, its workers only read .csv files.
+
+    Args:
+        jobs (dict): (path of .csv file, target) by user name
+
+    Returns:
+        dict: result of prepare() by user name
+    """
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run(
+        [sys.executable, "-m", "functions.cohort"],
+        input=pickle.dumps(jobs),
+        stdout=subprocess.PIPE,
+        env={
+            **os.environ,
+            "PYTHONPATH": os.pathsep.join([root, os.environ.get("PYTHONPATH", "")]),
+        },
+        check=True,
+    )
+    return pickle.loads(out.stdout)
+
+
+@st.cache_resource(show_spinner=False)
+def _results() -> dict:
+    """
+    Prepared histories of all users, shared by all sessions
+
+    Returns:
+        dict: {"lock": threading.Lock, "users": dict of (data version, target, weekly, summary) by user name}
+    """
+
+    return {"lock": threading.Lock(), "users": {}}
+
+
+def load(users: pd.DataFrame) -> tuple[dict, pd.DataFrame]:
+    """
+    Returns the aligned histories of all users, preparing only those whose data or target changed
+
+    Several users with more than PARALLEL_BYTES of data are prepared in parallel in a process pool, see prepare_all(), fewer data, or all in kiosk mode, right away.
+
+    Args:
+        users (pd.DataFrame): user database, see user.load_db()
+
+    Returns:
+        tuple[dict, pd.DataFrame]: weekly series by user name, and one summary row per user, see COLUMNS
+    """
+
+    # data of other processes is read from disk, so pending writes go first
+    writer.flush()
+
+    results = _results()
+    with results["lock"]:
+        kept = dict(results["users"])
+
+    # users to be prepared
+    stale = {}
+    for usr in users.to_dict("records"):
+        version = data.version(usr["name"])
+        prev = kept.get(usr["name"])
+        if prev is None or prev[0] != version or prev[1] != usr["target"]:
+            stale[usr["name"]] = (version, usr["target"])
+
+    jobs = {
+        name: (os.path.join("data", name + ".csv"), target)
+        for name, (_, target) in stale.items()
+    }
+    size = sum(
+        os.path.getsize(path) for path, _ in jobs.values() if os.path.isfile(path)
+    )
+    # no worker processes in kiosk mode, each would hold its own copy of the libraries
+    if len(jobs) > 1 and size > PARALLEL_BYTES and not kiosk.ENABLED:
+        prepared = prepare_all(jobs)
+    else:
+        prepared = {name: prepare(*job) for name, job in jobs.items()}
+
+    with results["lock"]:
+        for name, (weekly, summary) in prepared.items():
+            results["users"][name] = (*stale[name], weekly, summary)
+        # drop deleted users
+        for name in set(results["users"]) - set(users["name"]):
+            del results["users"][name]
+        kept = dict(results["users"])
+
+    weekly = {name: kept[name][2] for name in users["name"]}
+    summary = pd.DataFrame(
+        [{"name": name, **kept[name][3]} for name in users["name"]], columns=COLUMNS
+    )
+    return weekly, summary
+
+
+if __name__ == "__main__":
+    # helper process of prepare_all(): reads pickled jobs from stdin, writes pickled results to stdout
+    jobs = pickle.load(sys.stdin.buffer)
+
+    # forked workers are safe here, the helper runs no other threads
+    ctx = multiprocessing.get_context(
+        "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+    )
+    with ProcessPoolExecutor(
+        max_workers=min(len(jobs), os.cpu_count() or 1), mp_context=ctx
+    ) as pool:
+        futures = {name: pool.submit(prepare, *job) for name, job in jobs.items()}
+        prepared = {name: future.result() for name, future in futures.items()}
+
+    pickle.dump(prepared, sys.stdout.buffer)
@@ -1,43 +1,340 @@
 import os
+import contextlib
+import functools
+import threading
 import numpy as np
 import pandas as pd
 import streamlit as st
-from datetime import date
+from datetime import date, datetime, time
+from typing import Iterator
+import functions.writer as writer
+import functions.history as history
+import functions.catalog as catalog
+import functions.lookup as lookup
+import functions.schema as schema
+import functions.kiosk as kiosk
+import functions.recent as recent
+import functions.outliers as outliers
+
+try:
+    import fcntl
+except ImportError:
+    # no locks across processes, e.g. on Windows
+    fcntl = None
+
+# lock files serializing the saves of each user across processes, see locked()
+LOCKS = os.path.join("data", "locks")
 
 
 def create_df() -> pd.DataFrame:
     """
-    Generates an empty dataframe with date, weight, fat, water, and muscle metrics
+    Generates an empty dataframe with date, weight, fat, water, and muscle metrics, and outlier flags
 
     Returns:
         pd.DataFrame: empty base dataframe with column structure
     """
 
-    cols = {"date": [], "weight": [], "fat": [], "water": [], "muscle": []}
+    cols = {
+        "date": [],
+        "weight": [],
+        "fat": [],
+        "water": [],
+        "muscle": [],
+        "outlier": [],
+    }
     df = pd.DataFrame(cols)
     return df
 
 
-def load_db() -> pd.DataFrame:
+def version(usr_name: str) -> int:
+    """
+    Returns the data version of a user, i.e. the version recorded in the user's history for data saved by the app, see history.record(), or else the modification time of the user's .csv file, e.g. if changed by other tools
+
+    The recorded version is kept as head of the history once written, so it stays the same after a restart and in other processes, e.g. a sync, see history.head().
+
+    Args:
+        usr_name (str): name of user
+
+    Returns:
+        int: data version, 0 if no file exists
+    """
+
+    path = os.path.join("data", usr_name + ".csv")
+    saved = writer.version(path)
+    if saved is not None:
+        return saved
+
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return 0
+
+    # unchanged since the app last wrote it
+    head = history.head(usr_name)
+    if head is not None and head[1:] == (stat.st_mtime_ns, stat.st_size):
+        return head[0]
+    return stat.st_mtime_ns
+
+
+@st.cache_data(show_spinner=False, max_entries=kiosk.entries(100))
+def read_db(usr_name: str, version: int) -> pd.DataFrame:
+    """
+    Reads user data from .csv file, cached across all sessions per data version
+
+    Args:
+        usr_name (str): name of user
+        version (int): data version of user, see version()
+
+    Returns:
+        pd.DataFrame: user's health metrics data
+    """
+
+    # data not yet written is taken from writer
+    path = os.path.join("data", usr_name + ".csv")
+    queued = writer.pending(path)
+    if queued is not None and queued[0] == version:
+        return queued[1]
+
+    return parse(path)
+
+
+def parse(path: str) -> pd.DataFrame:
+    """
+    Reads user data from a .csv file, without any cache or session, e.g. in worker processes
+
+    Rows with missing or invalid values are quarantined, see schema.load().
+
+    Args:
+        path (str): path of user's .csv file
+
+    Returns:
+        pd.DataFrame: user's health metrics data, sorted by date and with outlier flags, empty if there is no file
+    """
+
+    # e.g. a user added by a sync before any measurement
+    if not os.path.exists(path):
+        return create_df()
+
+    # typed, dates with and without time may be mixed, e.g. if appended by other tools
+    db = schema.load(path, schema.MEASUREMENTS)
+
+    # keep sorted by date, lookups rely on it
+    db = db.sort_values(by="date", ignore_index=True)
+
+    # flag outliers of files written without, or imported rows
+    if "outlier" not in db.columns or db["outlier"].isna().any():
+        db["outlier"], _ = outliers.scan(db)
+    db["outlier"] = db["outlier"].astype(bool)
+
+    return db
+
+
+def load_db(usr_name: str | None = None) -> pd.DataFrame:
     """
-    Loads current user data from .csv file and returns as pandas dataframe
+    Loads user data from the recently used users, or shared cache, or .csv file if changed, and returns as pandas dataframe
+
+    Args:
+        usr_name (str|None): name of user, defaults to current user
 
     Returns:
         pd.DataFrame: user's health metrics data
     """
 
-    usr_name = st.session_state.user_name
-    db = pd.read_csv(os.path.join("data", usr_name + ".csv"))
-    db["date"] = pd.to_datetime(db["date"])
+    # for current user, remember loaded version to detect changes by other sessions
+    if usr_name is None:
+        usr_name = st.session_state.user_name
+        st.session_state.db_version = version(usr_name)
+        current = st.session_state.db_version
+    else:
+        current = version(usr_name)
+
+    shared = recent.get(usr_name, current, "db", lambda: read_db(usr_name, current))
+
+    # loaded data of current user, changes of the session are saved relative to it, see save()
+    if usr_name == st.session_state.get("user_name"):
+        st.session_state.db_base = shared
+
+    # own copy, sessions change their data in place
+    return shared.copy()
+
+
+@st.cache_resource(show_spinner=False, max_entries=kiosk.entries(20))
+def sorted_desc(usr_name: str, version: int) -> pd.DataFrame:
+    """
+    Returns user data sorted by date in descending order, cached across all sessions per data version
+
+    The returned dataframe is shared, it must not be changed.
+
+    Args:
+        usr_name (str): name of user
+        version (int): data version of user, see version()
+
+    Returns:
+        pd.DataFrame: user's health metrics data, newest first
+    """
+
+    return read_db(usr_name, version).iloc[::-1].reset_index(drop=True)
+
+
+@st.cache_data(show_spinner=False, max_entries=kiosk.entries(20))
+def as_of(usr_name: str, version: int) -> pd.DataFrame:
+    """
+    Returns user data as it was at a recorded version, cached across all sessions
+
+    Args:
+        usr_name (str): name of user
+        version (int): recorded version, see history.log()
+
+    Returns:
+        pd.DataFrame: user's health metrics data of that version, with outlier flags
+    """
+
+    db = history.replay(usr_name, version)
+    db["outlier"], _ = outliers.scan(db)
     return db
 
 
-def add_update(date: date, wgt: float, fat: float, h2o: float, msc: float) -> None:
+@st.cache_data(show_spinner=False, max_entries=kiosk.entries(100))
+def daily(
+    usr_name: str, version: int, how: str = "first", outlier: str = "highlight"
+) -> pd.DataFrame:
+    """
+    Returns user data with one row per day, cached across all sessions per data version and aggregation
+
+    Args:
+        usr_name (str): name of user
+        version (int): data version of user, see version()
+        how (str): value of days with several measurements, "first" | "mean" | "min", where "min" takes the measurement of least weight
+        outlier (str): "highlight" keeps flagged measurements, a day is flagged if any of its measurements is, "exclude" drops them
+
+    Returns:
+        pd.DataFrame: user's health metrics data, dates without time
+    """
+
+    return aggregate(read_db(usr_name, version), how, outlier)
+
+
+def recent_daily(
+    usr_name: str, version: int, how: str = "first", outlier: str = "highlight"
+) -> pd.DataFrame:
+    """
+    Returns user data with one row per day, kept with the recently used users, see recent.get(), so switching back to a user does not copy the shared cache entry
+
+    Args:
+        usr_name (str): name of user
+        version (int): data version of user, see version()
+        how (str): value of days with several measurements, see daily()
+        outlier (str): handling of outliers, see daily()
+
+    Returns:
+        pd.DataFrame: daily data, shared and must not be changed
+    """
+
+    return recent.get(
+        usr_name,
+        version,
+        ("daily", how, outlier),
+        lambda: daily(usr_name, version, how, outlier),
+    )
+
+
+def aggregate(
+    db: pd.DataFrame, how: str = "first", outlier: str = "highlight"
+) -> pd.DataFrame:
+    """
+    Reduces user data to one row per day, see daily()
+
+    Args:
+        db (pd.DataFrame): user data, sorted by date
+        how (str): value of days with several measurements, "first" | "mean" | "min"
+        outlier (str): "highlight" | "exclude", handling of flagged measurements
+
+    Returns:
+        pd.DataFrame: user's health metrics data, dates without time
+    """
+
+    if outlier == "exclude":
+        db = db[~db["outlier"]].reset_index(drop=True)
+    day = db["date"].dt.normalize()
+
+    # nothing to aggregate if one measurement per day
+    if day.is_unique:
+        return db.assign(date=day)
+
+    flags = db["outlier"].groupby(day).any()
+    if how == "mean":
+        out = db.drop(columns=["date", "outlier"]).groupby(day).mean().round(1)
+    elif how == "min":
+        out = db.loc[db["weight"].groupby(day).idxmin().values].drop(columns="date")
+        out.index = day.unique()
+    else:
+        out = db[~day.duplicated()].drop(columns="date")
+        out.index = day.unique()
+
+    out = out.assign(outlier=flags.values).rename_axis("date").reset_index()
+    return out[["date", "weight", "fat", "water", "muscle", "outlier"]]
+
+
+def search(
+    db: pd.DataFrame,
+    start: date | None = None,
+    end: date | None = None,
+    metric: str | None = None,
+    lo: float | None = None,
+    hi: float | None = None,
+) -> np.ndarray:
     """
-    Adds a new entry with health metrics to user database or updates existing record
+    Finds rows of a date-descending dataframe within a date range and metric thresholds
+
+    The date range is found by binary search, thresholds are only checked within that range.
 
     Args:
-        date (date): date of entry
+        db (pd.DataFrame): user data, newest first, see sorted_desc()
+        start (date|None): first date to include, defaults to all
+        end (date|None): last date to include, defaults to all
+        metric (str|None): column checked against thresholds, defaults to none
+        lo (float|None): lower threshold of metric (incl.), defaults to none
+        hi (float|None): upper threshold of metric (incl.), defaults to none
+
+    Returns:
+        np.ndarray: positions of matching rows in db, newest first
+    """
+
+    n = db.shape[0]
+    if n == 0:
+        return np.arange(0)
+
+    # date range, as [a, b) in ascending order -> [n-b, n-a) in descending order
+    dates = db["date"].values[::-1]
+    a = 0 if start is None else np.searchsorted(dates, np.datetime64(start), "left")
+    b = (
+        n
+        if end is None
+        else np.searchsorted(dates, np.datetime64(end) + np.timedelta64(1, "D"), "left")
+    )
+    rows = np.arange(n - b, n - a)
+
+    # metric thresholds
+    if metric is not None and (lo is not None or hi is not None):
+        values = db[metric].values[n - b : n - a]
+        keep = np.ones(values.shape[0], dtype=bool)
+        if lo is not None:
+            keep &= values >= lo
+        if hi is not None:
+            keep &= values <= hi
+        rows = rows[keep]
+
+    return rows
+
+
+def add_update(when: datetime, wgt: float, fat: float, h2o: float, msc: float) -> None:
+    """
+    Adds a new entry with health metrics to user database or updates the existing record of the same time
+
+    Several measurements per day are kept, as long as they differ in time.
+
+    Args:
+        when (datetime): date and time of entry, seconds are dropped
         wgt (float): weight measurement
         fat (float): body fat percentage
         h2o (float): body water percentage
@@ -47,10 +344,13 @@ def add_update(date: date, wgt: float, fat: float, h2o: float, msc: float) -> No
         None
     """
 
+    when = pd.Timestamp(when).floor("min")
+    detector = None
+
     # new row for date
     new_entry = pd.DataFrame.from_dict(
         {
-            "date": [pd.to_datetime(date)],
+            "date": [when],
             "weight": round(wgt, 1),
             "fat": round(fat, 1),
             "water": round(h2o, 1),
@@ -59,12 +359,13 @@ def add_update(date: date, wgt: float, fat: float, h2o: float, msc: float) -> No
     )
 
     # handle new entry, either update or add it, and set flags
-    if any(st.session_state.db["date"] == pd.to_datetime(date)):
+    pos = lookup.find(st.session_state.db, when)
+    if pos is not None:
         # update previously saved entry
         st.session_state.flags["data_upd"] = True
 
-        # find indes of entry to update
-        idx_date = (st.session_state.db["date"] == pd.to_datetime(date)).idxmax()
+        # find index of entry to update
+        idx_date = st.session_state.db.index[pos]
 
         # update entry
         st.session_state.db.loc[idx_date, "weight"] = round(wgt, 1)
@@ -76,6 +377,19 @@ def add_update(date: date, wgt: float, fat: float, h2o: float, msc: float) -> No
         # add new entry
         st.session_state.flags["data_add"] = True
 
+        # score entry in O(1) if it is the latest, else the history is rescanned on saving
+        if (
+            st.session_state.db.shape[0] == 0
+            or when > st.session_state.db["date"].iloc[-1]
+        ):
+            detector = outliers.state(
+                st.session_state.user_name,
+                st.session_state.db_version,
+                st.session_state.db,
+            )
+            new_entry["outlier"] = outliers.update(detector, new_entry.iloc[0])
+            st.session_state.flags["data_outlier"] = bool(new_entry["outlier"].iloc[0])
+
         if st.session_state.db.shape[0] == 0:
             # if data_db is empty
             st.session_state.db = new_entry
@@ -86,44 +400,401 @@ def add_update(date: date, wgt: float, fat: float, h2o: float, msc: float) -> No
             )
 
     # sort & save db
+    save_db(detector)
+
+
+def entry_now() -> None:
+    """
+    Sets date and time of the measurement form to now, so a new measurement is added, unless the user picked them
+
+    Runs on every run of the page, so a page kept open does not go stale, e.g. across midnight.
+
+    Returns:
+        None
+    """
+
+    if not st.session_state.get("entry_picked", False):
+        now = datetime.now().replace(second=0, microsecond=0)
+        st.session_state.entry_date = now.date()
+        st.session_state.entry_time = now.time()
+
+
+def entry_pick(saved: bool = False) -> None:
+    """
+    Keeps the date and time of the measurement form once the user changed them, or picked a saved measurement, whose time is taken then
+
+    Args:
+        saved (bool): whether a saved measurement was picked
+
+    Returns:
+        None
+    """
+
+    st.session_state.entry_picked = True
+    if saved and st.session_state.entry_saved is not None:
+        st.session_state.entry_time = st.session_state.entry_saved
+
+
+def entry_saved(day: date) -> list[time]:
+    """
+    Returns the times of the measurements saved on a given day, to pick one for updating
+
+    Args:
+        day (date): day of measurement form
+
+    Returns:
+        list[time]: times of measurements, in order
+    """
+
+    if st.session_state.db.shape[0] == 0:
+        return []
+    first, end = lookup.day_range(st.session_state.db, day)
+    return [d.time() for d in st.session_state.db["date"].iloc[first:end]]
+
+
+def apply_edits(shown: pd.DataFrame, key: str) -> None:
+    """
+    Applies all changes made in the measurements grid to user database as one batch
+
+    Edited, added and deleted rows are taken from the data_editor's state. Only these rows are touched, rows are matched by date and time. Sorting and saving runs once for the whole batch. Added rows overwrite existing entries of the same time, as in add_update(). If an edited date and time is taken by another entry, the whole batch is rejected, so no entry is lost.
+
+    Args:
+        shown (pd.DataFrame): rows shown in the grid, in order of display
+        key (str): key of the data_editor in session_state
+
+    Returns:
+        None
+    """
+
+    edits = st.session_state[key]
+    db = st.session_state.db.copy()
+    cols = ["weight", "fat", "water", "muscle"]
+
+    # rows by date, date and time are unique
+    idx_by_date = pd.Series(db.index, index=db["date"])
+
+    # edited rows
+    for pos, changes in edits["edited_rows"].items():
+        idx = idx_by_date[shown["date"].iloc[int(pos)]]
+        for col, val in changes.items():
+            if col == "date":
+                db.loc[idx, col] = pd.to_datetime(val).floor("min")
+            elif val is not None:
+                db.loc[idx, col] = round(float(val), 1)
+
+    # deleted rows
+    deleted = shown["date"].iloc[edits["deleted_rows"]]
+    db = db.loc[~db["date"].isin(deleted), :]
+
+    # edited dates must not collide with other entries
+    clash = db["date"][db["date"].duplicated()]
+    if clash.shape[0] > 0:
+        st.session_state.flags["data_edit_clash"] = ", ".join(
+            t.strftime("%d.%m.%Y %H:%M") for t in clash.drop_duplicates()
+        )
+        st.session_state.grid_id = st.session_state.get("grid_id", 0) + 1
+        return
+
+    # added rows, only if complete
+    added = pd.DataFrame(
+        [
+            row
+            for row in edits["added_rows"]
+            if all(row.get(c) is not None for c in ["date"] + cols)
+        ],
+        columns=["date"] + cols,
+    )
+    if added.shape[0] > 0:
+        added["date"] = pd.to_datetime(added["date"]).dt.floor("min")
+        added[cols] = added[cols].astype(float).round(1)
+        db = pd.concat([db, added], ignore_index=True) if db.shape[0] > 0 else added
+
+    # one entry per date and time, later rows win
+    st.session_state.db = db.drop_duplicates(subset="date", keep="last")
+
+    # set flag, and reset grid
+    st.session_state.flags["data_edit"] = True
+    st.session_state.grid_id = st.session_state.get("grid_id", 0) + 1
+
+    # sort & save db, once for all changes
     save_db()
 
 
-def delete(date: date) -> None:
+def delete(when: datetime) -> None:
     """
-    Deletes user entry for given date from database file
+    Deletes user entry for given date and time from database file
 
     Args:
-        date (date): date of entry to delete
+        when (datetime): date and time of entry to delete
 
     Returns:
         None
     """
+
+    pos = lookup.find(st.session_state.db, pd.Timestamp(when).floor("min"))
+    if pos is None:
+        return
+
     # set flag
     st.session_state.flags["data_del"] = True
 
-    # find index of entry to delete
-    idx_date = st.session_state.db["date"] == pd.to_datetime(date)
-
     # save all but deleted entry
-    st.session_state.db = st.session_state.db.loc[np.invert(idx_date), :]
+    st.session_state.db = st.session_state.db.drop(index=st.session_state.db.index[pos])
 
     # sort & save db
     save_db()
 
 
-def save_db() -> None:
+def undo(kind: str = "undo") -> None:
     """
-    Sorts user database by date and writes to .csv file
+    Reverts the last change of the current session to the current user's data, or restores the last one it reverted, see history.undoable()
+
+    Args:
+        kind (str): "undo" | "redo"
 
     Returns:
         None
     """
 
-    # sort db
-    st.session_state.db = st.session_state.db.sort_values(by="date", ignore_index=True)
+    undone = history.undoable(
+        st.session_state.user_name, kind, st.session_state.session_id
+    )
+    if undone is None:
+        return
+    target, ops = undone
+
+    # set flag
+    st.session_state.flags["data_" + kind] = True
 
-    # save db to csv
-    st.session_state.db.to_csv(
-        os.path.join("data", st.session_state.user_name + ".csv"), index=False
+    # apply to stored data, it may be newer than the session's
+    current = version(st.session_state.user_name)
+    stored = read_db(st.session_state.user_name, current)
+    st.session_state.db = history.apply(stored, ops)
+    st.session_state.db_base, st.session_state.db_version = stored, current
+
+    # sort & save db
+    save_db(kind=kind, target=target)
+
+
+def save_db(
+    detector: dict | None = None, kind: str = "edit", target: int | None = None
+) -> None:
+    """
+    Saves the user database of the current session, see save()
+
+    Args:
+        detector (dict|None): outlier detector state after the last entry, if the entry was scored on adding. Otherwise all entries are scored again.
+        kind (str): kind of change recorded in history, "edit" | "undo" | "redo"
+        target (int|None): version undone or redone, see history.undoable()
+
+    Returns:
+        None
+    """
+
+    db, st.session_state.db_version = save(
+        st.session_state.user_name,
+        st.session_state.db,
+        st.session_state.trend_how,
+        st.session_state.trend_start,
+        st.session_state.trend_range,
+        detector,
+        kind,
+        (st.session_state.db_version, st.session_state.get("db_base", create_df())),
+        st.session_state.session_id,
+        target,
     )
+
+    # own copy, sessions change their data in place
+    st.session_state.db_base, st.session_state.db = db, db.copy()
+
+
+@st.cache_resource(show_spinner=False)
+def _saving() -> dict:
+    """
+    Locks serializing the saves of each user, shared by all sessions and the ingestion API
+
+    Returns:
+        dict: {"lock": threading.Lock, "users": dict of threading.RLock by user name, "files": dict of {"fd": descriptor of held lock file or None, "version": version handed to the writer} by user name}
+    """
+
+    return {"lock": threading.Lock(), "users": {}, "files": {}}
+
+
+@contextlib.contextmanager
+def locked(usr_name: str) -> Iterator[None]:
+    """
+    Serializes the saves of a user, see save() and merge(), also with other processes, e.g. a sync
+
+    Within the process, a lock per user is held while saving. Across processes, a lock file per user is held from the first save until the writer wrote the data, see _written(), so no other process reads the file while a change is pending.
+
+    Args:
+        usr_name (str): name of user
+
+    Returns:
+        Iterator[None]: context holding the locks
+    """
+
+    saving = _saving()
+    with saving["lock"]:
+        lock = saving["users"].setdefault(usr_name, threading.RLock())
+        held = saving["files"].setdefault(usr_name, {"fd": None, "version": None})
+
+    with lock:
+        if fcntl is not None and held["fd"] is None:
+            os.makedirs(LOCKS, exist_ok=True)
+            fd = os.open(
+                os.path.join(LOCKS, usr_name + ".lock"), os.O_RDWR | os.O_CREAT
+            )
+            # waits while another process saves
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            with saving["lock"]:
+                held["fd"] = fd
+        try:
+            yield
+        finally:
+            # nothing left to write
+            path = os.path.join("data", usr_name + ".csv")
+            with saving["lock"]:
+                if held["fd"] is not None and writer.pending(path) is None:
+                    os.close(held["fd"])
+                    held["fd"] = None
+
+
+def _written(usr_name: str, version: int, mtime: int, size: int) -> None:
+    """
+    Called by the writer once user data is written: keeps the version as head of the history, and lets other processes read the file, see locked()
+
+    Args:
+        usr_name (str): name of user
+        version (int): recorded version of written data
+        mtime (int): modification time of written file in ns
+        size (int): size of written file
+
+    Returns:
+        None
+    """
+
+    history.written(usr_name, version, mtime, size)
+
+    saving = _saving()
+    with saving["lock"]:
+        held = saving["files"].get(usr_name)
+        # unless a newer version is waiting
+        if held is not None and held["fd"] is not None and held["version"] == version:
+            os.close(held["fd"])
+            held["fd"] = None
+
+
+def save(
+    usr_name: str,
+    db: pd.DataFrame,
+    how: str,
+    start: datetime,
+    weeks: int,
+    detector: dict | None = None,
+    kind: str = "edit",
+    base: tuple[int, pd.DataFrame] | None = None,
+    session: str | None = None,
+    target: int | None = None,
+) -> tuple[pd.DataFrame, int]:
+    """
+    Sorts user data by date, records the change in the user's history and hands the data to the background writer, which writes it to .csv file. Also updates the user's row in the catalog.
+
+    Needs no session, so it is shared by the app and the ingestion API. Saves of a user are serialized. If the data was changed from a base version which is no longer the stored one, e.g. by a session while the ingestion API or another session saved, only its changes are applied to the stored data, so the other changes are kept.
+
+    Args:
+        usr_name (str): name of user
+        db (pd.DataFrame): user data, must not be changed afterwards
+        how (str): how the user's trend window is defined, see catalog.update()
+        start (datetime): start date of trend window, see catalog.update()
+        weeks (int): length of trend window in weeks, see catalog.update()
+        detector (dict|None): outlier detector state after the last entry, if new entries were scored on adding. Otherwise all entries are scored again.
+        kind (str): kind of change recorded in history, "edit" | "undo" | "redo"
+        base (tuple[int, pd.DataFrame]|None): data version and data the changes were made to, None if db was derived from the stored data within the lock, see merge()
+        session (str|None): session making the change, which can undo it, see history.record()
+        target (int|None): version undone or redone, see history.undoable()
+
+    Returns:
+        tuple[pd.DataFrame, int]: sorted and flagged user data, and its data version, which is unchanged if the data is
+    """
+
+    with locked(usr_name):
+        current = version(usr_name)
+        stored = read_db(usr_name, current)
+
+        # stored data changed meanwhile, only the changes to base are applied to it
+        if base is not None and base[0] != current:
+            db = history.apply(stored, history.diff(base[1], db))
+            detector = None
+
+        # sort db
+        db = db.sort_values(by="date", ignore_index=True)
+
+        # flag outliers, unless new entries were scored already
+        if detector is None:
+            flags, detector = outliers.scan(db)
+            db = db.assign(outlier=flags)
+
+        # record change, its version is the data version
+        saved = history.record(usr_name, stored, db, kind, current, session, target)
+        if saved is None:
+            return db, current
+
+        # save db to csv, in background
+        with _saving()["lock"]:
+            _saving()["files"][usr_name]["version"] = saved
+        saved = writer.save(
+            os.path.join("data", usr_name + ".csv"),
+            db.copy(),
+            saved,
+            functools.partial(_written, usr_name),
+        )
+        outliers.keep(usr_name, saved, detector)
+
+    # update summary of user
+    catalog.update(usr_name, db, how, start, weeks, saved)
+
+    return db, saved
+
+
+def merge(
+    usr_name: str, rows: pd.DataFrame, how: str, start: datetime, weeks: int
+) -> int:
+    """
+    Adds or updates a batch of measurements of a user, outside of any session, with one sort and save for the whole batch
+
+    Rows overwrite existing entries of the same time, as in add_update(). If all rows are later than the stored ones, only they are scored for outliers. Serialized with the saves of the user, see save().
+
+    Args:
+        usr_name (str): name of user
+        rows (pd.DataFrame): measurements with columns of create_df() except "outlier", dates floored to minutes
+        how (str): how the user's trend window is defined, see catalog.update()
+        start (datetime): start date of trend window, see catalog.update()
+        weeks (int): length of trend window in weeks, see catalog.update()
+
+    Returns:
+        int: new data version of user
+    """
+
+    rows = rows.sort_values(by="date", kind="stable").drop_duplicates(
+        subset="date", keep="last"
+    )
+
+    with locked(usr_name):
+        current = version(usr_name)
+        db = read_db(usr_name, current)
+
+        # score new rows in order if they follow the stored ones, else all are scored on saving
+        detector = None
+        if db.shape[0] == 0 or rows["date"].iloc[0] > db["date"].iloc[-1]:
+            detector = outliers.state(usr_name, current, db)
+            rows = rows.assign(
+                outlier=[
+                    outliers.update(detector, row) for row in rows.to_dict("records")
+                ]
+            )
+
+        db = pd.concat([db, rows], ignore_index=True) if db.shape[0] > 0 else rows
+        db = db.drop_duplicates(subset="date", keep="last")
+
+        return save(usr_name, db, how, start, weeks, detector)[1]
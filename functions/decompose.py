@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+# window of moving average taken as trend, in days, an odd multiple of a week's length cancels weekly effects
+TREND_DAYS = 35
+
+# history needed for a yearly component, in days
+YEAR_DAYS = 2 * 365
+
+# names of weekdays, monday first
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+
+def regularize(db: pd.DataFrame) -> pd.DataFrame:
+    """
+    Puts daily weights on a regular grid of days, gaps are filled by linear interpolation
+
+    Args:
+        db (pd.DataFrame): daily data with "date" and "weight", sorted by date, dates without time
+
+    Returns:
+        pd.DataFrame: one row per day from first to last measurement, with "date", "weight" interpolated and "measured" True on days with a measurement
+    """
+
+    days = pd.date_range(db["date"].iloc[0], db["date"].iloc[-1], freq="D")
+    weight = db.set_index("date")["weight"].reindex(days)
+    measured = weight.notna().values
+
+    return pd.DataFrame(
+        {
+            "date": days,
+            "weight": weight.interpolate(method="linear").values,
+            "measured": measured,
+        }
+    )
+
+
+def decompose(db: pd.DataFrame) -> pd.DataFrame:
+    """
+    Splits daily weights into trend, weekly and yearly components, and residual
+
+    The centered moving average of TREND_DAYS removes weekly effects. Weekly effects are the mean deviation from it per weekday. The yearly component is the mean deviation of the moving average from its own one-year average per day of year, only estimated with at least YEAR_DAYS of history. Only days with a measurement enter the means, so interpolated gaps do not dilute the effects. All steps are rolling windows and group means, no loops over days.
+
+    Args:
+        db (pd.DataFrame): daily data with "date" and "weight", sorted by date, dates without time
+
+    Returns:
+        pd.DataFrame: one row per day, with "date", "weight" (nan where not measured), "trend", "weekly", "yearly" and "residual"
+    """
+
+    reg = regularize(db)
+    y = reg["weight"]
+    measured = reg["measured"].values
+
+    # moving average, shorter at both ends
+    smooth = y.rolling(TREND_DAYS, center=True, min_periods=1).mean()
+
+    # yearly component, from deviation of moving average from its one-year average
+    doy = np.minimum(reg["date"].dt.dayofyear.values, 365)
+    yearly = np.zeros(y.shape[0])
+    if y.shape[0] >= YEAR_DAYS:
+        year_avg = smooth.rolling(365, center=True, min_periods=183).mean()
+        dev = (smooth - year_avg).where(measured & year_avg.notna().values)
+        by_doy = dev.groupby(doy).mean().reindex(np.arange(1, 366))
+        # smooth across days of year, wrapping around new year
+        wrapped = pd.concat([by_doy.iloc[-15:], by_doy, by_doy.iloc[:15]])
+        by_doy = wrapped.rolling(31, center=True, min_periods=1).mean().iloc[15:-15]
+        by_doy = by_doy.fillna(0) - by_doy.mean()
+        yearly = by_doy.values[doy - 1]
+
+    # weekly component, centered so it sums to zero over a week
+    weekday = reg["date"].dt.weekday.values
+    by_day = (y - smooth).where(measured).groupby(weekday).mean()
+    by_day = by_day.reindex(np.arange(7)).fillna(0)
+    by_day = by_day - by_day.mean()
+    weekly = by_day.values[weekday]
+
+    trend = smooth.values - yearly
+    return pd.DataFrame(
+        {
+            "date": reg["date"],
+            "weight": y.where(measured).values,
+            "trend": trend,
+            "weekly": weekly,
+            "yearly": yearly,
+            "residual": np.where(measured, y.values - trend - weekly - yearly, np.nan),
+        }
+    )
@@ -3,9 +3,14 @@ import math
 import numpy as np
 import pandas as pd
 from datetime import datetime, time
+import functions.data as data
+import functions.forecast as forecast
+import functions.smoothing as smoothing
+import functions.decompose as decompose
+import functions.kiosk as kiosk
+import plotly.io as pio
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-from sklearn.linear_model import LinearRegression as LinReg
 
 # dictionary of colors
 clrs = {
@@ -15,44 +20,91 @@ clrs = {
     "muscle": "#EF5B5B",
     "trend": "#66a3FF",
     "prediction": "#FF5757",
+    "band": "rgba(255, 87, 87, 0.15)",
+    "outlier": "#D62828",
+    "smoothed": "#8E7DBE",
 }
 
+# shares of bootstrapped predictions within bands on trend figure
+BANDS = [0.5, 0.8, 0.95]
 
-def main() -> go.Figure | None:
+# windows of trend summary, in weeks
+RATE_WEEKS = [2, 4, 8, 12, 26]
+
+
+def days(dates: pd.Series | pd.DatetimeIndex) -> np.ndarray:
+    """
+    Formats dates without time as "YYYY-MM-DD", which plotly sends as is, instead of full timestamps
+
+    Args:
+        dates (pd.Series | pd.DatetimeIndex): Dates of daily data
+
+    Returns:
+        np.ndarray: Dates as strings
+    """
+
+    return pd.DatetimeIndex(dates).strftime("%Y-%m-%d").values
+
+
+def size(fig: go.Figure) -> int:
+    """
+    Returns the size of a figure as sent to the browser
+
+    Args:
+        fig (go.Figure): Plotly figure
+
+    Returns:
+        int: Length of JSON payload, in bytes
+    """
+
+    return len(pio.to_json(fig, validate=False).encode())
+
+
+def main(
+    db: pd.DataFrame, target: float, style: str, smoothed: np.ndarray | None = None
+) -> go.Figure | None:
     """
     Main function to generate the primary weight tracking figure.
 
+    Args:
+        db (pd.DataFrame): Daily data, see data.daily()
+        target (float): Target weight of the user
+        style (str): Data style, "lines" | "markers" | "both"
+        smoothed (np.ndarray | None): Smoothed weight per day, not shown if None
+
     Returns:
         go.Figure | None: Plotly figure object containing the weight tracking visualization,
                          or None if no measurements are stored.
     """
 
     # return if no measurements stored
-    if st.session_state.db.shape[0] == 0:
+    if db.shape[0] == 0:
         return None
 
+    # rows drawn, fewer in kiosk mode
+    keep = kiosk.window(db)
+    db = db.iloc[keep]
+    if smoothed is not None:
+        smoothed = smoothed[keep]
+
     # marker/line mode
-    mode = (
-        "markers+lines"
-        if st.session_state["fig_main_style"] == "both"
-        else st.session_state["fig_main_style"]
-    )
+    mode = "markers+lines" if style == "both" else style
 
     # if only one measurement, use markers
-    if st.session_state.db.shape[0] == 1:
+    if db.shape[0] == 1:
         mode = "markers"
 
+    # dates, shared by all traces
+    x = days(db["date"])
+
     # instantiate figure
     fig = go.Figure()
 
     # add target weight
     fig.add_trace(
         go.Scatter(
-            x=[
-                list(st.session_state.db["date"])[0],
-                list(st.session_state.db["date"])[-1],
-            ],
-            y=[st.session_state.user_kg, st.session_state.user_kg],
+            x=[x[0], x[-1]],
+            y=[target, target],
             showlegend=True,
             hoverinfo="skip",
             name="target",
@@ -65,8 +117,8 @@ def main() -> go.Figure | None:
     # add _weight_
     fig.add_trace(
         go.Scatter(
-            x=st.session_state.db["date"],
-            y=st.session_state.db["weight"],
+            x=x,
+            y=db["weight"].values,
             showlegend=True,
             name="weight",
             mode=mode,
@@ -76,6 +128,35 @@ def main() -> go.Figure | None:
         ),
     )
 
+    # mark _outliers_, flagged measurements are excluded from db if so selected
+    if db["outlier"].any():
+        fig.add_trace(
+            go.Scatter(
+                x=x[db["outlier"].values],
+                y=db.loc[db["outlier"], "weight"].values,
+                showlegend=True,
+                name="outlier",
+                mode="markers",
+                marker_size=10,
+                marker_symbol="x",
+                marker_color=clrs["outlier"],
+            ),
+        )
+
+    # add _smoothed_ weight
+    if smoothed is not None:
+        fig.add_trace(
+            go.Scatter(
+                x=x,
+                y=smoothed.round(2),
+                showlegend=True,
+                name="smoothed",
+                mode="lines",
+                line_width=3,
+                line_color=clrs["smoothed"],
+            ),
+        )
+
     # set some layout properties
     fig.update_layout(
         # height of figure
@@ -109,8 +190,8 @@ def main() -> go.Figure | None:
         type="date",
         showgrid=True,
         range=(
-            list(st.session_state.db["date"])[0] - pd.DateOffset(weeks=1),
-            list(st.session_state.db["date"])[-1] + pd.DateOffset(weeks=1),
+            list(db["date"])[0] - pd.DateOffset(weeks=1),
+            list(db["date"])[-1] + pd.DateOffset(weeks=1),
         ),
     )
     fig.update_yaxes(
@@ -141,86 +222,94 @@ def main() -> go.Figure | None:
     return fig
 
 
-def trend() -> tuple[go.Figure | None, float]:
+def eta(db_data: pd.DataFrame, model: dict, target: float) -> dict:
     """
-    Function to calculate and visualize weight trends and predictions.
+    Predicts when the target weight is reached, by the fitted model and by bootstrapped models for its uncertainty.
 
-    Performs linear regression on weight data to determine trends, creates a visualization of actual weights, trend lines, and predictions for future weight based on current trends.
+    Args:
+        db_data (pd.DataFrame): Measurements within the trend window, see fit()
+        model (dict): The fitted model, see forecast.fit()
+        target (float): Target weight of the user
 
     Returns:
-        tuple[go.Figure|None, float]: A tuple containing:
-            - A plotly figure object with the trend visualization, or None if no data
-            - The calculated trend coefficient (slope of regression line)
+        dict: Prediction of target date:
+            - "weeks": Number of weeks to be predicted, 2 if the trend goes away from target
+            - "reached": True if the trend goes towards target
+            - "late": True if target is not reached within a year
+            - "days": Days from last measurement to target, inf if not reached within a year
+            - "level", "slope": Bootstrapped level and slope, see forecast.bootstrap()
+            - "reach": Days to target per bootstrapped model, see forecast.reach()
     """
 
-    # return if no measurements stored
-    if st.session_state.db.shape[0] <= 1:
-        return None, 0
-
-    # instantiate figure
-    fig = go.Figure()
+    last = db_data["weight"].iloc[-1]
+    slope = model["slope"]
+    days = np.arange(1, 51 * 7 + 1)
 
-    # get dates for x_axis based on trend_how
-    if st.session_state.trend_how == "start date":
-        # get date
-        x_data = [
-            datetime.combine(st.session_state.trend_start, time(0, 0, 0)),
-            list(st.session_state.db["date"])[-1],
-        ]
+    # find weeks to be predicted (=w2p) - depending on if trend is going towards target
+    if slope == 0 or (slope < 0 and target > last) or (slope > 0 and target < last):
+        # 2 weeks to predict for unwanted trend
+        w2p = 2
+        reached = False
+        late = False
+        first = np.inf
 
-    elif st.session_state.trend_how == "date range":
-        # get weeks
-        weeks = int(st.session_state.trend_range)
-        x_data = [
-            list(st.session_state.db["date"])[-1] - pd.Timedelta(weeks=weeks),
-            list(st.session_state.db["date"])[-1],
-        ]
     else:
-        x_data = [
-            list(st.session_state.db["date"])[0],
-            list(st.session_state.db["date"])[-1],
-        ]
+        # find first day on target within a year, a damped trend may never get there
+        pred_weight = forecast.predict(model, days)
+        on_target = np.where(
+            pred_weight <= target if slope < 0 else pred_weight >= target
+        )[0]
+        w2p = math.ceil(days[on_target[0]] / 7) + 1 if on_target.size > 0 else 52
+        first = days[on_target[0]] if on_target.size > 0 else np.inf
 
-    # filter data
-    idx_db = st.session_state.db["date"][st.session_state.db["date"] >= x_data[0]].index
-    db_data = st.session_state.db.iloc[idx_db]
+        reached = True
+        late = False
+        if w2p > 51:
+            w2p = 51
+            late = True
 
-    # lin. reg. of relevant data
-    X = db_data["date"].values.reshape(-1, 1)
-    y = db_data["weight"].values
-    LR = LinReg().fit(X, y)
-    trnd = LR.coef_[0].item()
-    ntrcpt = LR.intercept_
+    # bootstrap level and trend of model, for bands of prediction and target date
+    level_bs, slope_bs = forecast.bootstrap(
+        model,
+        (db_data["date"] - db_data["date"].iloc[0]) / pd.Timedelta(days=1),
+        db_data["input"].values,
+    )
 
-    # fit of actual data
-    y_fit = LR.predict(db_data["date"].values.astype(int).reshape(-1, 1))
-    db_data = db_data.assign(fit=y_fit)
+    return dict(
+        weeks=w2p,
+        reached=reached,
+        late=late,
+        days=first,
+        level=level_bs,
+        slope=slope_bs,
+        reach=forecast.reach(model, level_bs, slope_bs, target, days[-1]),
+    )
 
-    # find weeks to be predicted (=w2p) - depending on if trend is going towards target
-    if (trnd < 0 and st.session_state.user_kg > db_data["weight"].iloc[-1]) or (
-        trnd > 0 and st.session_state.user_kg < db_data["weight"].iloc[-1]
-    ):
-        # 2 weeks to predict for unwanted trend
-        w2p = 2
 
-        # set target_flags
-        target_reached = False
-        target_late = False
+def trend(db_data: pd.DataFrame, model: dict, target: float) -> go.Figure:
+    """
+    Function to visualize weight trends and predictions.
 
-    else:
-        # calculate weeks until target is reached
-        date_on_target = pd.to_datetime(
-            (st.session_state.user_kg - ntrcpt) / trnd, unit="ns"
-        )
-        t_diff = date_on_target - db_data["date"].iloc[-1]
-        w2p = math.ceil(t_diff / np.timedelta64(1, "W")) + 1
+    Creates a visualization of actual weights, trend lines, and predictions for future weight based on the fitted model, with bands of bootstrapped predictions.
 
-        # set target_flags
-        target_reached = True
-        target_late = False
-        if w2p > 51:
-            w2p = 51
-            target_late = True
+    Args:
+        db_data (pd.DataFrame): Measurements within the trend window, see fit()
+        model (dict): The fitted model, see forecast.fit()
+        target (float): Target weight of the user
+
+    Returns:
+        go.Figure: A plotly figure object with the trend visualization
+    """
+
+    # prediction of target date
+    pred = eta(db_data, model, target)
+    w2p = pred["weeks"]
+    target_reached = pred["reached"]
+    target_late = pred["late"]
+    trnd = model["slope"]
+
+    # instantiate figure
+    fig = go.Figure()
 
     # predict weight
     pred_date = pd.date_range(
@@ -228,7 +317,12 @@ def trend() -> tuple[go.Figure | None, float]:
         db_data["date"].iloc[-1] + pd.Timedelta(weeks=w2p),
         freq="d",
     )
-    pred_weight = LR.predict(pred_date.values.astype(int).reshape(-1, 1)).round(2)
+    pred_weight = forecast.predict(
+        model, (pred_date - db_data["date"].iloc[-1]).days.values
+    ).round(2)
+
+    # dates, shared by weight and fit
+    x = days(db_data["date"])
 
     # calculate x-range
     x_range = [
@@ -236,11 +330,17 @@ def trend() -> tuple[go.Figure | None, float]:
         pred_date[-1],
     ]
 
+    # bands of bootstrapped predictions
+    band_days = np.unique(np.r_[1 : w2p * 7 : 7, w2p * 7])
+    band_weight = forecast.bands(model, pred["level"], pred["slope"], band_days, BANDS)
+    band_date = days(db_data["date"].iloc[-1] + pd.to_timedelta(band_days, unit="D"))
+    reach_days = pred["reach"]
+
     # add target weight
     fig.add_trace(
         go.Scatter(
             x=x_range,
-            y=[st.session_state.user_kg, st.session_state.user_kg],
+            y=[target, target],
             hoverinfo="skip",
             name="target",
             mode="lines",
@@ -252,20 +352,26 @@ def trend() -> tuple[go.Figure | None, float]:
     # add weight
     fig.add_trace(
         go.Scatter(
-            x=db_data["date"],
-            y=db_data["weight"],
+            x=x,
+            y=db_data["weight"].values,
             name="weight",
             mode="markers",
             marker_size=10,
-            marker_color=clrs["weight"],
+            # outliers by flag and colorscale, not by color per point
+            marker=dict(
+                color=db_data["outlier"].values.astype(int),
+                colorscale=[[0, clrs["weight"]], [1, clrs["outlier"]]],
+                cmin=0,
+                cmax=1,
+            ),
         )
     )
 
     # add _FIT_
     fig.add_trace(
         go.Scatter(
-            x=db_data["date"],
-            y=db_data["fit"],
+            x=x,
+            y=db_data["fit"].values.round(2),
             hoverinfo="skip",
             name="weight",
             mode="lines",
@@ -274,12 +380,53 @@ def trend() -> tuple[go.Figure | None, float]:
         )
     )
 
+    # add _PREDICTION_BANDS_, narrower bands drawn on top
+    for level in BANDS[::-1]:
+        lower, upper = band_weight[level]
+        fig.add_trace(
+            go.Scatter(
+                x=np.r_[band_date, band_date[::-1]],
+                y=np.r_[upper, lower[::-1]].round(2),
+                hoverinfo="skip",
+                name=f"{level:.0%}",
+                mode="lines",
+                line_width=0,
+                fill="toself",
+                fillcolor=clrs["band"],
+            )
+        )
+
+    # add _TARGET_DATE_BANDS_ on target line, clipped to x-range
+    if target_reached:
+        for level, width in zip(BANDS[::-1], (4, 8, 12)):
+            first, last = forecast.interval(reach_days, level)
+            if np.isinf(first):
+                continue
+            fig.add_trace(
+                go.Scatter(
+                    x=[
+                        db_data["date"].iloc[-1] + pd.Timedelta(days=first),
+                        min(
+                            x_range[1],
+                            db_data["date"].iloc[-1]
+                            + pd.Timedelta(days=min(last, 51 * 7)),
+                        ),
+                    ],
+                    y=[target, target],
+                    hoverinfo="skip",
+                    name=f"{level:.0%}",
+                    mode="lines",
+                    line_width=width,
+                    line_color=clrs["band"],
+                )
+            )
+
     # add _PREDICTION_
     fig.add_trace(
         go.Scatter(
-            x=pred_date,
-            y=pred_weight[:,],
-            name="prediction",
+            x=days(pred_date),
+            y=pred_weight,
+            name=f"prediction ({model['model']})",
             mode="lines",
             line_width=3,
             line_dash="dash",
@@ -297,19 +444,34 @@ def trend() -> tuple[go.Figure | None, float]:
 
         else:
             pred_target_date = (
-                np.where(pred_weight < st.session_state.user_kg)[0][0]
+                np.where(pred_weight <= target)[0][0]
                 if trnd < 0
-                else np.where(pred_weight > st.session_state.user_kg)[0][0]
+                else np.where(pred_weight >= target)[0][0]
             )
 
             str_target = pred_date[pred_target_date].strftime("%d.%m.%y")
             str_days = pred_date[pred_target_date] - pd.Timestamp.today()
             text = f"{str_target}<br>({str_days.days} days)"
 
+        # 80% interval of target date
+        first, last = forecast.interval(reach_days, 0.8)
+        if not np.isinf(first):
+            str_first = (db_data["date"].iloc[-1] + pd.Timedelta(days=first)).strftime(
+                "%d.%m.%y"
+            )
+            str_last = (
+                "> year"
+                if np.isinf(last)
+                else (db_data["date"].iloc[-1] + pd.Timedelta(days=last)).strftime(
+                    "%d.%m.%y"
+                )
+            )
+            text += f"<br>80%: {str_first} - {str_last}"
+
         # text_patch
         fig.add_annotation(
             x=pred_date[pred_target_date],
-            y=st.session_state.user_kg,
+            y=target,
             text=text,
             showarrow=True,
             arrowhead=3,
@@ -345,37 +507,293 @@ def trend() -> tuple[go.Figure | None, float]:
         ticksuffix=" kg",
     )
 
-    return fig, trnd
+    return fig
 
 
-def body_comp() -> go.Figure | None:
+def trend_key(
+    how: str, start: datetime, weeks: int, target: float
+) -> tuple[str, pd.Timestamp, int, float]:
+    """
+    Trend settings in the types they are cached by, so they hash the same whether taken from users.csv records, rows of the user database (numpy scalars) or widgets (dates, ints)
+
+    Args:
+        how (str): How the trend window is defined, see fit_trend()
+        start (datetime): Start date of the window
+        weeks (int): Length of the window in weeks
+        target (float): Target weight of the user
+
+    Returns:
+        tuple[str, pd.Timestamp, int, float]: how, start, weeks and target
+    """
+
+    return str(how), pd.Timestamp(start), int(weeks), float(target)
+
+
+def trend_card(
+    usr_name: str,
+    version: int,
+    daily_how: str,
+    outlier: str,
+    smooth: str,
+    how: str,
+    start: datetime,
+    weeks: int,
+    target: float,
+) -> tuple[go.Figure, dict]:
+    """
+    Builds the trend figure of a user, cached across all sessions per data version, trend settings and target, so switching back to a setting only redraws. Settings are cast by trend_key() first, so warm-up and sessions share the entries.
+
+    The returned figure and model are shared, they must not be changed.
+
+    Args:
+        usr_name (str): Name of the user
+        version (int): Data version of the user, see data.version()
+        daily_how (str): Aggregation of measurements per day, see data.daily()
+        outlier (str): Handling of outliers, see data.daily()
+        smooth (str): Smoothing of weights the models are fitted on, see fit_trend()
+        how (str): How the trend window is defined, see fit_trend()
+        start (datetime): Start date of the window, see fit_trend()
+        weeks (int): Length of the window in weeks, see fit_trend()
+        target (float): Target weight of the user
+
+    Returns:
+        tuple[go.Figure | None, dict | None]: The trend figure, see trend(), and the fitted model, see forecast.fit(), both None if the trend window holds no measurement
+    """
+
+    return _trend_card(
+        str(usr_name),
+        int(version),
+        daily_how,
+        outlier,
+        smooth,
+        *trend_key(how, start, weeks, target),
+    )
+
+
+@st.cache_resource(show_spinner=False, max_entries=kiosk.entries(100))
+def _trend_card(
+    usr_name: str,
+    version: int,
+    daily_how: str,
+    outlier: str,
+    smooth: str,
+    how: str,
+    start: pd.Timestamp,
+    weeks: int,
+    target: float,
+) -> tuple[go.Figure | None, dict | None]:
+    """
+    Cached part of trend_card(), called with the settings cast by trend_key()
+    """
+
+    db_data, model = fit_trend(
+        usr_name, version, daily_how, outlier, smooth, how, start, weeks
+    )
+    if model is None:
+        return None, None
+    return trend(db_data, model, target), model
+
+
+def clear_trend_cards() -> None:
+    """
+    Drops all cached trend cards, see trend_card()
+
+    Returns:
+        None
+    """
+
+    _trend_card.clear()
+
+
+@st.cache_data(show_spinner=False, max_entries=kiosk.entries(100))
+def fit_trend(
+    usr_name: str,
+    version: int,
+    daily_how: str,
+    outlier: str,
+    smooth: str,
+    how: str,
+    start: datetime,
+    weeks: int,
+) -> tuple[pd.DataFrame, dict]:
+    """
+    Fits the forecast models on the daily weight data of a user within the trend window, and picks the best one.
+
+    Cached across all sessions per user, data version and trend settings, so it can be precomputed during warm-up.
+
+    Args:
+        usr_name (str): Name of the user
+        version (int): Data version of the user, see data.version()
+        daily_how (str): Aggregation of measurements per day, see data.daily()
+        outlier (str): Handling of outliers, see data.daily()
+        smooth (str): Smoothing of weights the models are fitted on, "off" | "ewma" | "kalman"
+        how (str): How the trend window is defined, "start date" | "date range"
+        start (datetime): Start date of the window, used if how is "start date"
+        weeks (int): Length of the window in weeks, used if how is "date range"
+
+    Returns:
+        tuple[pd.DataFrame | None, dict | None]: A tuple containing, both None if the window holds no measurement:
+            - Measurements within the trend window, incl. weights fitted on in column "input" and fitted weights in column "fit"
+            - The fitted model, see forecast.fit()
+    """
+
+    db = data.daily(usr_name, version, daily_how, outlier)
+
+    # weights to fit on, smoothed if so selected
+    if smooth == "off":
+        db = db.assign(input=db["weight"])
+    else:
+        db = db.assign(
+            input=smoothing.smoothed(usr_name, version, daily_how, outlier, smooth)
+        )
+
+    return fit(db, how, start, weeks)
+
+
+@st.cache_data(show_spinner=False, max_entries=kiosk.entries(100))
+def trend_summary(
+    usr_name: str,
+    version: int,
+    daily_how: str,
+    outlier: str,
+    smooth: str,
+    start: datetime,
+) -> pd.DataFrame:
+    """
+    Rates of weight change over several windows, all ending at the last measurement, side by side.
+
+    Slopes of all windows are fitted in one pass, see forecast.rates(). Cached across all sessions per user, data version and settings.
+
+    Args:
+        usr_name (str): Name of the user
+        version (int): Data version of the user, see data.version()
+        daily_how (str): Aggregation of measurements per day, see data.daily()
+        outlier (str): Handling of outliers, see data.daily()
+        smooth (str): Smoothing of weights, see fit_trend()
+        start (datetime): Start date of the user's trend window, as last window
+
+    Returns:
+        pd.DataFrame: One row per window of RATE_WEEKS and since start date, with "window", "since", "days" measured, "kg/week" and "kg/month"; rates are nan for less than two days
+    """
+
+    db = data.daily(usr_name, version, daily_how, outlier)
+    if smooth == "off":
+        weights = db["weight"].values.astype(float)
+    else:
+        weights = smoothing.smoothed(usr_name, version, daily_how, outlier, smooth)
+
+    # first day of each window
+    last = db["date"].iloc[-1]
+    since = pd.DatetimeIndex(
+        [last - pd.Timedelta(weeks=w) for w in RATE_WEEKS]
+        + [pd.Timestamp(start).normalize()]
+    )
+
+    days = (db["date"] - db["date"].iloc[0]) / pd.Timedelta(days=1)
+    starts = (since - db["date"].iloc[0]) / pd.Timedelta(days=1)
+    slope = forecast.rates(days.values, weights, starts.values)
+
+    return pd.DataFrame(
+        {
+            "window": [f"{w} weeks" for w in RATE_WEEKS] + ["since start date"],
+            "since": since,
+            "days": db.shape[0] - np.searchsorted(db["date"].values, since.values),
+            "kg/week": (slope * 7).round(2),
+            "kg/month": (slope * 30).round(2),
+        }
+    )
+
+
+def fit(
+    db: pd.DataFrame, how: str, start: datetime, weeks: int
+) -> tuple[pd.DataFrame, dict]:
+    """
+    Fits the forecast models on daily data within the trend window, see fit_trend()
+
+    Args:
+        db (pd.DataFrame): Daily data, see data.daily(), incl. weights to fit on in column "input"
+        how (str): How the trend window is defined, "start date" | "date range"
+        start (datetime): Start date of the window, used if how is "start date"
+        weeks (int): Length of the window in weeks, used if how is "date range"
+
+    Returns:
+        tuple[pd.DataFrame | None, dict | None]: Measurements within the trend window incl. fitted weights in column "fit", and the fitted model, both None if the window holds no measurement, e.g. if it starts after the last one
+    """
+
+    # get dates for x_axis based on trend_how
+    if how == "start date":
+        # get date
+        x_data = [
+            datetime.combine(start, time(0, 0, 0)),
+            list(db["date"])[-1],
+        ]
+
+    elif how == "date range":
+        # get weeks
+        x_data = [
+            list(db["date"])[-1] - pd.Timedelta(weeks=int(weeks)),
+            list(db["date"])[-1],
+        ]
+    else:
+        x_data = [
+            list(db["date"])[0],
+            list(db["date"])[-1],
+        ]
+
+    # filter data
+    idx_db = db["date"][db["date"] >= x_data[0]].index
+    db_data = db.iloc[idx_db]
+    if db_data.shape[0] == 0:
+        return None, None
+
+    # fit models on days since start of window
+    days = (db_data["date"] - db_data["date"].iloc[0]) / pd.Timedelta(days=1)
+    model = forecast.fit(days.values, db_data["input"].values)
+
+    # fit of actual data
+    db_data = db_data.assign(fit=model["fit"])
+
+    return db_data, model
+
+
+def body_comp(
+    db: pd.DataFrame, target: float, unit: str, style: str, show_wgt: bool
+) -> go.Figure | None:
     """
     Function to visualize the body composition over time.
 
     Creates a plot showing the evolution of various body composition measurements (fat, water, and muscle percentages) over time. Can display values either as percentages or absolute weights, and optionally include weight and target lines.
 
+    Args:
+        db (pd.DataFrame): Daily data, see data.daily()
+        target (float): Target weight of the user
+        unit (str): Unit of body composition, "%" | "kg"
+        style (str): Data style, "lines" | "markers" | "both"
+        show_wgt (bool): Whether weight and target are shown
+
     Returns:
         go.Figure | None: Plotly figure object containing the body composition visualization, or None if no measurements are stored.
     """
 
     # return if no measurements stored
-    if st.session_state.db.shape[0] == 0:
+    if db.shape[0] == 0:
         return None
 
+    # rows drawn, fewer in kiosk mode
+    db = db.iloc[kiosk.window(db)]
+
     # marker/line/body_comp mode
-    mode = (
-        "markers+lines"
-        if st.session_state["fig_body_comp_style"] == "both"
-        else st.session_state["fig_body_comp_style"]
-    )
-    bc_in_prc = st.session_state["fig_body_comp_type"] == "%"
-    show_wgt = st.session_state["fig_body_comp_weight"] == "weight & target"
+    mode = "markers+lines" if style == "both" else style
+    bc_in_prc = unit == "%"
     second_y = bc_in_prc and show_wgt
 
     # if only one measurement, use markers
-    if st.session_state.db.shape[0] == 1:
+    if db.shape[0] == 1:
         mode = "markers"
 
+    # dates, shared by all traces
+    x = days(db["date"])
+
     # instantiate figure
     if second_y:
         fig = make_subplots(specs=[[{"secondary_y": True}]])
@@ -386,16 +804,15 @@ def body_comp() -> go.Figure | None:
     for var in ["fat", "water", "muscle"]:
         # convert into kg?
         if bc_in_prc:
-            y = st.session_state.db[var]
+            y = db[var].values
         else:
-            y = st.session_state.db["weight"] * st.session_state.db[var] / 100
-            y = y.round(1)
+            y = (db["weight"] * db[var] / 100).values.round(1)
 
         # plot
         if second_y:
             fig.add_trace(
                 go.Scatter(
-                    x=st.session_state.db["date"],
+                    x=x,
                     y=y,
                     showlegend=True,
                     name=var,
@@ -409,7 +826,7 @@ def body_comp() -> go.Figure | None:
         else:
             fig.add_trace(
                 go.Scatter(
-                    x=st.session_state.db["date"],
+                    x=x,
                     y=y,
                     showlegend=True,
                     name=var,
@@ -421,13 +838,13 @@ def body_comp() -> go.Figure | None:
             )
 
     # add _weight_ & _target_
-    if st.session_state["fig_body_comp_weight"] == "weight & target":
+    if show_wgt:
         if second_y:
             # weight
             fig.add_trace(
                 go.Scatter(
-                    x=st.session_state.db["date"],
-                    y=st.session_state.db["weight"],
+                    x=x,
+                    y=db["weight"].values,
                     showlegend=True,
                     name="weight",
                     mode=mode,
@@ -441,11 +858,8 @@ def body_comp() -> go.Figure | None:
             # target
             fig.add_trace(
                 go.Scatter(
-                    x=[
-                        list(st.session_state.db["date"])[0],
-                        list(st.session_state.db["date"])[-1],
-                    ],
-                    y=[st.session_state.user_kg, st.session_state.user_kg],
+                    x=[x[0], x[-1]],
+                    y=[target, target],
                     showlegend=False,
                     hoverinfo="skip",
                     name="target",
@@ -460,8 +874,8 @@ def body_comp() -> go.Figure | None:
             # weight
             fig.add_trace(
                 go.Scatter(
-                    x=st.session_state.db["date"],
-                    y=st.session_state.db["weight"],
+                    x=x,
+                    y=db["weight"].values,
                     showlegend=True,
                     name="weight",
                     mode=mode,
@@ -474,11 +888,8 @@ def body_comp() -> go.Figure | None:
             # target
             fig.add_trace(
                 go.Scatter(
-                    x=[
-                        list(st.session_state.db["date"])[0],
-                        list(st.session_state.db["date"])[-1],
-                    ],
-                    y=[st.session_state.user_kg, st.session_state.user_kg],
+                    x=[x[0], x[-1]],
+                    y=[target, target],
                     showlegend=False,
                     hoverinfo="skip",
                     name="target",
@@ -519,8 +930,8 @@ def body_comp() -> go.Figure | None:
         type="date",
         showgrid=True,
         range=(
-            list(st.session_state.db["date"])[0] - pd.DateOffset(weeks=1),
-            list(st.session_state.db["date"])[-1] + pd.DateOffset(weeks=1),
+            list(db["date"])[0] - pd.DateOffset(weeks=1),
+            list(db["date"])[-1] + pd.DateOffset(weeks=1),
         ),
     )
     if second_y:
@@ -559,3 +970,199 @@ def body_comp() -> go.Figure | None:
     )
 
     return fig
+
+
+@st.cache_data(show_spinner=False, max_entries=kiosk.entries(100))
+def decomposition(
+    usr_name: str, version: int, daily_how: str, outlier: str
+) -> pd.DataFrame:
+    """
+    Decomposes the daily weight data of a user into trend, weekly and yearly components.
+
+    Cached across all sessions per user, data version and daily series settings.
+
+    Args:
+        usr_name (str): Name of the user
+        version (int): Data version of the user, see data.version()
+        daily_how (str): Aggregation of measurements per day, see data.daily()
+        outlier (str): Handling of outliers, see data.daily()
+
+    Returns:
+        pd.DataFrame: Components per day, see decompose.decompose()
+    """
+
+    return decompose.decompose(data.daily(usr_name, version, daily_how, outlier))
+
+
+def seasonal(comp: pd.DataFrame) -> go.Figure | None:
+    """
+    Function to visualize weekday effects and seasonal patterns of weight.
+
+    Creates a plot of the weight trend without weekly and yearly effects, the mean effect of each weekday, and the yearly pattern if the history is long enough.
+
+    Args:
+        comp (pd.DataFrame): Components per day, see decomposition()
+
+    Returns:
+        go.Figure | None: Plotly figure object containing the decomposition, or None if there are less than two weeks of measurements.
+    """
+
+    # return if not enough measurements stored
+    if comp.shape[0] <= 14:
+        return None
+
+    has_year = comp.shape[0] >= decompose.YEAR_DAYS
+
+    # instantiate figure, trend on top, weekday and yearly effects below
+    fig = make_subplots(
+        rows=2,
+        cols=2,
+        specs=[[{"colspan": 2}, None], [{}, {}]],
+        row_heights=[0.6, 0.4],
+        vertical_spacing=0.12,
+        subplot_titles=(
+            "trend",
+            "weekday effect",
+            "yearly effect" if has_year else "yearly effect (needs 2 years)",
+        ),
+    )
+
+    # dates, days without measurement have no weight
+    x = days(comp["date"])
+    measured = comp["weight"].notna().values
+
+    # add _weight_ and _trend_
+    fig.add_trace(
+        go.Scatter(
+            x=x[measured],
+            y=comp["weight"].values[measured].round(1),
+            name="weight",
+            mode="markers",
+            marker_size=4,
+            marker_color=clrs["weight"],
+        ),
+        row=1,
+        col=1,
+    )
+    fig.add_trace(
+        go.Scatter(
+            x=x,
+            y=comp["trend"].values.round(2),
+            name="trend",
+            mode="lines",
+            line_width=3,
+            line_color=clrs["trend"],
+        ),
+        row=1,
+        col=1,
+    )
+
+    # add _weekday effect_
+    week = comp.iloc[: min(7, comp.shape[0])]
+    week = week.set_index(week["date"].dt.weekday)["weekly"].sort_index()
+    fig.add_trace(
+        go.Bar(
+            x=[decompose.WEEKDAYS[d] for d in week.index],
+            y=week.round(2),
+            name="weekday",
+            marker_color=np.where(week > 0, clrs["prediction"], clrs["trend"]).tolist(),
+        ),
+        row=2,
+        col=1,
+    )
+
+    # add _yearly effect_, one year from first of january
+    if has_year:
+        year = comp.groupby(comp["date"].dt.dayofyear)["yearly"].first()
+        fig.add_trace(
+            go.Scatter(
+                x=days(
+                    pd.Timestamp("2001-01-01")
+                    + pd.to_timedelta(year.index - 1, unit="D")
+                ),
+                y=year.values.round(2),
+                name="yearly",
+                mode="lines",
+                line_width=2,
+                line_color=clrs["weight"],
+            ),
+            row=2,
+            col=2,
+        )
+
+    # set some layout properties
+    fig.update_layout(
+        # height of figure
+        height=500,
+        # turn legend off
+        showlegend=False,
+        # hovering
+        hovermode="x unified",
+        hoverlabel=dict(font_size=12, bgcolor="#fefefe"),
+        # margin
+        margin=dict(l=0, r=0, t=20, b=0),
+    )
+
+    # set x/y-axes properties
+    fig.update_xaxes(type="date", showgrid=True, row=1, col=1)
+    fig.update_xaxes(type="date", tickformat="%b", row=2, col=2)
+    fig.update_yaxes(ticksuffix=" kg")
+
+    return fig
+
+
+def cohort(weekly: dict, metric: str) -> go.Figure | None:
+    """
+    Function to compare the histories of all users, aligned to their first measurement.
+
+    Args:
+        weekly (dict): Weekly series by user name, see cohort.load()
+        metric (str): Column to compare, "change" | "change_pct" | "rate"
+
+    Returns:
+        go.Figure | None: Plotly figure object with one line per user, or None if no user has measurements.
+    """
+
+    # return if no measurements stored
+    if all(df.shape[0] == 0 for df in weekly.values()):
+        return None
+
+    # instantiate figure
+    fig = go.Figure()
+
+    # add one line per user
+    for name, df in weekly.items():
+        fig.add_trace(
+            go.Scatter(
+                x=df["week"],
+                y=df[metric],
+                customdata=df["date"].dt.strftime("%d.%m.%Y"),
+                hovertemplate="%{y}<br>%{customdata}",
+                name=name,
+                mode="lines+markers",
+                line_width=2,
+                marker_size=5,
+            )
+        )
+
+    # set some layout properties
+    fig.update_layout(
+        # height of figure
+        height=420,
+        # hovering
+        hovermode="x unified",
+        hoverlabel=dict(font_size=12, bgcolor="#fefefe"),
+        # legend
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="left", x=0),
+        # margin
+        margin=dict(l=0, r=0, t=0, b=0),
+    )
+
+    # set x/y-axes properties
+    fig.update_xaxes(title_text="weeks since first measurement", showgrid=True)
+    fig.update_yaxes(
+        ticksuffix={"change": " kg", "change_pct": " %", "rate": " kg/week"}[metric],
+        zeroline=True,
+    )
+
+    return fig
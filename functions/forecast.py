@@ -0,0 +1,408 @@
+import numpy as np
+
+# candidate models, see fit()
+MODELS = ["linear", "damped", "piecewise"]
+
+# parameter grid of damped trend exponential smoothing: smoothing of level and trend, damping per day
+_ALPHA, _BETA, _PHI = (
+    grid.ravel()
+    for grid in np.meshgrid(
+        [0.1, 0.2, 0.3, 0.5, 0.7],
+        [0.05, 0.1, 0.2, 0.3],
+        [0.95, 0.98, 0.99, 0.995, 0.999],
+        indexing="ij",
+    )
+)
+
+# number of last points used as forecast origins in backtest
+FOLDS = 10
+
+
+def _damp(days: np.ndarray, phi: np.ndarray | float) -> np.ndarray:
+    """
+    Sum of damping factors phi + phi^2 + ... + phi^days, i.e. how many days of trend a forecast adds
+
+    Args:
+        days (np.ndarray): forecast horizon in days
+        phi (np.ndarray | float): damping per day, 1 for no damping
+
+    Returns:
+        np.ndarray: effective number of trend days
+    """
+
+    phi = np.asarray(phi, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        damped = phi * (1 - phi**days) / (1 - phi)
+    return np.where(phi == 1, days, damped)
+
+
+def _linear(x: np.ndarray, y: np.ndarray) -> dict:
+    """
+    Fits straight lines to all leading parts of the data at once, using cumulative sums
+
+    Args:
+        x (np.ndarray): days since start of window
+        y (np.ndarray): weights
+
+    Returns:
+        dict: "slope" and "intercept" of the line through points [0, i], for every i
+    """
+
+    n = np.arange(1, x.shape[0] + 1)
+    sx, sy = np.cumsum(x), np.cumsum(y)
+    sxx, sxy = np.cumsum(x * x), np.cumsum(x * y)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (n * sxy - sx * sy) / (n * sxx - sx**2)
+    intercept = (sy - slope * sx) / n
+
+    return {"slope": slope, "intercept": intercept}
+
+
+def _piecewise(x: np.ndarray, y: np.ndarray, ends: np.ndarray) -> dict:
+    """
+    Fits lines with one break to some leading parts of the data, trying every point as break
+
+    The break (knot) of least squared error is kept for each leading part. The fits of all knots are solved as one batch of 3x3 normal equations, built from prefix sums, so memory and time grow with the number of parts times the number of points.
+
+    Args:
+        x (np.ndarray): days since start of window
+        y (np.ndarray): weights
+        ends (np.ndarray): index of the last point of each leading part
+
+    Returns:
+        dict: "intercept", "slope", "bend" and "knot" of the fit to points [0, end], for every end; nan if there are too few points
+    """
+
+    n = x.shape[0]
+    e = np.asarray(ends)[:, None]
+    j = np.arange(1, n - 1)[None, :]
+    knots = x[1:-1]
+
+    # prefix sums, p[i] is the sum over the first i points
+    def prefix(v: np.ndarray) -> np.ndarray:
+        return np.concatenate([[0.0], np.cumsum(v)])
+
+    px, pxx, py, pxy, pyy = (prefix(v) for v in [x, x * x, y, x * y, y * y])
+
+    # sums over points up to each end: shape (ends, 1)
+    ones, sx, sxx, sy, sxy, syy = (
+        e + 1.0,
+        px[e + 1],
+        pxx[e + 1],
+        py[e + 1],
+        pxy[e + 1],
+        pyy[e + 1],
+    )
+
+    # sums of hinge terms max(0, x - knot), over points after the knot up to each end: shape (ends, knots)
+    after = np.maximum(e, j) + 1
+    k = knots[None, :]
+    cnt = after - j - 1
+    dx, dxx = px[after] - px[j + 1], pxx[after] - pxx[j + 1]
+    dy, dxy = py[after] - py[j + 1], pxy[after] - pxy[j + 1]
+    sh = dx - k * cnt
+    shh = dxx - 2 * k * dx + k * k * cnt
+    sxh = dxx - k * dx
+    shy = dxy - k * dy
+
+    shape = sh.shape
+    ones, sx, sxx, sy, sxy, syy = (
+        np.broadcast_to(v, shape) for v in [ones, sx, sxx, sy, sxy, syy]
+    )
+    lhs = np.stack(
+        [
+            np.stack([ones, sx, sh], axis=-1),
+            np.stack([sx, sxx, sxh], axis=-1),
+            np.stack([sh, sxh, shh], axis=-1),
+        ],
+        axis=-2,
+    )
+    rhs = np.stack([sy, sxy, shy], axis=-1)
+
+    # a knot needs two points after it, otherwise the fit is not defined
+    valid = np.broadcast_to(e >= j + 2, shape)
+    lhs = np.where(valid[..., None, None], lhs, np.eye(3))
+    coef = np.linalg.solve(lhs, rhs[..., None])[..., 0]
+    sse = np.where(valid, syy - (coef * rhs).sum(axis=-1), np.inf)
+
+    # best knot per leading part
+    best = np.argmin(sse, axis=1)
+    rows = np.arange(shape[0])
+    coef = coef[rows, best]
+    defined = valid[rows, best]
+
+    return {
+        "intercept": np.where(defined, coef[:, 0], np.nan),
+        "slope": np.where(defined, coef[:, 1], np.nan),
+        "bend": np.where(defined, coef[:, 2], np.nan),
+        "knot": np.where(defined, knots[best], np.nan),
+    }
+
+
+def _damped(x: np.ndarray, y: np.ndarray, until: int | None = None) -> dict:
+    """
+    Runs damped trend exponential smoothing over the data, for the whole parameter grid at once
+
+    Steps in time are taken one by one, each for all parameter sets. Gaps between measurements are handled by forecasting over their length in days.
+
+    Args:
+        x (np.ndarray): days since start of window
+        y (np.ndarray): weights
+        until (int | None): number of leading points whose one-step errors select the parameters, all if None. Points after them are forecast out of sample, e.g. in a backtest.
+
+    Returns:
+        dict: "pred" one-step-ahead forecasts (nan for the first point), "level" smoothed weights, "slope" trend in kg/day after the last point and "phi" damping, for the parameter set of least squared one-step error
+    """
+
+    n = x.shape[0]
+    level = np.full(_ALPHA.shape, y[0])
+    slope = np.full(_ALPHA.shape, (y[1] - y[0]) / (x[1] - x[0]))
+    pred = np.full((n, _ALPHA.shape[0]), np.nan)
+    levels = np.empty((n, _ALPHA.shape[0]))
+    levels[0] = level
+
+    for i in range(1, n):
+        dt = x[i] - x[i - 1]
+        pred[i] = level + slope * _damp(dt, _PHI)
+        new_level = _ALPHA * y[i] + (1 - _ALPHA) * pred[i]
+        slope = _BETA * (new_level - level) / dt + (1 - _BETA) * _PHI**dt * slope
+        level = levels[i] = new_level
+
+    best = np.argmin(np.nansum((pred[:until] - y[:until, None]) ** 2, axis=0))
+
+    return {
+        "pred": pred[:, best],
+        "level": levels[:, best],
+        "slope": slope[best],
+        "phi": _PHI[best],
+    }
+
+
+def fit(days: np.ndarray, weights: np.ndarray) -> dict:
+    """
+    Fits all candidate models to the measurements of a trend window and picks the one forecasting best
+
+    Models are linear regression, damped trend exponential smoothing and piecewise linear regression with one break. They are compared by rolling-origin backtest: each of the last FOLDS measurements is forecast from all measurements before it, the model of least mean absolute error wins. Parameters of the damped model are selected on the points before the first origin, so its backtest is out of sample as for the regressions. With too few measurements for a backtest, the linear model is used.
+
+    Args:
+        days (np.ndarray): days since start of window, ascending and unique
+        weights (np.ndarray): weight per day
+
+    Returns:
+        dict | None: fitted model, None if there are no measurements, with
+            - "model": name of the model, see MODELS
+            - "fit": fitted weights, per day
+            - "level": fitted weight of the last day
+            - "slope": trend at the last day, in kg/day
+            - "phi": damping of the trend per day, 1 for linear models
+            - "errors": backtest error per model, nan if not backtested
+    """
+
+    x = np.asarray(days, dtype=float)
+    y = np.asarray(weights, dtype=float)
+    n = x.shape[0]
+    if n == 0:
+        return None
+
+    # rolling-origin backtest over the last points all models can forecast
+    origins = np.arange(max(4, n - FOLDS), n)
+
+    # fits of all leading parts, one-step-ahead forecasts of each next point
+    lin = _linear(x, y)
+    preds = {"linear": np.full(n, np.nan)}
+    preds["linear"][2:] = lin["intercept"][1:-1] + lin["slope"][1:-1] * x[2:]
+
+    if n >= 4:
+        # piecewise fits only where needed: before each origin, and of the whole window
+        pw = _piecewise(x, y, np.r_[origins - 1, n - 1])
+        preds["piecewise"] = np.full(n, np.nan)
+        preds["piecewise"][origins] = (
+            pw["intercept"][:-1]
+            + pw["slope"][:-1] * x[origins]
+            + pw["bend"][:-1] * np.maximum(0, x[origins] - pw["knot"][:-1])
+        )
+        preds["damped"] = _damped(x, y, origins[0] if n >= 5 else None)["pred"]
+
+    errors = {name: np.nan for name in MODELS}
+    if n >= 5:
+        for name, pred in preds.items():
+            errors[name] = np.abs(pred[origins] - y[origins]).mean().item()
+    name = min(preds, key=lambda m: errors[m]) if n >= 5 else "linear"
+
+    # final model, fitted to the whole window
+    if name == "damped":
+        es = _damped(x, y)
+        fitted, level, slope, phi = es["level"], es["level"][-1], es["slope"], es["phi"]
+    elif name == "piecewise":
+        bend = np.maximum(0, x - pw["knot"][-1])
+        fitted = pw["intercept"][-1] + pw["slope"][-1] * x + pw["bend"][-1] * bend
+        level, slope, phi = fitted[-1], pw["slope"][-1] + pw["bend"][-1], 1.0
+    elif n > 1:
+        fitted = lin["intercept"][-1] + lin["slope"][-1] * x
+        level, slope, phi = fitted[-1], lin["slope"][-1], 1.0
+    else:
+        # a single day has no trend
+        fitted, level, slope, phi = y, y[-1], 0.0, 1.0
+
+    return {
+        "model": name,
+        "fit": fitted,
+        "level": float(level),
+        "slope": float(slope),
+        "phi": float(phi),
+        "errors": errors,
+    }
+
+
+def predict(model: dict, days: np.ndarray) -> np.ndarray:
+    """
+    Forecasts weights with a fitted model
+
+    Args:
+        model (dict): fitted model, see fit()
+        days (np.ndarray): days after the last day of the trend window
+
+    Returns:
+        np.ndarray: forecast weights
+    """
+
+    days = np.asarray(days, dtype=float)
+    return model["level"] + model["slope"] * _damp(days, model["phi"])
+
+
+def bootstrap(
+    model: dict,
+    days: np.ndarray,
+    weights: np.ndarray,
+    samples: int = 1000,
+    seed: int = 0,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Resamples level and trend of a fitted model by residual bootstrap, as one matrix operation
+
+    Residuals of the fit are drawn with replacement. The line fitted through each draw shifts level and trend of the model. No loop over samples is run.
+
+    Args:
+        model (dict): fitted model, see fit()
+        days (np.ndarray): days since start of window, as passed to fit()
+        weights (np.ndarray): weight per day, as passed to fit()
+        samples (int): number of resamples
+        seed (int): seed of random generator, fixed so reruns give the same result
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: level at the last day and trend in kg/day, one per resample
+    """
+
+    x = np.asarray(days, dtype=float)
+    resid = np.asarray(weights, dtype=float) - model["fit"]
+    resid = resid - resid.mean()
+
+    # resampled residuals, and lines through them
+    rng = np.random.default_rng(seed)
+    draws = resid[rng.integers(0, x.shape[0], (samples, x.shape[0]))]
+    xc = x - x.mean()
+    sxx = (xc**2).sum()
+    slope = draws @ xc / sxx if sxx > 0 else np.zeros(samples)
+    level = draws.mean(axis=1) + slope * xc[-1]
+
+    return model["level"] + level, model["slope"] + slope
+
+
+def reach(
+    model: dict, level: np.ndarray, slope: np.ndarray, target: float, days: int
+) -> np.ndarray:
+    """
+    Finds the first day resampled forecasts reach a target weight
+
+    Forecasts move monotonically, so the day follows from the damped number of trend days by binary search, no forecast is evaluated day by day.
+
+    Args:
+        model (dict): fitted model, see fit()
+        level (np.ndarray): resampled levels, see bootstrap()
+        slope (np.ndarray): resampled trends, see bootstrap()
+        target (float): target weight
+        days (int): number of days to look ahead
+
+    Returns:
+        np.ndarray: first day on target per resample, counted from the last day of the window, inf if not within days
+    """
+
+    steps = _damp(np.arange(1, days + 1, dtype=float), model["phi"])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        needed = (target - level) / slope
+
+    # on target already, moving away or never getting there
+    needed = np.where(np.isfinite(needed) & (needed > 0), needed, np.inf)
+    needed = np.where(
+        (slope < 0) == (target < level), needed, np.where(target == level, 0, np.inf)
+    )
+
+    pos = np.searchsorted(steps, needed, "left").astype(float)
+    return np.where(pos < days, pos + 1, np.inf)
+
+
+def bands(
+    model: dict, level: np.ndarray, slope: np.ndarray, horizon: np.ndarray, levels
+) -> dict:
+    """
+    Central bands of resampled forecasts
+
+    Args:
+        model (dict): fitted model, see fit()
+        level (np.ndarray): resampled levels, see bootstrap()
+        slope (np.ndarray): resampled trends, see bootstrap()
+        horizon (np.ndarray): days after the last day of the trend window
+        levels (list[float]): shares of forecasts within bands, e.g. [0.5, 0.8, 0.95]
+
+    Returns:
+        dict: lower and upper weights per day of horizon, per share
+    """
+
+    steps = _damp(np.asarray(horizon, dtype=float), model["phi"])
+    paths = level[:, None] + slope[:, None] * steps[None, :]
+    qs = [q for c in levels for q in ((1 - c) / 2, (1 + c) / 2)]
+    bounds = np.quantile(paths, qs, axis=0)
+    return {c: (bounds[2 * i], bounds[2 * i + 1]) for i, c in enumerate(levels)}
+
+
+def interval(values: np.ndarray, level: float) -> tuple[float, float]:
+    """
+    Central interval of a sample
+
+    Args:
+        values (np.ndarray): sample, may contain inf
+        level (float): share of sample within interval, e.g. 0.8
+
+    Returns:
+        tuple[float, float]: lower and upper bound
+    """
+
+    values = np.sort(values)
+    lo = int(np.floor(values.shape[0] * (1 - level) / 2))
+    hi = int(np.ceil(values.shape[0] * (1 + level) / 2)) - 1
+    return values[lo], values[hi]
+
+
+def rates(days: np.ndarray, weights: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """
+    Slopes of straight lines through the measurements since each of several start days, in one pass over the data
+
+    Windows all end at the last measurement, so they are the leading parts of the reversed data, which _linear() fits at once from cumulative sums.
+
+    Args:
+        days (np.ndarray): days of measurements, ascending
+        weights (np.ndarray): weights
+        starts (np.ndarray): first day of each window, on the same scale as days
+
+    Returns:
+        np.ndarray: slope in kg/day per window, nan if there are less than two measurements in it
+    """
+
+    # days relative to last measurement, keeps the sums small
+    x = (days - days[-1])[::-1]
+    slope = _linear(x, weights[::-1])["slope"]
+
+    # number of measurements per window
+    count = days.shape[0] - np.searchsorted(days, starts, side="left")
+    return np.where(count >= 2, slope[np.maximum(count, 1) - 1], np.nan)
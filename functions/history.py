@@ -0,0 +1,639 @@
+import os
+import json
+import shutil
+import threading
+import pandas as pd
+from typing import Iterator
+import streamlit as st
+from datetime import datetime
+import functions.writer as writer
+
+# directory of histories, one sub-directory per user with log.jsonl and <version>.csv snapshots
+DIR = os.path.join("data", "history")
+
+# versions between snapshots, reads as of a version replay at most this many deltas
+SNAPSHOT_EVERY = 50
+
+# columns recorded, outlier flags are derived from them
+METRICS = ["weight", "fat", "water", "muscle"]
+
+
+def diff(old: pd.DataFrame, new: pd.DataFrame) -> list[dict]:
+    """
+    Compares two versions of user data by date and time
+
+    Args:
+        old (pd.DataFrame): user data before the change
+        new (pd.DataFrame): user data after the change
+
+    Returns:
+        list[dict]: one delta per added, updated or deleted entry, with "op", "date", and "old" and "new" values (None if the entry does not exist)
+    """
+
+    old = old.drop_duplicates(subset="date", keep="last").set_index("date")[METRICS]
+    new = new.drop_duplicates(subset="date", keep="last").set_index("date")[METRICS]
+
+    # entries of both versions with any value changed
+    common = old.index.intersection(new.index)
+    a, b = old.loc[common], new.loc[common]
+    changed = common[(a.ne(b) & ~(a.isna() & b.isna())).any(axis=1).values]
+
+    deleted = old.index.difference(new.index)
+    added = new.index.difference(old.index)
+    return (
+        [
+            {"op": "delete", "date": d.isoformat(), "old": v, "new": None}
+            for d, v in zip(deleted, old.loc[deleted].values.tolist())
+        ]
+        + [
+            {"op": "update", "date": d.isoformat(), "old": v, "new": w}
+            for d, v, w in zip(
+                changed,
+                old.loc[changed].values.tolist(),
+                new.loc[changed].values.tolist(),
+            )
+        ]
+        + [
+            {"op": "add", "date": d.isoformat(), "old": None, "new": v}
+            for d, v in zip(added, new.loc[added].values.tolist())
+        ]
+    )
+
+
+def invert(ops: list[dict]) -> list[dict]:
+    """
+    Returns the deltas which revert the given ones
+
+    Args:
+        ops (list[dict]): deltas, see diff()
+
+    Returns:
+        list[dict]: reverting deltas
+    """
+
+    reverse = {"add": "delete", "delete": "add", "update": "update"}
+    return [
+        {"op": reverse[o["op"]], "date": o["date"], "old": o["new"], "new": o["old"]}
+        for o in ops
+    ]
+
+
+def apply(db: pd.DataFrame, ops: list[dict]) -> pd.DataFrame:
+    """
+    Applies deltas to user data, later deltas of the same entry win
+
+    Args:
+        db (pd.DataFrame): user data with "date" and METRICS
+        ops (list[dict]): deltas, see diff()
+
+    Returns:
+        pd.DataFrame: changed user data with "date" and METRICS, sorted by date, without outlier flags
+    """
+
+    # final values of each touched entry, None if deleted
+    final = {pd.Timestamp(o["date"]): o["new"] for o in ops}
+    kept = db[~db["date"].isin(list(final))][["date", *METRICS]]
+    put = pd.DataFrame(
+        [[d, *v] for d, v in final.items() if v is not None],
+        columns=["date", *METRICS],
+    )
+
+    db = pd.concat([kept, put], ignore_index=True) if put.shape[0] > 0 else kept
+    return db.sort_values(by="date", ignore_index=True)
+
+
+@st.cache_resource(show_spinner=False)
+def _histories() -> dict:
+    """
+    Histories of all users, loaded from their logs on first use and shared by all sessions
+
+    Returns:
+        dict: {"lock": threading.Lock, "users": dict of history by user name, see _load(), "heads": dict of (status of head file, head) by user name, see head()}
+    """
+
+    return {"lock": threading.Lock(), "users": {}, "heads": {}}
+
+
+def _dir(usr_name: str) -> str:
+    return os.path.join(DIR, usr_name)
+
+
+def _stat(usr_name: str) -> tuple[int, int] | None:
+    """
+    Returns size and modification time of a user's log, None if there is none
+    """
+
+    try:
+        stat = os.stat(os.path.join(_dir(usr_name), "log.jsonl"))
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _push(hist: dict, entry: dict) -> None:
+    """
+    Moves a recorded version between undo and redo stacks
+
+    Stacks are shared by all sessions, each session only undoes and redoes its own entries, see undoable().
+
+    Args:
+        hist (dict): history of user, see _load()
+        entry (dict): logged entry or its metadata, with "version", "kind", and the "session" making it, and for undo and redo the "target" version undone or redone
+
+    Returns:
+        None
+    """
+
+    kind = entry["kind"]
+    if kind == "edit":
+        hist["undo"].append(entry["version"])
+        # an edit ends what its session could redo
+        hist["redo"] = [
+            v
+            for v in hist["redo"]
+            if hist["index"][v].get("session") != entry.get("session")
+        ]
+    elif kind in ("undo", "redo"):
+        stack = hist["undo" if kind == "undo" else "redo"]
+        target = entry.get("target")
+        if target in stack:
+            stack.remove(target)
+        elif target is None and stack:
+            stack.pop()
+        hist["redo" if kind == "undo" else "undo"].append(entry["version"])
+
+
+def _load(usr_name: str) -> dict:
+    """
+    Returns the history of a user, read from the log once per process, and again if another process appended to it, e.g. a sync. Must be called with the lock held.
+
+    Only the deltas since the latest snapshot are kept in memory, those of earlier versions are read from the log when needed, see _logged().
+
+    Args:
+        usr_name (str): name of user
+
+    Returns:
+        dict: {"name": name of user, "log": size and modification time of log when read, "version": latest version, "base": version of first snapshot or None if nothing recorded yet, "since": version of latest snapshot, "undo"/"redo": stacks of versions, "index": metadata of logged entries by version, see _meta(), "ops": deltas of versions since latest snapshot}
+    """
+
+    users = _histories()["users"]
+    stat = _stat(usr_name)
+    if usr_name in users and users[usr_name]["log"] == stat:
+        return users[usr_name]
+
+    hist = _empty(usr_name)
+    hist["log"] = stat
+    for entry in _lines(usr_name):
+        if entry["kind"] == "removed":
+            # first line of a deleted user's log, only the version is kept
+            pass
+        elif entry["kind"] == "base":
+            hist["base"] = hist["since"] = entry["version"]
+        else:
+            _add(hist, entry)
+        hist["version"] = entry["version"]
+
+    users[usr_name] = hist
+    return hist
+
+
+def _empty(usr_name: str, version: int = 0) -> dict:
+    """
+    Returns a history without entries, see _load()
+    """
+
+    return {
+        "name": usr_name,
+        "log": None,
+        "version": version,
+        "base": None,
+        "since": None,
+        "undo": [],
+        "redo": [],
+        "index": {},
+        "ops": {},
+    }
+
+
+def _lines(usr_name: str) -> Iterator[dict]:
+    """
+    Yields the entries of a user's log, one at a time, nothing if there is no log
+    """
+
+    try:
+        with open(os.path.join(_dir(usr_name), "log.jsonl"), encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # partly written line of a crash
+                    continue
+    except FileNotFoundError:
+        return
+
+
+def _meta(entry: dict) -> dict:
+    """
+    Returns the metadata of a logged entry: the entry without its deltas, but with their number of "added", "updated" and "deleted" entries
+    """
+
+    meta = {key: value for key, value in entry.items() if key != "ops"}
+    for label, op in [("added", "add"), ("updated", "update"), ("deleted", "delete")]:
+        meta[label] = sum(o["op"] == op for o in entry["ops"])
+    return meta
+
+
+def _add(hist: dict, entry: dict) -> None:
+    """
+    Adds a logged entry to a history, dropping the deltas in memory at each snapshot, which holds them. Must be called with the lock held.
+
+    Args:
+        hist (dict): history of user, see _load()
+        entry (dict): logged entry, see _entry()
+
+    Returns:
+        None
+    """
+
+    version = entry["version"]
+    hist["index"][version] = _meta(entry)
+    if version % SNAPSHOT_EVERY == 0:
+        hist["since"] = version
+        hist["ops"] = {}
+    else:
+        hist["ops"][version] = entry["ops"]
+    _push(hist, entry)
+
+
+def _logged(usr_name: str, first: int, last: int) -> list[dict]:
+    """
+    Reads the deltas of versions (first, last] from a user's log, for versions whose deltas are not kept in memory, see _load()
+
+    The log is append only, so it is read without the lock.
+
+    Args:
+        usr_name (str): name of user
+        first (int): version before the first one to read
+        last (int): last version to read
+
+    Returns:
+        list[dict]: deltas in order of versions
+    """
+
+    return [
+        op
+        for entry in _lines(usr_name)
+        if entry["kind"] not in ("base", "removed") and first < entry["version"] <= last
+        for op in entry["ops"]
+    ]
+
+
+def _snapshot(usr_name: str, version: int, db: pd.DataFrame) -> None:
+    """
+    Saves the full user data of a version in background, as starting point of reads as of later versions
+
+    Args:
+        usr_name (str): name of user
+        version (int): version of db
+        db (pd.DataFrame): user data of that version
+
+    Returns:
+        None
+    """
+
+    writer.save(
+        os.path.join(_dir(usr_name), f"{version}.csv"), db[["date", *METRICS]].copy()
+    )
+
+
+def record(
+    usr_name: str,
+    old: pd.DataFrame,
+    new: pd.DataFrame,
+    kind: str = "edit",
+    current: int | None = None,
+    session: str | None = None,
+    target: int | None = None,
+) -> int | None:
+    """
+    Records a change of user data as deltas in the user's log, under the next version
+
+    The first change also snapshots the data before it, every SNAPSHOT_EVERY versions another snapshot is taken. If the stored data is no longer the last recorded version, e.g. after a sync or an edit by hand, its changes are recorded first, as an "external" entry.
+
+    Args:
+        usr_name (str): name of user
+        old (pd.DataFrame): stored user data before the change
+        new (pd.DataFrame): user data after the change
+        kind (str): "edit" | "undo" | "redo", undo and redo are recorded even without changes, so the stacks move on
+        current (int|None): data version of old, see data.version(), None if it is the last recorded one
+        session (str|None): session making the change, which can undo it, None for changes of no session, e.g. of the ingestion API
+        target (int|None): version undone or redone, see undoable()
+
+    Returns:
+        int | None: new version, None if an edit changed nothing
+    """
+
+    ops = diff(old, new)
+    if not ops and kind == "edit":
+        return None
+
+    histories = _histories()
+    with histories["lock"]:
+        hist = _load(usr_name)
+        lines = []
+        os.makedirs(_dir(usr_name), exist_ok=True)
+
+        # data before the first recorded change
+        if hist["base"] is None:
+            hist["base"] = hist["since"] = hist["version"]
+            lines.append({"version": hist["base"], "kind": "base"})
+            _snapshot(usr_name, hist["base"], old)
+        elif current is not None and current != hist["version"]:
+            # changed outside the app, e.g. by hand, the latest version's deltas are kept in memory
+            snap, replayed = _ops(hist, hist["version"])
+            external = diff(_read(usr_name, snap, replayed), old)
+            if external:
+                lines.append(_entry(hist, old, "external", external))
+
+        lines.append(_entry(hist, new, kind, ops, session, target))
+
+        # append only, a log is never rewritten
+        with open(
+            os.path.join(_dir(usr_name), "log.jsonl"), "a", encoding="utf-8"
+        ) as f:
+            f.write("".join(json.dumps(line) + "\n" for line in lines))
+        hist["log"] = _stat(usr_name)
+        version = hist["version"]
+
+    return version
+
+
+def _entry(
+    hist: dict,
+    db: pd.DataFrame,
+    kind: str,
+    ops: list[dict],
+    session: str | None = None,
+    target: int | None = None,
+) -> dict:
+    """
+    Adds an entry under the next version of a history, and snapshots db if due. Must be called with the lock held.
+
+    Args:
+        hist (dict): history of user, see _load()
+        db (pd.DataFrame): user data after the entry
+        kind (str): "edit" | "undo" | "redo" | "external"
+        ops (list[dict]): deltas, see diff()
+        session (str|None): session making the change, see record()
+        target (int|None): version undone or redone, see record()
+
+    Returns:
+        dict: entry to be logged
+    """
+
+    version = hist["version"] + 1
+    entry = {
+        "version": version,
+        "kind": kind,
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "ops": ops,
+        "session": session,
+    }
+    if target is not None:
+        entry["target"] = target
+
+    hist["version"] = version
+    _add(hist, entry)
+
+    if version % SNAPSHOT_EVERY == 0:
+        _snapshot(hist["name"], version, db)
+
+    return entry
+
+
+def written(usr_name: str, version: int, mtime: int, size: int) -> None:
+    """
+    Persists the recorded version of a user's data file once the writer wrote it, as head of the history, see head()
+
+    Args:
+        usr_name (str): name of user
+        version (int): recorded version of written data
+        mtime (int): modification time of written file in ns
+        size (int): size of written file
+
+    Returns:
+        None
+    """
+
+    path = os.path.join(_dir(usr_name), "head.json")
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": version, "mtime": mtime, "size": size}, f)
+        os.replace(tmp, path)
+    except FileNotFoundError:
+        # user removed meanwhile
+        pass
+
+
+def head(usr_name: str) -> tuple[int, int, int] | None:
+    """
+    Returns the recorded version of a user's data file as last written by the app, in this or another process, see written()
+
+    Args:
+        usr_name (str): name of user
+
+    Returns:
+        tuple[int, int, int] | None: version, modification time in ns and size of the file when written, None if never written
+    """
+
+    path = os.path.join(_dir(usr_name), "head.json")
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    key = (stat.st_mtime_ns, stat.st_size)
+
+    histories = _histories()
+    with histories["lock"]:
+        kept = histories["heads"].get(usr_name)
+    if kept is not None and kept[0] == key:
+        return kept[1]
+
+    try:
+        with open(path, encoding="utf-8") as f:
+            saved = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    found = (saved["version"], saved["mtime"], saved["size"])
+    with histories["lock"]:
+        histories["heads"][usr_name] = (key, found)
+    return found
+
+
+def undoable(
+    usr_name: str, kind: str = "undo", session: str | None = None
+) -> tuple[int, list[dict]] | None:
+    """
+    Returns the deltas which undo the last change of a session, or redo the last one it undid
+
+    Changes of other sessions and of the ingestion API are skipped, so they are never reverted by this session.
+
+    Args:
+        usr_name (str): name of user
+        kind (str): "undo" | "redo"
+        session (str|None): session undoing or redoing, see record()
+
+    Returns:
+        tuple[int, list[dict]] | None: version undone or redone, and deltas to apply and record as kind, see apply() and record(), None if there is nothing to undo or redo
+    """
+
+    if session is None:
+        return None
+
+    histories = _histories()
+    with histories["lock"]:
+        hist = _load(usr_name)
+        own = [v for v in hist[kind] if hist["index"][v].get("session") == session]
+        if not own:
+            return None
+        ops = hist["ops"].get(own[-1])
+
+    if ops is None:
+        ops = _logged(usr_name, own[-1] - 1, own[-1])
+    return own[-1], invert(ops)
+
+
+def replay(usr_name: str, version: int) -> pd.DataFrame:
+    """
+    Reconstructs user data as of a version, from the nearest snapshot before it and the deltas since
+
+    Args:
+        usr_name (str): name of user
+        version (int): recorded version, see log()
+
+    Raises:
+        ValueError: if the version is not recorded
+
+    Returns:
+        pd.DataFrame: user data with "date" and METRICS, sorted by date, without outlier flags
+    """
+
+    histories = _histories()
+    with histories["lock"]:
+        hist = _load(usr_name)
+        if hist["base"] is None or not hist["base"] <= version <= hist["version"]:
+            raise ValueError(f"version {version} of '{usr_name}' is not recorded")
+        snap, ops = _ops(hist, version)
+
+    if ops is None:
+        ops = _logged(usr_name, snap, version)
+    return _read(usr_name, snap, ops)
+
+
+def _ops(hist: dict, version: int) -> tuple[int, list[dict] | None]:
+    """
+    Returns the nearest snapshot before a recorded version and the deltas since. Must be called with the lock held.
+
+    Args:
+        hist (dict): history of user, see _load()
+        version (int): recorded version
+
+    Returns:
+        tuple[int, list[dict] | None]: version of snapshot, and deltas to apply to it, None if they are not kept in memory, see _logged()
+    """
+
+    snap = max(hist["base"], version - version % SNAPSHOT_EVERY)
+    if snap < hist["since"]:
+        return snap, None
+    return snap, [op for v in range(snap + 1, version + 1) for op in hist["ops"][v]]
+
+
+def _read(usr_name: str, snap: int, ops: list[dict]) -> pd.DataFrame:
+    """
+    Reads a snapshot and applies deltas to it, see _ops()
+
+    Args:
+        usr_name (str): name of user
+        snap (int): version of snapshot
+        ops (list[dict]): deltas
+
+    Returns:
+        pd.DataFrame: user data with "date" and METRICS, sorted by date
+    """
+
+    # snapshot may still be pending
+    path = os.path.join(_dir(usr_name), f"{snap}.csv")
+    queued = writer.pending(path)
+    if queued is not None:
+        db = queued[1]
+    else:
+        db = pd.read_csv(path)
+        db["date"] = pd.to_datetime(db["date"], format="ISO8601")
+
+    return apply(db, ops)
+
+
+def log(usr_name: str) -> pd.DataFrame:
+    """
+    Lists the recorded versions of a user, newest first
+
+    Args:
+        usr_name (str): name of user
+
+    Returns:
+        pd.DataFrame: one row per version, with "version", "time", "kind" and number of entries "added", "updated" and "deleted"
+    """
+
+    histories = _histories()
+    with histories["lock"]:
+        hist = _load(usr_name)
+        entries = [hist["index"][v] for v in sorted(hist["index"], reverse=True)]
+        base = hist["base"]
+
+    rows = [
+        {
+            "version": e["version"],
+            "time": pd.Timestamp(e["time"]),
+            "kind": e["kind"],
+            "added": e["added"],
+            "updated": e["updated"],
+            "deleted": e["deleted"],
+        }
+        for e in entries
+    ]
+    if base is not None:
+        rows.append({"version": base, "kind": "base"})
+
+    return pd.DataFrame(
+        rows, columns=["version", "time", "kind", "added", "updated", "deleted"]
+    ).astype({"added": "Int64", "updated": "Int64", "deleted": "Int64"})
+
+
+def remove(usr_name: str) -> None:
+    """
+    Removes the history of a deleted user
+
+    The version number is kept in an otherwise empty log, so a new user of the same name never reuses the versions, and thus cache entries, of the deleted one, also after a restart.
+
+    Args:
+        usr_name (str): name of user
+
+    Returns:
+        None
+    """
+
+    # snapshots may still be pending
+    writer.flush()
+
+    histories = _histories()
+    with histories["lock"]:
+        version = _load(usr_name)["version"]
+        histories["users"][usr_name] = _empty(usr_name, version)
+        shutil.rmtree(_dir(usr_name), ignore_errors=True)
+        os.makedirs(_dir(usr_name), exist_ok=True)
+        with open(
+            os.path.join(_dir(usr_name), "log.jsonl"), "w", encoding="utf-8"
+        ) as f:
+            f.write(json.dumps({"version": version, "kind": "removed"}) + "\n")
+        histories["users"][usr_name]["log"] = _stat(usr_name)
@@ -0,0 +1,242 @@
+import os
+import json
+import math
+import time
+import queue
+import logging
+import threading
+import pandas as pd
+import streamlit as st
+from dateutil import tz
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import functions.data as data
+import functions.user as user
+import functions.schema as schema
+
+log = logging.getLogger("OnTheScales.ingest")
+
+# address of ingestion API, local only
+HOST = "127.0.0.1"
+PORT = int(os.environ.get("ONTHESCALES_INGEST_PORT", 8502))
+
+# time to collect pushes into one batch, in seconds
+BATCH_SECONDS = 0.25
+
+# largest request body accepted, in bytes
+MAX_BODY = 1024 * 1024
+
+# validated measurements waiting to be committed: (user name, rows)
+_queue: queue.Queue = queue.Queue()
+
+
+class _QuietThreads(logging.Filter):
+    """
+    Drops streamlit's warning about a missing session for the threads of this module, which use the shared caches on purpose
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return not threading.current_thread().name.startswith("OnTheScales-ingest")
+
+
+def validate(payload: dict | list) -> dict[str, list[dict]]:
+    """
+    Validates pushed measurements against the columns of data.create_df()
+
+    A payload is a single measurement with "user", or {"user": ..., "measurements": [...]}, or a list of either.
+
+    Args:
+        payload (dict | list): parsed JSON body
+
+    Raises:
+        ValueError: if a measurement is incomplete, out of range, or for an unknown user
+
+    Returns:
+        dict[str, list[dict]]: measurements by user name, dates floored to minutes and values rounded as in the form
+    """
+
+    items = payload if isinstance(payload, list) else [payload]
+    names = set(user.load_db()["name"])
+
+    rows: dict[str, list[dict]] = {}
+    for item in items:
+        if not isinstance(item, dict) or "user" not in item:
+            raise ValueError("each item needs a 'user'")
+        if item["user"] not in names:
+            raise ValueError(f"unknown user '{item['user']}'")
+
+        for m in item.get("measurements", [item]):
+            if not isinstance(m, dict):
+                raise ValueError("measurements must be objects")
+
+            try:
+                date = pd.Timestamp(m["date"]).floor("min")
+            except (KeyError, TypeError, ValueError):
+                raise ValueError("each measurement needs a valid 'date'")
+            # local wall time, as entered in the form
+            if date.tzinfo is not None:
+                date = date.tz_convert(tz.tzlocal()).tz_localize(None)
+
+            row = {"date": date}
+            for col, (lo, hi) in schema.RANGES.items():
+                val = m.get(col)
+                if (
+                    isinstance(val, bool)
+                    or not isinstance(val, (int, float))
+                    or not math.isfinite(val)
+                    or not lo <= val <= hi
+                ):
+                    raise ValueError(f"'{col}' must be a number within [{lo}, {hi}]")
+                row[col] = round(float(val), 1)
+
+            rows.setdefault(item["user"], []).append(row)
+
+    return rows
+
+
+def commit(batch: dict[str, list[dict]]) -> None:
+    """
+    Stores a batch of measurements, with one sort and save per user
+
+    Args:
+        batch (dict[str, list[dict]]): measurements by user name, see validate()
+
+    Returns:
+        None
+    """
+
+    users = user.load_db().set_index("name")
+    for name, rows in batch.items():
+        if name not in users.index:
+            log.warning("dropped %d measurements of deleted user '%s'", len(rows), name)
+            continue
+
+        usr = users.loc[name]
+        data.merge(
+            name,
+            pd.DataFrame(rows, columns=["date", *schema.RANGES]),
+            usr["trend_how"],
+            usr["trend_start"],
+            usr["trend_range"],
+        )
+        log.info("stored %d measurements of user '%s'", len(rows), name)
+
+
+def _run() -> None:
+    """
+    Loop of committer thread: collects queued measurements for BATCH_SECONDS, then commits them as one batch
+
+    Returns:
+        None
+    """
+
+    while True:
+        batch: dict[str, list[dict]] = {}
+        name, rows = _queue.get()
+        batch.setdefault(name, []).extend(rows)
+        count = 1
+
+        # collect everything pushed within the batch window
+        end = time.monotonic() + BATCH_SECONDS
+        while (left := end - time.monotonic()) > 0:
+            try:
+                name, rows = _queue.get(timeout=left)
+            except queue.Empty:
+                break
+            batch.setdefault(name, []).extend(rows)
+            count += 1
+
+        try:
+            commit(batch)
+        except Exception:
+            log.exception("committing batch failed")
+        finally:
+            for _ in range(count):
+                _queue.task_done()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    Accepts measurements as JSON: POST /measurements
+    """
+
+    def setup(self) -> None:
+        # named like the other threads of this module, see _QuietThreads
+        threading.current_thread().name = "OnTheScales-ingest-request"
+        super().setup()
+
+    def do_POST(self) -> None:
+        if self.path.rstrip("/") != "/measurements":
+            return self._reply(404, {"error": "not found"})
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            return self._reply(400, {"error": "invalid Content-Length"})
+        if length > MAX_BODY:
+            return self._reply(413, {"error": "request too large"})
+
+        try:
+            rows = validate(json.loads(self.rfile.read(length)))
+        except json.JSONDecodeError:
+            return self._reply(400, {"error": "invalid JSON"})
+        except ValueError as e:
+            return self._reply(400, {"error": str(e)})
+
+        for name, user_rows in rows.items():
+            _queue.put((name, user_rows))
+        self._reply(202, {"queued": sum(len(r) for r in rows.values())})
+
+    def _reply(self, status: int, body: dict) -> None:
+        text = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(text)))
+        self.end_headers()
+        self.wfile.write(text)
+
+    def log_message(self, format: str, *args) -> None:
+        log.debug(format, *args)
+
+
+@st.cache_resource(show_spinner=False)
+def start(port: int = PORT) -> ThreadingHTTPServer | None:
+    """
+    Starts the ingestion API and its committer thread, once per process for all sessions
+
+    Args:
+        port (int): local port to listen on
+
+    Returns:
+        ThreadingHTTPServer | None: running server, None if the port is taken
+    """
+
+    logging.getLogger(
+        "streamlit.runtime.scriptrunner_utils.script_run_context"
+    ).addFilter(_QuietThreads())
+
+    try:
+        server = ThreadingHTTPServer((HOST, port), _Handler)
+    except OSError:
+        log.warning("ingestion API not started, port %d is taken", port)
+        return None
+    server.daemon_threads = True
+
+    threading.Thread(target=_run, name="OnTheScales-ingest-commit", daemon=True).start()
+    threading.Thread(
+        target=server.serve_forever, name="OnTheScales-ingest-http", daemon=True
+    ).start()
+    log.info("ingestion API listening on http://%s:%d/measurements", HOST, port)
+    return server
+
+
+def flush() -> None:
+    """
+    Blocks until all queued measurements are committed
+
+    Returns:
+        None
+    """
+
+    _queue.join()
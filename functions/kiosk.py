@@ -0,0 +1,92 @@
+import os
+import sys
+import logging
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger("OnTheScales.kiosk")
+
+# low-memory mode, e.g. for a Raspberry Pi, switched on by ONTHESCALES_KIOSK=1
+ENABLED = os.environ.get("ONTHESCALES_KIOSK", "0").lower() not in ("", "0", "false")
+
+# memory ceiling of the app process in MB, shared caches are dropped above it
+MEMORY_MB = int(os.environ.get("ONTHESCALES_MEMORY_MB", 300))
+
+# recent days of each user's daily data drawn in the charts of measurements, trends use all days
+WINDOW_DAYS = int(os.environ.get("ONTHESCALES_WINDOW_DAYS", 365))
+
+# entries per shared cache, least recently used ones are evicted first
+CACHE_ENTRIES = 8
+
+# points per line of a chart
+MAX_POINTS = 400
+
+
+def entries(n: int) -> int:
+    """
+    Returns the number of entries of a shared cache, capped in kiosk mode
+
+    Args:
+        n (int): number of entries in normal mode
+
+    Returns:
+        int: number of entries
+    """
+
+    return min(n, CACHE_ENTRIES) if ENABLED else n
+
+
+def window(db: pd.DataFrame) -> np.ndarray:
+    """
+    Positions of the rows drawn in a chart of daily data: those of the recent WINDOW_DAYS, thinned to MAX_POINTS, see points(), in kiosk mode only
+
+    Args:
+        db (pd.DataFrame): daily data, see data.daily()
+
+    Returns:
+        np.ndarray: positions of rows, ascending
+    """
+
+    if not ENABLED or db.shape[0] == 0:
+        return np.arange(db.shape[0])
+
+    dates = db["date"].values
+    first = int(
+        np.searchsorted(dates, dates[-1] - np.timedelta64(WINDOW_DAYS, "D"), "right")
+    )
+    return first + points(db.shape[0] - first)
+
+
+def points(n: int) -> np.ndarray:
+    """
+    Positions of the rows shown in a chart of n rows: all, or MAX_POINTS evenly spaced ones incl. first and last in kiosk mode
+
+    Args:
+        n (int): number of rows
+
+    Returns:
+        np.ndarray: positions of rows, ascending
+    """
+
+    if not ENABLED or n <= MAX_POINTS:
+        return np.arange(n)
+    return np.unique(np.linspace(0, n - 1, MAX_POINTS).round().astype(int))
+
+
+def memory_mb() -> float:
+    """
+    Returns the resident memory of the process in MB, or its peak if the current one is unknown
+
+    Returns:
+        float: memory in MB
+    """
+
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # bytes on macOS, KB elsewhere
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
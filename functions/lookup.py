@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+from datetime import date, datetime
+
+# values used to fill in the form when no measurement exists
+DEFAULTS = {"weight": 80.0, "fat": 25.0, "water": 50.0, "muscle": 25.0}
+
+
+def day_range(db: pd.DataFrame, day: date) -> tuple[int, int]:
+    """
+    Finds the rows of a given day in date-sorted user data by binary search
+
+    Args:
+        db (pd.DataFrame): user data, sorted by date
+        day (date): day to look up
+
+    Returns:
+        tuple[int, int]: positions [first, last + 1) of the rows on that day, first == last + 1 if there are none
+    """
+
+    dates = db["date"].values
+    start = np.datetime64(day, "D").astype(dates.dtype)
+    first = np.searchsorted(dates, start, "left")
+    end = np.searchsorted(dates, start + np.timedelta64(1, "D"), "left")
+    return int(first), int(end)
+
+
+def exists(db: pd.DataFrame, day: date) -> bool:
+    """
+    Checks whether a measurement exists on a given day
+
+    Args:
+        db (pd.DataFrame): user data, sorted by date
+        day (date): day to look up
+
+    Returns:
+        bool: True if there is a measurement on that day
+    """
+
+    if db.shape[0] == 0:
+        return False
+
+    first, end = day_range(db, day)
+    return end > first
+
+
+def find(db: pd.DataFrame, when: datetime) -> int | None:
+    """
+    Finds the measurement taken at a given time
+
+    Args:
+        db (pd.DataFrame): user data, sorted by date
+        when (datetime): date and time to look up
+
+    Returns:
+        int | None: position of the measurement, None if there is none
+    """
+
+    if db.shape[0] == 0:
+        return None
+
+    dates = db["date"].values
+    pos = int(np.searchsorted(dates, np.datetime64(when).astype(dates.dtype), "left"))
+    return pos if pos < db.shape[0] and dates[pos] == np.datetime64(when) else None
+
+
+def latest(db: pd.DataFrame, day: date) -> int | None:
+    """
+    Finds the latest measurement on or before a given day
+
+    Args:
+        db (pd.DataFrame): user data, sorted by date
+        day (date): day to look up
+
+    Returns:
+        int | None: position of the measurement, None if there is none
+    """
+
+    if db.shape[0] == 0:
+        return None
+
+    _, end = day_range(db, day)
+    return end - 1 if end > 0 else None
+
+
+def neighbours(db: pd.DataFrame, day: date) -> tuple[int | None, int | None]:
+    """
+    Finds the nearest measurements before and after a given day
+
+    Args:
+        db (pd.DataFrame): user data, sorted by date
+        day (date): day to look up
+
+    Returns:
+        tuple[int | None, int | None]: positions of the last measurement before and the first measurement after that day, None if there is none
+    """
+
+    if db.shape[0] == 0:
+        return None, None
+
+    first, end = day_range(db, day)
+    return (
+        first - 1 if first > 0 else None,
+        end if end < db.shape[0] else None,
+    )
+
+
+def prefill(db: pd.DataFrame, day: date) -> dict:
+    """
+    Returns the values to fill in the measurement form for a given day
+
+    These are the values of the latest measurement on or before that day. If the day is before all measurements, the first measurement is used, and if there are no measurements at all, the defaults.
+
+    Args:
+        db (pd.DataFrame): user data, sorted by date
+        day (date): day to look up
+
+    Returns:
+        dict: values of "weight", "fat", "water" and "muscle"
+    """
+
+    if db.shape[0] == 0:
+        return dict(DEFAULTS)
+
+    pos = latest(db, day)
+    row = db.iloc[0 if pos is None else pos]
+    return {col: row[col] for col in DEFAULTS}
@@ -0,0 +1,160 @@
+import math
+import threading
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# metrics checked, with the least standard deviation assumed for each, in kg or %
+METRICS = {"weight": 0.3, "fat": 0.5, "water": 0.5, "muscle": 0.5}
+
+# smoothing of running mean and variance
+ALPHA = 0.3
+
+# variance added per day between measurements, as values drift over time
+DRIFT = 0.01
+
+# number of measurements before values are scored
+WARMUP = 5
+
+# distance from running mean, in standard deviations, beyond which a value is flagged
+THRESHOLD = 4.0
+
+
+def init() -> dict:
+    """
+    Returns the state of the detector before any measurement
+
+    Returns:
+        dict: date of last measurement, and running mean, variance and count per metric
+    """
+
+    return {"date": None, **{m: [0.0, 0.0, 0] for m in METRICS}}
+
+
+def copy(state: dict) -> dict:
+    """
+    Copies a detector state, so it can be updated without changing the original
+
+    Args:
+        state (dict): detector state, see init()
+
+    Returns:
+        dict: copy of state
+    """
+
+    return {"date": state["date"], **{m: list(state[m]) for m in METRICS}}
+
+
+def update(state: dict, row: dict) -> bool:
+    """
+    Scores a measurement against the running statistics and updates them, in O(1)
+
+    A flagged value moves the statistics only as far as the threshold, so a single bad reading does not distort them, while a lasting change is followed within some measurements.
+
+    Args:
+        state (dict): detector state, see init(), updated in place
+        row (dict): measurement with "date" and all METRICS
+
+    Returns:
+        bool: True if any metric is an outlier
+    """
+
+    days = 0.0
+    if state["date"] is not None:
+        days = max(0.0, (row["date"] - state["date"]) / pd.Timedelta(days=1))
+    state["date"] = row["date"]
+
+    flagged = False
+    for metric, floor in METRICS.items():
+        mean, var, count = state[metric]
+        x = float(row[metric])
+
+        if count == 0:
+            state[metric] = [x, 0.0, 1]
+            continue
+
+        # score against running statistics, widened by time since last measurement
+        sd = math.sqrt(var + floor**2 + DRIFT * days)
+        if count >= WARMUP and abs(x - mean) > THRESHOLD * sd:
+            flagged = True
+
+        # update running statistics with clipped deviation
+        delta = min(max(x - mean, -THRESHOLD * sd), THRESHOLD * sd)
+        mean += ALPHA * delta
+        var = (1 - ALPHA) * (var + ALPHA * delta**2)
+        state[metric] = [mean, var, count + 1]
+
+    return flagged
+
+
+def scan(db: pd.DataFrame) -> tuple[np.ndarray, dict]:
+    """
+    Runs the detector over all measurements, used for files without flags or after changes within the history
+
+    Args:
+        db (pd.DataFrame): user data, sorted by date
+
+    Returns:
+        tuple[np.ndarray, dict]: flag per measurement, and detector state after the last one
+    """
+
+    state = init()
+    flags = np.array(
+        [update(state, row) for row in db[["date", *METRICS]].to_dict("records")],
+        dtype=bool,
+    )
+    return flags, state
+
+
+@st.cache_resource(show_spinner=False)
+def _states() -> dict:
+    """
+    Detector states of all users, shared by all sessions
+
+    Returns:
+        dict: {"lock": threading.Lock, "users": dict of (data version, state) by user name}
+    """
+
+    return {"lock": threading.Lock(), "users": {}}
+
+
+def state(usr_name: str, version: int, db: pd.DataFrame) -> dict:
+    """
+    Returns the detector state after the last measurement of a user, scanning the data only if no state of that version is kept
+
+    Args:
+        usr_name (str): name of user
+        version (int): data version of db, see data.version()
+        db (pd.DataFrame): user data of that version, sorted by date
+
+    Returns:
+        dict: copy of detector state
+    """
+
+    states = _states()
+    with states["lock"]:
+        kept = states["users"].get(usr_name)
+    if kept is not None and kept[0] == version:
+        return copy(kept[1])
+
+    _, found = scan(db)
+    keep(usr_name, version, found)
+    return copy(found)
+
+
+def keep(usr_name: str, version: int, state: dict) -> None:
+    """
+    Keeps the detector state of a user's data version, for the next measurement
+
+    Args:
+        usr_name (str): name of user
+        version (int): data version, see data.version()
+        state (dict): detector state after the last measurement of that version
+
+    Returns:
+        None
+    """
+
+    states = _states()
+    with states["lock"]:
+        states["users"][usr_name] = (version, copy(state))
@@ -0,0 +1,87 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable
+import pandas as pd
+import streamlit as st
+import functions.kiosk as kiosk
+
+# rows of user data kept for recently used users, least recently used users are dropped first
+ROWS = 100_000 if kiosk.ENABLED else 1_000_000
+
+
+@st.cache_resource(show_spinner=False)
+def _recent() -> dict:
+    """
+    Recently used users, shared by all sessions
+
+    Returns:
+        dict: {"lock": threading.Lock, "users": OrderedDict of {"version", "rows", "items"} by user name, least recently used first}
+    """
+
+    return {"lock": threading.Lock(), "users": OrderedDict()}
+
+
+def get(
+    usr_name: str,
+    version: int,
+    key: Any,
+    build: Callable[[], Any],
+) -> Any:
+    """
+    Returns an artifact of a recently used user, e.g. user data or a figure, building it only if not kept for this data version
+
+    All artifacts of a user are dropped once the user's data version changes, i.e. on every write. The user is marked as most recently used; if the dataframes kept hold more than ROWS rows in total, the least recently used users are dropped, the given user is always kept.
+
+    Args:
+        usr_name (str): name of user
+        version (int): data version of user, see data.version()
+        key (Any): hashable key of artifact, incl. all settings it depends on
+        build (Callable[[], Any]): builds the artifact if not kept
+
+    Returns:
+        Any: artifact, shared and must not be changed
+    """
+
+    recent = _recent()
+    with recent["lock"]:
+        kept = recent["users"].get(usr_name)
+        if kept is not None and kept["version"] == version and key in kept["items"]:
+            recent["users"].move_to_end(usr_name)
+            return kept["items"][key]
+
+    # built without the lock, other users stay available meanwhile
+    item = build()
+
+    with recent["lock"]:
+        users = recent["users"]
+        kept = users.get(usr_name)
+        if kept is None or kept["version"] != version:
+            kept = users[usr_name] = {"version": version, "rows": 0, "items": {}}
+        if key not in kept["items"] and isinstance(item, pd.DataFrame):
+            kept["rows"] += item.shape[0]
+        kept["items"][key] = item
+        users.move_to_end(usr_name)
+
+        while len(users) > 1 and sum(u["rows"] for u in users.values()) > ROWS:
+            users.popitem(last=False)
+
+    return item
+
+
+def forget(usr_name: str | None = None) -> None:
+    """
+    Drops the artifacts of a user, e.g. a deleted one, or of all users
+
+    Args:
+        usr_name (str | None): name of user, all users if None
+
+    Returns:
+        None
+    """
+
+    recent = _recent()
+    with recent["lock"]:
+        if usr_name is None:
+            recent["users"].clear()
+        else:
+            recent["users"].pop(usr_name, None)
@@ -0,0 +1,387 @@
+import os
+import sys
+import json
+import pickle
+import hashlib
+import logging
+import argparse
+import multiprocessing
+import numpy as np
+import pandas as pd
+from html import escape
+from concurrent.futures import ProcessPoolExecutor
+import streamlit.logger as st_logger
+import functions.data as data
+import functions.user as user
+import functions.figures as fgs
+import functions.forecast as forecast
+import functions.smoothing as smoothing
+
+log = logging.getLogger("OnTheScales.report")
+
+# default directory of reports
+OUT_DIR = "reports"
+
+# sub-directory of intermediates kept between runs
+CACHE_DIR = ".cache"
+
+# share of bootstrapped models within the reported interval of the target date
+LEVEL = 0.8
+
+
+def _number(x: float, digits: int = 2) -> float | None:
+    """
+    Rounds a number for JSON, None if not finite
+    """
+
+    return round(float(x), digits) if np.isfinite(x) else None
+
+
+def analyse(
+    db: pd.DataFrame,
+    usr: dict,
+    daily_how: str = "first",
+    outlier: str = "highlight",
+    smooth: str = "off",
+) -> tuple[pd.DataFrame, pd.DataFrame, dict]:
+    """
+    Computes the intermediates of a report, which do not depend on the target weight: daily series, trend window and fitted model
+
+    Args:
+        db (pd.DataFrame): user data, see data.parse()
+        usr (dict): row of user database, with "trend_how", "trend_start" and "trend_range"
+        daily_how (str): aggregation of measurements per day, see data.daily()
+        outlier (str): handling of outliers, see data.daily()
+        smooth (str): smoothing of weights the trend is fitted on, "off" | "ewma" | "kalman"
+
+    Returns:
+        tuple[pd.DataFrame, pd.DataFrame, dict]: daily data, measurements within the trend window, and fitted model, see figures.fit()
+    """
+
+    daily = data.aggregate(db, daily_how, outlier)
+    if daily.shape[0] < 2:
+        return daily, None, None
+
+    # weights to fit on, smoothed if so selected
+    daily = daily.assign(
+        input=daily["weight"] if smooth == "off" else smoothing.smooth(daily, smooth)
+    )
+    window, model = fgs.fit(
+        daily, usr["trend_how"], usr["trend_start"], usr["trend_range"]
+    )
+    return daily, window, model
+
+
+def summarize(
+    daily: pd.DataFrame, window: pd.DataFrame | None, model: dict | None, usr: dict
+) -> dict:
+    """
+    Summarizes the trend, the predicted target date and the body composition of a user
+
+    Args:
+        daily (pd.DataFrame): daily data, see analyse()
+        window (pd.DataFrame|None): measurements within the trend window, None if too few measurements
+        model (dict|None): fitted model, None if too few measurements
+        usr (dict): row of user database
+
+    Returns:
+        dict: summary of user, JSON serializable
+    """
+
+    summary = {"name": usr["name"], "target": float(usr["target"])}
+    if daily.shape[0] == 0:
+        return summary
+
+    last = daily.iloc[-1]
+    summary["measurements"] = {
+        "days": int(daily.shape[0]),
+        "first": daily["date"].iloc[0].date().isoformat(),
+        "last": last["date"].date().isoformat(),
+        "weight": float(last["weight"]),
+    }
+
+    # body composition, latest and change within trend window
+    first = daily.iloc[0] if window is None else window.iloc[0]
+    summary["composition"] = {
+        var: {
+            "percent": _number(last[var], 1),
+            "kg": _number(last["weight"] * last[var] / 100, 1),
+            "change": _number(last[var] - first[var], 1),
+        }
+        for var in ["fat", "water", "muscle"]
+    }
+
+    if model is None:
+        return summary
+
+    summary["trend"] = {
+        "model": model["model"],
+        "since": window["date"].iloc[0].date().isoformat(),
+        "kg_week": _number(model["slope"] * 7),
+        "kg_month": _number(model["slope"] * 30),
+    }
+
+    # target date, with interval of bootstrapped models
+    pred = fgs.eta(window, model, usr["target"])
+    lo, hi = forecast.interval(pred["reach"], LEVEL)
+    date = last["date"]
+    summary["eta"] = {
+        "towards_target": bool(pred["reached"]),
+        "date": (
+            (date + pd.Timedelta(days=pred["days"])).date().isoformat()
+            if np.isfinite(pred["days"])
+            else None
+        ),
+        "days": _number(pred["days"], 0),
+        f"{LEVEL:.0%}": [
+            (date + pd.Timedelta(days=d)).date().isoformat() if np.isfinite(d) else None
+            for d in (lo, hi)
+        ],
+    }
+
+    return summary
+
+
+def render(
+    summary: dict,
+    daily: pd.DataFrame,
+    window: pd.DataFrame | None,
+    model: dict | None,
+) -> str:
+    """
+    Renders the report of a user as static HTML page, with trend and body composition figures
+
+    The figures expect plotly.min.js next to the page, see run().
+
+    Args:
+        summary (dict): summary of user, see summarize()
+        daily (pd.DataFrame): daily data, see analyse()
+        window (pd.DataFrame|None): measurements within the trend window
+        model (dict|None): fitted model
+
+    Returns:
+        str: HTML page
+    """
+
+    def rows(d: dict) -> str:
+        return "".join(
+            f"<tr><th>{escape(str(k))}</th><td>{escape(str(v))}</td></tr>"
+            for k, v in d.items()
+        )
+
+    name = escape(summary["name"])
+    parts = [f"<h1>{name}</h1>", f"<p>target: {summary['target']} kg</p>"]
+    if "measurements" not in summary:
+        parts.append("<p><i>No measurements stored yet.</i></p>")
+    else:
+        parts.append("<h2>measurements</h2><table>")
+        parts.append(rows(summary["measurements"]) + "</table>")
+    if "trend" in summary:
+        parts.append("<h2>trend & predict</h2><table>")
+        parts.append(rows({**summary["trend"], **summary["eta"]}) + "</table>")
+        parts.append(
+            fgs.trend(window, model, summary["target"]).to_html(
+                full_html=False, include_plotlyjs="directory"
+            )
+        )
+    if "composition" in summary:
+        parts.append("<h2>body composition</h2><table>")
+        parts.append(
+            rows(
+                {
+                    k: f"{v['percent']} % ({v['kg']} kg), change {v['change']} %"
+                    for k, v in summary["composition"].items()
+                }
+            )
+            + "</table>"
+        )
+        parts.append(
+            fgs.body_comp(daily, summary["target"], "%", "lines", False).to_html(
+                full_html=False, include_plotlyjs=False
+            )
+        )
+
+    return (
+        "<!DOCTYPE html><html><head><meta charset='utf-8'>"
+        f"<title>OnTheScales - {name}</title></head><body>"
+        + "".join(parts)
+        + "</body></html>"
+    )
+
+
+def build(usr: dict, settings: dict, out: str, fmt: str) -> tuple[str, str]:
+    """
+    Writes the report of one user, reusing the intermediates of the previous run if data and settings are unchanged
+
+    Runs in a worker process, so it only depends on files, not on the app's caches.
+
+    Args:
+        usr (dict): row of user database
+        settings (dict): "daily_how", "outlier" and "smooth", see analyse()
+        out (str): directory of reports
+        fmt (str): format of report, "json" | "html"
+
+    Returns:
+        tuple[str, str]: name of user, and "unchanged" | "updated" | "rebuilt" for a report taken as is, with intermediates reused, or computed afresh
+    """
+
+    path = os.path.join("data", usr["name"] + ".csv")
+    with open(path, "rb") as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+
+    # intermediates depend on data and settings, the report also on target and format
+    key = (
+        digest,
+        str(usr["trend_how"]),
+        str(usr["trend_start"]),
+        int(usr["trend_range"]),
+        *sorted(settings.items()),
+    )
+    report = os.path.join(out, f"{usr['name']}.{fmt}")
+    cache = os.path.join(out, CACHE_DIR, usr["name"] + ".pkl")
+    try:
+        with open(cache, "rb") as f:
+            kept = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        kept = {}
+
+    if kept.get("key") == key:
+        if kept.get("report") == (float(usr["target"]), fmt) and os.path.exists(report):
+            return usr["name"], "unchanged"
+        status = "updated"
+        daily, window, model = kept["daily"], kept["window"], kept["model"]
+    else:
+        status = "rebuilt"
+        daily, window, model = analyse(data.parse(path), usr, **settings)
+
+    summary = summarize(daily, window, model, usr)
+    if fmt == "json":
+        text = json.dumps(summary, indent=2)
+    else:
+        text = render(summary, daily, window, model)
+    with open(report, "w", encoding="utf-8") as f:
+        f.write(text)
+
+    with open(cache, "wb") as f:
+        pickle.dump(
+            dict(
+                key=key,
+                report=(float(usr["target"]), fmt),
+                daily=daily,
+                window=window,
+                model=model,
+            ),
+            f,
+        )
+    return usr["name"], status
+
+
+def run(
+    users: pd.DataFrame,
+    out: str = OUT_DIR,
+    fmt: str = "json",
+    jobs: int | None = None,
+    **settings,
+) -> dict:
+    """
+    Writes the reports of all users, in parallel in a process pool if more than one
+
+    Errors of single users are logged and skipped.
+
+    Args:
+        users (pd.DataFrame): user database, see user.load_db()
+        out (str): directory of reports
+        fmt (str): format of reports, "json" | "html"
+        jobs (int|None): number of worker processes, defaults to number of CPUs
+        **settings: "daily_how", "outlier" and "smooth", see analyse()
+
+    Returns:
+        dict: status of report by user name, see build(), "failed" on errors
+    """
+
+    settings = {
+        "daily_how": "first",
+        "outlier": "highlight",
+        "smooth": "off",
+        **settings,
+    }
+    os.makedirs(os.path.join(out, CACHE_DIR), exist_ok=True)
+
+    # plotly.js once for all html reports, so they work offline
+    if fmt == "html" and not os.path.exists(os.path.join(out, "plotly.min.js")):
+        from plotly.offline import get_plotlyjs
+
+        with open(os.path.join(out, "plotly.min.js"), "w", encoding="utf-8") as f:
+            f.write(get_plotlyjs())
+
+    records = users.to_dict("records")
+    status = {}
+    if len(records) > 1 and jobs != 1:
+        ctx = multiprocessing.get_context(
+            "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+        )
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=ctx) as pool:
+            futures = {
+                usr["name"]: pool.submit(build, usr, settings, out, fmt)
+                for usr in records
+            }
+            for name, future in futures.items():
+                try:
+                    status[name] = future.result()[1]
+                except Exception:
+                    log.exception("report failed for user '%s'", name)
+                    status[name] = "failed"
+    else:
+        for usr in records:
+            try:
+                status[usr["name"]] = build(usr, settings, out, fmt)[1]
+            except Exception:
+                log.exception("report failed for user '%s'", usr["name"])
+                status[usr["name"]] = "failed"
+
+    return status
+
+
+if __name__ == "__main__":
+    # usage: python -m functions.report [-f json|html] [-o reports] [user ...]
+    parser = argparse.ArgumentParser(
+        prog="python -m functions.report",
+        description="Writes a report per user: trend, predicted target date and body composition.",
+    )
+    parser.add_argument("users", nargs="*", help="users to report, defaults to all")
+    parser.add_argument("-f", "--format", choices=["json", "html"], default="json")
+    parser.add_argument("-o", "--out", default=OUT_DIR, help="directory of reports")
+    parser.add_argument("-j", "--jobs", type=int, help="number of worker processes")
+    parser.add_argument("--daily", choices=["first", "mean", "min"], default="first")
+    parser.add_argument(
+        "--outlier", choices=["highlight", "exclude"], default="highlight"
+    )
+    parser.add_argument("--smooth", choices=["off", "ewma", "kalman"], default="off")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
+    out = os.path.abspath(args.out)
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    # quiet bare-mode warnings of streamlit, there is no session
+    st_logger.set_log_level("error")
+
+    users = user.load_db()
+    if args.users:
+        unknown = set(args.users) - set(users["name"])
+        if unknown:
+            sys.exit(f"unknown users: {', '.join(sorted(unknown))}")
+        users = users[users["name"].isin(args.users)]
+
+    status = run(
+        users,
+        out,
+        args.format,
+        args.jobs,
+        daily_how=args.daily,
+        outlier=args.outlier,
+        smooth=args.smooth,
+    )
+    for name, s in status.items():
+        log.info("%s: %s", name, s)
+    sys.exit(1 if "failed" in status.values() else 0)
@@ -0,0 +1,233 @@
+import os
+import time
+import logging
+import importlib.util
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger("OnTheScales.load")
+
+# columns of user data: dtype, valid range as in the measurement form, optional columns may be missing or empty
+MEASUREMENTS = {
+    "date": {"dtype": "datetime64[ns]"},
+    "weight": {"dtype": "float64", "range": (0.0, 200.0)},
+    "fat": {"dtype": "float64", "range": (0.0, 100.0)},
+    "water": {"dtype": "float64", "range": (0.0, 100.0)},
+    "muscle": {"dtype": "float64", "range": (0.0, 100.0)},
+    "outlier": {"dtype": "boolean", "optional": True},
+}
+
+# valid ranges of measurements, as in the measurement form
+RANGES = {col: spec["range"] for col, spec in MEASUREMENTS.items() if "range" in spec}
+
+# columns of users.csv, ranges as in the user forms
+USERS = {
+    "name": {"dtype": "str"},
+    "height": {"dtype": "int64", "range": (0, 250)},
+    "target": {"dtype": "float64", "range": (0.0, 200.0)},
+    "trend_how": {"dtype": "str", "options": ("date range", "start date")},
+    "trend_start": {"dtype": "datetime64[ns]"},
+    "trend_range": {"dtype": "int64", "range": (1, 100)},
+}
+
+# files from this size on are read by pyarrow, if installed, below its start-up costs more than it saves
+PYARROW_BYTES = 256 * 1024
+PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+# sub-directory of quarantined rows, next to the files they were read from
+QUARANTINE_DIR = "quarantine"
+
+# longest user name, as in the form adding users
+NAME_MAX = 50
+
+
+def valid_name(name: str) -> bool:
+    """
+    Checks a user name: not empty, at most NAME_MAX characters, and usable as file name in the data directory, i.e. without path separators and not taking the place of users.csv
+
+    Args:
+        name (str): name of user
+
+    Returns:
+        bool: whether the name is valid
+    """
+
+    return (
+        isinstance(name, str)
+        and 0 < len(name) <= NAME_MAX
+        and name not in (".", "..")
+        and name.lower() != "users"
+        and not any(c in name for c in ("/", "\\", "\0"))
+    )
+
+
+def _convert(col: pd.Series, dtype: str) -> pd.Series:
+    """
+    Converts a column to its dtype, values which cannot be converted become missing
+    """
+
+    if dtype.startswith("datetime"):
+        if col.dtype.kind == "M":
+            return col.astype(dtype)
+        return pd.to_datetime(col, format="ISO8601", errors="coerce")
+    if dtype == "boolean":
+        if col.dtype.kind == "b" or str(col.dtype) == "boolean":
+            return col.astype("boolean")
+        return (
+            col.astype(str)
+            .str.strip()
+            .str.lower()
+            .map({"true": True, "false": False, "1": True, "0": False})
+            .astype("boolean")
+        )
+    if dtype == "str":
+        return col
+    return pd.to_numeric(col, errors="coerce")
+
+
+def _read(path: str, schema: dict, engine: str) -> tuple[pd.DataFrame, list[str]]:
+    """
+    Reads a .csv file with the dtypes of a schema, falling back to text if values or lines are malformed
+
+    Returns:
+        tuple[pd.DataFrame, list[str]]: columns as read, typed where the whole column converts, else as text, and lines skipped for too many fields
+    """
+
+    dtypes = {
+        col: spec["dtype"]
+        for col, spec in schema.items()
+        if not spec["dtype"].startswith("datetime")
+    }
+    dates = [
+        col for col, spec in schema.items() if spec["dtype"].startswith("datetime")
+    ]
+    try:
+        if engine == "pyarrow":
+            # pyarrow parses dates natively, the c engine is faster without
+            raw = pd.read_csv(path, engine=engine, dtype=dtypes, parse_dates=dates)
+        else:
+            raw = pd.read_csv(path, engine=engine, dtype=dtypes)
+        return raw, []
+    except (ValueError, TypeError):
+        pass
+
+    # malformed values are converted per column by load(), malformed lines skipped
+    skipped = []
+
+    def skip(fields: list[str]) -> None:
+        skipped.append(",".join(fields))
+
+    raw = pd.read_csv(path, dtype=str, engine="python", on_bad_lines=skip)
+    return raw, skipped
+
+
+def load(path: str, schema: dict, on_bad: str = "quarantine") -> pd.DataFrame:
+    """
+    Reads a .csv file by a schema: dtypes and dates are applied while reading, and all rows are checked in one vectorized pass
+
+    A row is bad if a value of a required column is missing or does not convert, is out of range, or not one of the allowed options. Bad rows are dropped and kept in the quarantine directory next to the file, or raise an error. Load time and dropped rows are logged.
+
+    Args:
+        path (str): path of .csv file
+        schema (dict): dtype, and optionally "range", "options" and "optional" by column, see MEASUREMENTS and USERS
+        on_bad (str): "quarantine" | "raise"
+
+    Raises:
+        ValueError: if a required column is missing, or on bad rows if on_bad is "raise"
+
+    Returns:
+        pd.DataFrame: valid rows, with the dtypes of the schema, in order of the file
+    """
+
+    start = time.perf_counter()
+    engine = "pyarrow" if PYARROW and os.path.getsize(path) >= PYARROW_BYTES else "c"
+    raw, skipped = _read(path, schema, engine)
+
+    missing = [
+        col
+        for col, spec in schema.items()
+        if col not in raw.columns and not spec.get("optional")
+    ]
+    if missing:
+        raise ValueError(f"{path}: missing columns {', '.join(missing)}")
+
+    db = raw.copy()
+    bad = np.zeros(db.shape[0], dtype=bool)
+    for col, spec in schema.items():
+        if col not in db.columns:
+            continue
+        if str(db[col].dtype) != spec["dtype"]:
+            db[col] = _convert(db[col], spec["dtype"])
+        values = db[col]
+
+        if not spec.get("optional"):
+            bad |= values.isna().values
+        if "range" in spec:
+            lo, hi = spec["range"]
+            bad |= ((values < lo) | (values > hi)).fillna(False).values.astype(bool)
+        if "options" in spec:
+            bad |= (~values.isin(spec["options"]) & values.notna()).values
+        if spec["dtype"] == "int64":
+            bad |= (values.notna() & (values != values.round())).values
+
+    if bad.any() or skipped:
+        if on_bad == "raise":
+            raise ValueError(f"{path}: {int(bad.sum()) + len(skipped)} invalid rows")
+        quarantine(
+            path,
+            ",".join(raw.columns),
+            raw[bad].to_csv(index=False, header=False).splitlines() + skipped,
+        )
+        db = db[~bad].reset_index(drop=True)
+
+    # integer columns, once missing values are gone
+    for col, spec in schema.items():
+        if col in db.columns and spec["dtype"] == "int64":
+            db[col] = db[col].astype("int64")
+
+    log.info(
+        "loaded %s: %d rows in %.1f ms (%s)%s",
+        path,
+        db.shape[0],
+        (time.perf_counter() - start) * 1000,
+        engine,
+        (
+            f", {int(bad.sum()) + len(skipped)} invalid rows quarantined"
+            if bad.any() or skipped
+            else ""
+        ),
+    )
+    return db
+
+
+def quarantine(path: str, header: str, lines: list[str]) -> None:
+    """
+    Keeps bad rows of a file for manual repair, as text lines below the file's header. Lines already kept are not added again.
+
+    Args:
+        path (str): path of the file the rows were read from
+        header (str): header line of the file
+        lines (list[str]): bad rows, as csv lines
+
+    Returns:
+        None
+    """
+
+    folder = os.path.join(os.path.dirname(path), QUARANTINE_DIR)
+    os.makedirs(folder, exist_ok=True)
+    target = os.path.join(folder, os.path.basename(path))
+
+    kept = []
+    if os.path.exists(target):
+        with open(target, encoding="utf-8") as f:
+            kept = f.read().splitlines()[1:]
+    new = [line for line in dict.fromkeys(lines) if line not in set(kept)]
+    if not new:
+        return
+
+    # several processes may load the same file
+    tmp = f"{target}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("\n".join([header, *kept, *new]) + "\n")
+    os.replace(tmp, target)
+    log.warning("%s: %d invalid rows moved to %s", path, len(new), target)
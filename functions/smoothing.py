@@ -0,0 +1,268 @@
+import os
+import math
+import shutil
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import streamlit as st
+import functions.data as data
+import functions.kiosk as kiosk
+import functions.writer as writer
+
+# folder of kept filter states, one subfolder per user
+DIR = os.path.join("data", "smoothing")
+
+# series kept in memory, least recently used ones are dropped first
+ENTRIES = kiosk.entries(100)
+
+# smoothing methods, see step()
+METHODS = ["ewma", "kalman"]
+
+# time constant of exponential moving average, in days
+TAU = 7.0
+
+# variance of weight change per day, and of a single reading, in kg^2, for kalman filter
+Q = 0.02
+R = 0.25
+
+
+def step(method: str, state: tuple, days: float, y: float) -> tuple[float, float]:
+    """
+    Updates the filter state with the next measurement, in O(1)
+
+    Args:
+        method (str): smoothing method, "ewma" | "kalman"
+        state (tuple): smoothed weight and its variance after previous measurement, None before the first
+        days (float): days since previous measurement
+        y (float): weight
+
+    Returns:
+        tuple[float, float]: smoothed weight and its variance, the variance is 0 for "ewma"
+    """
+
+    if state is None:
+        return y, R
+
+    x, p = state
+    if method == "kalman":
+        p = p + Q * days
+        gain = p / (p + R)
+        return x + gain * (y - x), (1 - gain) * p
+
+    # weight of new measurement grows with time since previous
+    alpha = 1 - math.exp(-days / TAU)
+    return x + alpha * (y - x), 0.0
+
+
+def run(
+    method: str, days: np.ndarray, weights: np.ndarray, state: tuple | None = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Filters a series of weights, see step()
+
+    Args:
+        method (str): smoothing method, "ewma" | "kalman"
+        days (np.ndarray): days since previous measurement, per measurement
+        weights (np.ndarray): weight per measurement
+        state (tuple|None): filter state before the first measurement, None to start afresh
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: smoothed weight and its variance per measurement
+    """
+
+    x = np.empty(weights.shape[0])
+    p = np.empty(weights.shape[0])
+    for i in range(weights.shape[0]):
+        state = step(method, state, days[i], weights[i])
+        x[i], p[i] = state
+    return x, p
+
+
+def smooth(db: pd.DataFrame, method: str) -> np.ndarray:
+    """
+    Smoothes the weights of daily data, without any cache or session
+
+    Args:
+        db (pd.DataFrame): daily data, see data.aggregate()
+        method (str): smoothing method, "ewma" | "kalman"
+
+    Returns:
+        np.ndarray: smoothed weight per row of db
+    """
+
+    dates = db["date"].values
+    days = np.diff(dates, prepend=dates[:1]) / np.timedelta64(1, "D")
+    return run(method, days, db["weight"].values.astype(float))[0]
+
+
+@st.cache_resource(show_spinner=False)
+def _filters() -> dict:
+    """
+    Smoothed series of recently used users, shared by all sessions
+
+    Returns:
+        dict: {"lock": threading.Lock, "series": OrderedDict of (version, dates, weights, smoothed, variance) by user and settings, least recently used first}
+    """
+
+    return {"lock": threading.Lock(), "series": OrderedDict()}
+
+
+def _path(usr_name: str, daily_how: str, outlier: str, method: str) -> str:
+    """
+    Returns the path of a user's kept filter state
+
+    Args:
+        usr_name (str): name of user
+        daily_how (str): aggregation of measurements per day, see data.daily()
+        outlier (str): handling of outliers, see data.daily()
+        method (str): smoothing method, "ewma" | "kalman"
+
+    Returns:
+        str: path of .csv file
+    """
+
+    return os.path.join(DIR, usr_name, f"{daily_how}_{outlier}_{method}.csv")
+
+
+def _read(path: str) -> tuple | None:
+    """
+    Reads a kept filter state, pending or from disk
+
+    Args:
+        path (str): path of .csv file, see _path()
+
+    Returns:
+        tuple|None: (version, dates, weights, smoothed, variance), version is None, or None if not kept
+    """
+
+    pending = writer.pending(path)
+    if pending is not None:
+        df = pending[1]
+    elif os.path.isfile(path):
+        try:
+            df = pd.read_csv(path, parse_dates=["date"])
+        except Exception:
+            # unreadable state is filtered afresh and overwritten
+            return None
+    else:
+        return None
+
+    return (
+        None,
+        df["date"].values.astype("datetime64[ns]"),
+        df["weight"].values.astype(float),
+        df["smoothed"].values.astype(float),
+        df["variance"].values.astype(float),
+    )
+
+
+def smoothed(
+    usr_name: str, version: int, daily_how: str, outlier: str, method: str
+) -> np.ndarray:
+    """
+    Returns the smoothed daily weights of a user
+
+    The filter state after every day is kept with the series, per user and settings, in memory for the ENTRIES recently used series and in DIR next to the user's data. A new data version is filtered from the first day that differs from the kept series, so appending a measurement takes one filter step instead of re-filtering the whole history, also after a restart.
+
+    Args:
+        usr_name (str): name of user
+        version (int): data version of user, see data.version()
+        daily_how (str): aggregation of measurements per day, see data.daily()
+        outlier (str): handling of outliers, see data.daily()
+        method (str): smoothing method, "ewma" | "kalman"
+
+    Returns:
+        np.ndarray: smoothed weight per row of data.daily(), shared and must not be changed
+    """
+
+    key = (usr_name, daily_how, outlier, method)
+    path = _path(*key)
+    filters = _filters()
+    with filters["lock"]:
+        kept = filters["series"].get(key)
+        if kept is not None:
+            filters["series"].move_to_end(key)
+    if kept is not None and kept[0] == version:
+        return kept[3]
+    if kept is None:
+        kept = _read(path)
+
+    db = data.daily(usr_name, version, daily_how, outlier)
+    dates = db["date"].values
+    weights = db["weight"].values.astype(float)
+    n = dates.shape[0]
+
+    # first day differing from kept series, the state before it is reused
+    start, kept_n = 0, -1
+    if kept is not None:
+        kept_n = kept[1].shape[0]
+        m = min(n, kept[1].shape[0])
+        changed = np.flatnonzero(
+            (kept[1][:m] != dates[:m]) | (kept[2][:m] != weights[:m])
+        )
+        start = changed[0] if changed.shape[0] > 0 else m
+
+    days = np.diff(dates, prepend=dates[:1]) / np.timedelta64(1, "D")
+    if start > 0:
+        x, p = run(
+            method,
+            days[start:],
+            weights[start:],
+            (kept[3][start - 1], kept[4][start - 1]),
+        )
+        x = np.r_[kept[3][:start], x]
+        p = np.r_[kept[4][:start], p]
+    else:
+        x, p = run(method, days, weights)
+
+    with filters["lock"]:
+        filters["series"][key] = (version, dates, weights, x, p)
+        filters["series"].move_to_end(key)
+        while len(filters["series"]) > ENTRIES:
+            filters["series"].popitem(last=False)
+
+    # kept on disk unless unchanged, e.g. read back after a restart
+    if start < n or n != kept_n:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        writer.save(
+            path,
+            pd.DataFrame(
+                {"date": dates, "weight": weights, "smoothed": x, "variance": p}
+            ),
+        )
+    return x
+
+
+def clear() -> None:
+    """
+    Drops the series kept in memory, e.g. if the app exceeds its memory ceiling. Kept states on disk stay and are read again when used.
+
+    Returns:
+        None
+    """
+
+    filters = _filters()
+    with filters["lock"]:
+        filters["series"].clear()
+
+
+def remove(usr_name: str) -> None:
+    """
+    Removes the kept filter states of a deleted user
+
+    Args:
+        usr_name (str): name of user
+
+    Returns:
+        None
+    """
+
+    # states may still be pending
+    writer.flush()
+
+    filters = _filters()
+    with filters["lock"]:
+        for key in [key for key in filters["series"] if key[0] == usr_name]:
+            del filters["series"][key]
+    shutil.rmtree(os.path.join(DIR, usr_name), ignore_errors=True)
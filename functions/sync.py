@@ -0,0 +1,575 @@
+import os
+import sys
+import hmac
+import json
+import uuid
+import socket
+import hashlib
+import logging
+import argparse
+import socketserver
+import pandas as pd
+import streamlit.logger as st_logger
+import functions.schema as schema
+import functions.outliers as outliers
+import functions.writer as writer
+
+log = logging.getLogger("OnTheScales.sync")
+
+# port of the sync server
+PORT = int(os.environ.get("ONTHESCALES_SYNC_PORT", 8503))
+
+# shared secret of both installations, needed by a sync server reachable from other hosts
+SECRET = os.environ.get("ONTHESCALES_SYNC_SECRET")
+
+# sub-directory of a data directory with installation id, manifest cache and merge bases
+SYNC_DIR = "sync"
+
+# columns compared, outlier flags are derived from them
+METRICS = ["weight", "fat", "water", "muscle"]
+USER_COLUMNS = ["name", "height", "target", "trend_how", "trend_start", "trend_range"]
+
+# methods of Store offered by the sync server
+METHODS = ["id", "users", "write_users", "manifest", "rows", "write", "update_base"]
+
+
+def _hash(text: str | None) -> str | None:
+    return None if text is None else hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def _text(row: list | None) -> str | None:
+    """
+    Canonical text of a measurement or user row, equal on all installations for equal content
+    """
+
+    return None if row is None else ",".join(str(v) for v in row)
+
+
+def _rows(db: pd.DataFrame) -> list[list]:
+    """
+    Canonical rows of user data: ISO date and time, and METRICS rounded as in the measurement form
+    """
+
+    return [
+        [d, *v]
+        for d, v in zip(
+            db["date"].dt.strftime("%Y-%m-%dT%H:%M:%S"),
+            db[METRICS].round(1).values.tolist(),
+        )
+    ]
+
+
+def _chunks(rows: list[list]) -> dict[str, list[list]]:
+    """
+    Splits canonical rows into chunks of one calendar month, so a change only touches its month
+    """
+
+    chunks: dict[str, list[list]] = {}
+    for row in rows:
+        chunks.setdefault(row[0][:7], []).append(row)
+    return chunks
+
+
+def merge(mine: dict, theirs: dict, base: dict, deletions: bool = True) -> dict:
+    """
+    Merges two versions of keyed rows against the hashes of the rows at the last sync (three-way merge)
+
+    Rules, applied per key: a row changed on one side only takes that side's change, including deletions. If both sides changed it, a change wins over a deletion, and of two different changes the greater row wins, so the result does not depend on which installation runs the sync.
+
+    Args:
+        mine (dict): rows by key, of this installation
+        theirs (dict): rows by key, of the other installation
+        base (dict): row hashes by key at the last sync, empty if never synced
+        deletions (bool): whether deletions are merged, else rows deleted on one side are restored
+
+    Returns:
+        dict: merged rows by key
+    """
+
+    merged = {}
+    for key in mine.keys() | theirs.keys():
+        a, b = mine.get(key), theirs.get(key)
+        if a == b:
+            row = a
+        elif _hash(_text(a)) == base.get(key):
+            row = b
+        elif _hash(_text(b)) == base.get(key):
+            row = a
+        elif a is None or b is None:
+            row = b if a is None else a
+        else:
+            row = max(a, b)
+
+        if row is None and not deletions:
+            row = a if b is None else b
+        if row is not None:
+            merged[key] = row
+
+    return merged
+
+
+class Store:
+    """
+    Data directory of an installation, read and written in chunks
+
+    Files are replaced atomically. The app's own data directory is written as by the app, see data.save(), so its history, catalog and outlier flags follow, and saves are serialized with a running app, see data.locked(). Only the changes to the data last read are saved, so changes the app made meanwhile are kept. A running app picks up the changed files.
+
+    Names of users and installations received from another installation are checked before they are used in paths, see schema.valid_name().
+
+    Attributes:
+        root (str): path of data directory
+        app (bool): whether it is the app's own data directory
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self.app = os.path.abspath(root) == os.path.abspath("data")
+        # data version and data last read per user, in the app's data directory
+        self._seen: dict[str, tuple[int, pd.DataFrame]] = {}
+        os.makedirs(os.path.join(root, SYNC_DIR), exist_ok=True)
+
+    def _name(self, name: str) -> str:
+        """
+        Returns a user name or installation id received from another installation, refusing any which is no valid file name
+        """
+
+        if not schema.valid_name(name):
+            raise ValueError(f"invalid name {name!r}")
+        return name
+
+    def _path(self, *parts: str) -> str:
+        return os.path.join(self.root, *parts)
+
+    def _write(self, path: str, text: str) -> None:
+        tmp = path + ".tmp"
+        with open(tmp, "w", newline="", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _json(self, name: str, default: dict) -> dict:
+        try:
+            with open(self._path(SYNC_DIR, name), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return default
+
+    def _read(self, name: str) -> pd.DataFrame:
+        if self.app:
+            # imported when used, their caches warn without a running app
+            import functions.data as data
+
+            # incl. data not yet written by the writer, base of the next write
+            version = data.version(name)
+            self._seen[name] = (version, data.read_db(name, version))
+            return self._seen[name][1]
+        try:
+            db = schema.load(self._path(name + ".csv"), schema.MEASUREMENTS)
+        except FileNotFoundError:
+            db = pd.DataFrame({"date": pd.to_datetime([]), **{c: [] for c in METRICS}})
+        return db.sort_values(by="date", ignore_index=True)
+
+    def id(self) -> str:
+        """
+        Returns the id of the installation, created on first use
+        """
+
+        path = self._path(SYNC_DIR, "id")
+        if not os.path.exists(path):
+            self._write(path, uuid.uuid4().hex)
+        with open(path, encoding="utf-8") as f:
+            return f.read().strip()
+
+    def users(self) -> dict[str, list]:
+        """
+        Returns the canonical rows of users.csv by user name
+        """
+
+        try:
+            if self.app:
+                import functions.user as user
+
+                db = user.load_db()
+            else:
+                db = schema.load(self._path("users.csv"), schema.USERS)
+        except FileNotFoundError:
+            return {}
+        return {
+            row["name"]: [
+                row["name"],
+                f"{float(row['height']):g}",
+                f"{float(row['target']):g}",
+                row["trend_how"],
+                pd.Timestamp(row["trend_start"]).strftime("%Y-%m-%d"),
+                f"{float(row['trend_range']):g}",
+            ]
+            for row in db.to_dict("records")
+        }
+
+    def write_users(self, rows: dict[str, list]) -> None:
+        """
+        Replaces users.csv, users in order of name. Users without measurements get an empty file, as if added in the app.
+        """
+
+        import functions.data as data
+
+        for name, row in rows.items():
+            if self._name(name) != row[0]:
+                raise ValueError(f"user row of {name!r} is named {row[0]!r}")
+        db = pd.DataFrame([rows[name] for name in sorted(rows)], columns=USER_COLUMNS)
+        if self.app:
+            # written right away, later reads parse the file with its dtypes
+            writer.save(self._path("users.csv"), db)
+            writer.flush()
+        else:
+            self._write(self._path("users.csv"), db.to_csv(index=False))
+
+        for name in rows:
+            if not os.path.exists(self._path(name + ".csv")):
+                self._write(
+                    self._path(name + ".csv"), data.create_df().to_csv(index=False)
+                )
+
+    def manifest(self) -> dict[str, dict[str, str]]:
+        """
+        Returns the hashes of all chunks of all users, only files changed since the last call are read
+
+        Returns:
+            dict[str, dict[str, str]]: chunk hash by month by user name
+        """
+
+        kept = self._json("manifest.json", {})
+        manifest, cache = {}, {}
+        for name in self.users():
+            try:
+                stat = os.stat(self._path(name + ".csv"))
+                key = [stat.st_mtime_ns, stat.st_size]
+            except FileNotFoundError:
+                key = None
+            if name in kept and kept[name]["stat"] == key:
+                chunks = kept[name]["chunks"]
+            else:
+                chunks = {
+                    month: _hash("\n".join(_text(r) for r in rows))
+                    for month, rows in _chunks(_rows(self._read(name))).items()
+                }
+            manifest[name] = chunks
+            cache[name] = {"stat": key, "chunks": chunks}
+
+        self._write(self._path(SYNC_DIR, "manifest.json"), json.dumps(cache))
+        return manifest
+
+    def rows(self, name: str, months: list[str]) -> dict[str, list[list]]:
+        """
+        Returns the canonical rows of some chunks of a user
+        """
+
+        chunks = _chunks(_rows(self._read(self._name(name))))
+        return {month: chunks.get(month, []) for month in months}
+
+    def write(self, name: str, chunks: dict[str, list[list]]) -> None:
+        """
+        Replaces some chunks of a user, other months are kept as they are. Outliers are flagged again, as by the app, which also records the change in the history and catalog of its own data directory.
+        """
+
+        if not chunks:
+            return
+
+        # data last read, in the app's data directory
+        db = self._seen[name][1] if name in self._seen else self._read(self._name(name))
+        db = db[~db["date"].dt.strftime("%Y-%m").isin(list(chunks))][["date", *METRICS]]
+        new = pd.DataFrame(
+            [row for rows in chunks.values() for row in rows],
+            columns=["date", *METRICS],
+        )
+        new["date"] = pd.to_datetime(new["date"], format="ISO8601")
+        db = pd.concat([db, new], ignore_index=True) if db.shape[0] > 0 else new
+        if self.app:
+            import functions.data as data
+            import functions.user as user
+
+            usr = user.load_db().set_index("name").loc[name]
+            data.save(
+                name,
+                db,
+                usr["trend_how"],
+                usr["trend_start"],
+                usr["trend_range"],
+                base=self._seen.pop(name),
+            )
+            # on disk before the next manifest
+            writer.flush()
+            return
+
+        db = db.sort_values(by="date", ignore_index=True)
+        db["outlier"], _ = outliers.scan(db)
+
+        self._write(self._path(name + ".csv"), db.to_csv(index=False))
+
+    def base(self, peer: str) -> dict:
+        """
+        Returns the state of the last sync with another installation
+
+        Returns:
+            dict: {"users": user row hash by name, "chunks": {name: {month: {"hash": chunk hash, "rows": row hash by date}}}}
+        """
+
+        return self._json(f"{self._name(peer)}.json", {"users": {}, "chunks": {}})
+
+    def update_base(self, peer: str, users: dict, chunks: dict) -> None:
+        """
+        Updates the state of the last sync with another installation, for the chunks given
+        """
+
+        base = self.base(peer)
+        base["users"] = users
+        for name, months in chunks.items():
+            base["chunks"].setdefault(self._name(name), {}).update(months)
+        self._write(self._path(SYNC_DIR, f"{peer}.json"), json.dumps(base))
+
+
+class Remote:
+    """
+    Store of another installation, reached through a sync server, see serve()
+
+    Offers the METHODS of Store, each call is one JSON line each way, with the shared secret if any.
+    """
+
+    def __init__(
+        self, host: str, port: int = PORT, secret: str | None = SECRET
+    ) -> None:
+        self._sock = socket.create_connection((host, port), timeout=60)
+        self._file = self._sock.makefile("rwb")
+        self._secret = secret
+
+    def _call(self, method: str, *args):
+        call = {"method": method, "args": args, "secret": self._secret}
+        self._file.write(json.dumps(call).encode() + b"\n")
+        self._file.flush()
+        reply = json.loads(self._file.readline())
+        if "error" in reply:
+            raise RuntimeError(f"sync server: {reply['error']}")
+        return reply["result"]
+
+    def id(self) -> str:
+        return self._call("id")
+
+    def users(self) -> dict[str, list]:
+        return self._call("users")
+
+    def write_users(self, rows: dict[str, list]) -> None:
+        return self._call("write_users", rows)
+
+    def manifest(self) -> dict[str, dict[str, str]]:
+        return self._call("manifest")
+
+    def rows(self, name: str, months: list[str]) -> dict[str, list[list]]:
+        return self._call("rows", name, months)
+
+    def write(self, name: str, chunks: dict[str, list[list]]) -> None:
+        return self._call("write", name, chunks)
+
+    def update_base(self, peer: str, users: dict, chunks: dict) -> None:
+        return self._call("update_base", peer, users, chunks)
+
+    def close(self) -> None:
+        self._file.close()
+        self._sock.close()
+
+
+def serve(
+    store: Store, host: str = "127.0.0.1", port: int = PORT, secret: str | None = SECRET
+) -> None:
+    """
+    Serves a store for one sync from another installation, then returns
+
+    Only local clients are served, unless another address is given, which needs a shared secret. Calls without the secret are refused. The connection is not encrypted, only serve within a trusted home network.
+
+    Args:
+        store (Store): data directory to serve
+        host (str): address to listen on, e.g. "0.0.0.0" for all
+        port (int): port to listen on
+        secret (str|None): shared secret of both installations
+
+    Raises:
+        ValueError: if listening beyond the local host without a secret
+
+    Returns:
+        None
+    """
+
+    if host not in ("127.0.0.1", "localhost", "::1") and not secret:
+        raise ValueError("a sync server reachable from other hosts needs a secret")
+
+    methods = {m: getattr(store, m) for m in METHODS}
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self) -> None:
+            for line in self.rfile:
+                call = json.loads(line)
+                if secret and not hmac.compare_digest(
+                    str(call.get("secret")).encode(), secret.encode()
+                ):
+                    log.warning(
+                        "sync refused, wrong secret from %s", self.client_address[0]
+                    )
+                    self.wfile.write(
+                        json.dumps({"error": "wrong secret"}).encode() + b"\n"
+                    )
+                    return
+                try:
+                    reply = {"result": methods[call["method"]](*call["args"])}
+                except Exception as e:
+                    log.exception("sync call '%s' failed", call.get("method"))
+                    reply = {"error": repr(e)}
+                self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+    with socketserver.TCPServer((host, port), Handler) as server:
+        log.info("waiting for sync on %s:%d", host, port)
+        server.handle_request()
+
+
+def sync(local: Store, peer: Store | Remote) -> dict:
+    """
+    Synchronizes two installations both ways: users and all chunks of measurements that differ are merged, see merge(), and written to both sides
+
+    Only hashes are compared, rows are transferred for differing chunks only.
+
+    Args:
+        local (Store): data directory of this installation
+        peer (Store|Remote): data directory of the other installation
+
+    Returns:
+        dict: number of "users" and "chunks" merged, and of chunks "sent" and "received"
+    """
+
+    peer_id, own_id = peer.id(), local.id()
+    base = local.base(peer_id)
+    stats = {"users": 0, "chunks": 0, "sent": 0, "received": 0}
+
+    # users, never deleted by sync
+    mine, theirs = local.users(), peer.users()
+    users = merge(mine, theirs, base["users"], deletions=False)
+    if users != mine:
+        local.write_users(users)
+    if users != theirs:
+        peer.write_users(users)
+    stats["users"] = sum(mine.get(n) != theirs.get(n) for n in users)
+
+    # measurements, by chunks whose hashes differ
+    ours, other = local.manifest(), peer.manifest()
+    chunks = {}
+    for name in users:
+        a, b = ours.get(name, {}), other.get(name, {})
+        kept = base["chunks"].get(name, {})
+        months = sorted(m for m in a.keys() | b.keys() if a.get(m) != b.get(m))
+
+        # equal chunks are the base of the next sync, if not yet
+        same = [
+            m for m in a if a[m] == b.get(m) and kept.get(m, {}).get("hash") != a[m]
+        ]
+        done = (
+            {
+                m: {"hash": a[m], "rows": {r[0]: _hash(_text(r)) for r in rows}}
+                for m, rows in local.rows(name, same).items()
+            }
+            if same
+            else {}
+        )
+        if months:
+            mine, theirs = local.rows(name, months), peer.rows(name, months)
+            to_local, to_peer = {}, {}
+            for m in months:
+                rows = merge(
+                    {r[0]: r for r in mine[m]},
+                    {r[0]: r for r in theirs[m]},
+                    kept.get(m, {}).get("rows", {}),
+                )
+                rows = [rows[d] for d in sorted(rows)]
+                if rows != mine[m]:
+                    to_local[m] = rows
+                if rows != theirs[m]:
+                    to_peer[m] = rows
+                done[m] = {
+                    "hash": _hash("\n".join(_text(r) for r in rows)),
+                    "rows": {r[0]: _hash(_text(r)) for r in rows},
+                }
+            local.write(name, to_local)
+            peer.write(name, to_peer)
+            stats["chunks"] += len(months)
+            stats["received"] += len(to_local)
+            stats["sent"] += len(to_peer)
+        if done:
+            chunks[name] = done
+
+    # both sides keep the state of this sync, as base of the next one
+    user_hashes = {n: _hash(_text(r)) for n, r in users.items()}
+    local.update_base(peer_id, user_hashes, chunks)
+    peer.update_base(own_id, user_hashes, chunks)
+
+    return stats
+
+
+if __name__ == "__main__":
+    # usage: python -m functions.sync PEER | --serve
+    parser = argparse.ArgumentParser(
+        prog="python -m functions.sync",
+        description="Synchronizes measurements and users with another installation, both ways.",
+    )
+    parser.add_argument(
+        "peer",
+        nargs="?",
+        help="data directory of the other installation, or HOST[:PORT] of its sync server",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="wait for one sync from another installation",
+    )
+    parser.add_argument("--port", type=int, default=PORT, help="port of sync server")
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="address the sync server listens on, e.g. 0.0.0.0, other than the local host needs a secret",
+    )
+    parser.add_argument(
+        "--secret",
+        default=SECRET,
+        help="shared secret of both installations, defaults to ONTHESCALES_SYNC_SECRET",
+    )
+    parser.add_argument("-d", "--data", default="data", help="own data directory")
+    args = parser.parse_args()
+    if args.serve == (args.peer is not None):
+        parser.error("give either a peer or --serve")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
+
+    # quiet bare-mode warnings of streamlit, there is no session
+    st_logger.set_log_level("error")
+
+    local = Store(args.data)
+    if args.serve:
+        try:
+            serve(local, args.host, args.port, args.secret)
+        except ValueError as e:
+            parser.error(str(e))
+        sys.exit(0)
+
+    if os.path.isdir(args.peer):
+        peer = Store(args.peer)
+    else:
+        host, _, port = args.peer.partition(":")
+        peer = Remote(host, int(port or args.port), args.secret)
+    try:
+        stats = sync(local, peer)
+    finally:
+        if isinstance(peer, Remote):
+            peer.close()
+    log.info(
+        "%d users and %d chunks merged, %d chunks sent and %d received",
+        stats["users"],
+        stats["chunks"],
+        stats["sent"],
+        stats["received"],
+    )
@@ -3,9 +3,53 @@ import pandas as pd
 import streamlit as st
 from datetime import datetime
 import functions.data as data
+import functions.writer as writer
+import functions.catalog as catalog
+import functions.history as history
+import functions.schema as schema
+import functions.kiosk as kiosk
+import functions.recent as recent
+import functions.smoothing as smoothing
 import functions.utils as ut
 
 
+class Registry:
+    """
+    Index of the user database, rebuilt only when users are added or deleted.
+
+    Provides O(1) lookup of a user's row by name, and the precomputed option list and names used by the user selectboxes.
+
+    Attributes:
+        names (list[str]): Names of all users, in order of the user database
+        options (list[int]): Row indices of all users, used as selectbox options
+        rows (dict[str, int]): Row index of each user by name
+    """
+
+    def __init__(self, db: pd.DataFrame) -> None:
+        self.names = db["name"].tolist()
+        self.options = list(range(len(self.names)))
+        self.rows = {name: idx for idx, name in enumerate(self.names)}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.rows
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def name(self, idx: int) -> str:
+        """
+        Returns name of user in given row, used as format_func of selectboxes.
+
+        Args:
+            idx (int): Row index of user
+
+        Returns:
+            str: Name of user
+        """
+
+        return self.names[idx]
+
+
 def select_user(src: str, input_idx: int) -> None:
     """
     Updates the active user according to source:
@@ -18,7 +62,7 @@ def select_user(src: str, input_idx: int) -> None:
 
     When user changes:
         - update session state user index/name/height/target/trend-data
-        - load db for selected user
+        - load db for selected user, without file access if used recently, see recent.get()
 
     Args:
         src (str): Source of the call "sidebar" | "deletion"
@@ -79,16 +123,36 @@ def load_db() -> pd.DataFrame:
     """
     Load the user database from CSV file.
 
-    Reads and returns the users.csv file which contains user profiles and settings.
+    Reads and returns the users.csv file which contains user profiles and settings. The parsed file is shared across sessions until users.csv changes.
+
+    Returns:
+        pd.DataFrame: DataFrame containing user data from users.csv
+    """
+
+    path = os.path.join("data", "users.csv")
+    saved = writer.version(path)
+    return read_db(saved if saved is not None else os.stat(path).st_mtime_ns)
+
+
+@st.cache_data(show_spinner=False, max_entries=kiosk.entries(10))
+def read_db(version: int) -> pd.DataFrame:
+    """
+    Reads users.csv, cached across all sessions per version.
+
+    Args:
+        version (int): Version given by the background writer, or else modification time of users.csv
 
     Returns:
         pd.DataFrame: DataFrame containing user data from users.csv
     """
 
-    db = pd.read_csv(os.path.join("data", "users.csv"))
-    db["trend_start"] = pd.to_datetime(db["trend_start"])
+    # data not yet written is taken from writer
+    path = os.path.join("data", "users.csv")
+    queued = writer.pending(path)
+    if queued is not None and queued[0] == version:
+        return queued[1]
 
-    return db
+    return schema.load(path, schema.USERS)
 
 
 def add(name: str, height: int, target: int) -> None:
@@ -97,7 +161,7 @@ def add(name: str, height: int, target: int) -> None:
 
     Takes the user's name, height, and target weight, creates a new entry in the user database with default trend settings, and generates a blank measurement CSV file for the new user.
 
-    If the user name already exists, sets a flag and returns without making changes.
+    If the user name already exists, also if added meanwhile, e.g. by a sync, or is no valid file name, see schema.valid_name(), sets a flag and returns without making changes.
 
     Args:
         name (str): Name of the user to add
@@ -115,10 +179,15 @@ def add(name: str, height: int, target: int) -> None:
     """
 
     # return if user already exists
-    if name in st.session_state.user_db["name"].values:
+    if name in st.session_state.user_reg or name in set(load_db()["name"]):
         st.session_state.flags["usr_add_exists"] = True
         return
 
+    # return if name cannot be a file name
+    if not schema.valid_name(name):
+        st.session_state.flags["usr_add_invalid"] = True
+        return
+
     # set flag
     st.session_state.flags["usr_add_ok"] = True
 
@@ -147,18 +216,47 @@ def add(name: str, height: int, target: int) -> None:
     st.session_state.user_db["trend_start"] = pd.to_datetime(
         st.session_state.user_db["trend_start"]
     )
+    st.session_state.user_reg = Registry(st.session_state.user_db)
 
     # save users.csv
-    st.session_state.user_db.to_csv(os.path.join("data", "users.csv"), index=False)
+    save_db()
 
     # create new csv for new user
     new_db = data.create_df()
     new_db.to_csv(os.path.join("data", name + ".csv"), index=False)
+    catalog.update(name, new_db, "date range", datetime.now(), 8)
 
     # handle 'active user' when user was added
     select_user(src="adding", input_idx=0)
 
 
+def save_db(removed: str | None = None) -> None:
+    """
+    Hands the user database of the session to the background writer, which writes it to users.csv
+
+    Users added to users.csv since the session read it, e.g. by a sync or another session, are added to the session's user database first, so they are kept.
+
+    Args:
+        removed (str|None): name of user the session deleted, not to be added again
+
+    Returns:
+        None
+    """
+
+    stored = load_db()
+    added = stored[
+        ~stored["name"].isin(st.session_state.user_db["name"])
+        & (stored["name"] != removed)
+    ]
+    if added.shape[0] > 0:
+        st.session_state.user_db = pd.concat(
+            [st.session_state.user_db, added], ignore_index=True
+        )
+        st.session_state.user_reg = Registry(st.session_state.user_db)
+
+    writer.save(os.path.join("data", "users.csv"), st.session_state.user_db)
+
+
 def update_user() -> None:
     """
     Updates the data of a user in the user database.
@@ -182,28 +280,29 @@ def update_user() -> None:
     st.session_state.flags["usr_update_ok"] = True
 
     # update user_db and user_data in session_state
-    st.session_state.user_cm = st.session_state.user_db.loc[
-        st.session_state.user_idx, "height"
-    ]
-    st.session_state.user_kg = st.session_state.user_db.loc[
-        st.session_state.user_idx, "target"
-    ]
+    st.session_state.user_cm = int(
+        st.session_state.user_db.loc[st.session_state.user_idx, "height"]
+    )
+    st.session_state.user_kg = float(
+        st.session_state.user_db.loc[st.session_state.user_idx, "target"]
+    )
 
     # save users.csv
-    st.session_state.user_db.to_csv(os.path.join("data", "users.csv"), index=False)
+    save_db()
 
 
 def update_trend() -> None:
     """
     Updates trend settings for the current user.
 
-    Takes trend settings from session state (how/start/range) and updates them in the user database, then saves to users.csv.
+    Takes trend settings from session state (how/start/range) and updates them in the user database, then saves to users.csv in background, so changing settings does not wait for the disk.
 
     Returns:
         None
     """
 
-    # update user_db session_state
+    # update user_db session_state, a copy as the saved one may still be pending
+    st.session_state.user_db = st.session_state.user_db.copy()
     st.session_state.user_db.loc[st.session_state.user_idx, "trend_how"] = (
         st.session_state.trend_how
     )
@@ -215,7 +314,16 @@ def update_trend() -> None:
     )
 
     # save users.csv
-    st.session_state.user_db.to_csv(os.path.join("data", "users.csv"), index=False)
+    save_db()
+
+    # trend in catalog follows trend settings
+    catalog.update(
+        st.session_state.user_name,
+        st.session_state.db,
+        st.session_state.trend_how,
+        st.session_state.trend_start,
+        st.session_state.trend_range,
+    )
 
 
 def delete(idx: int | None) -> None:
@@ -235,14 +343,21 @@ def delete(idx: int | None) -> None:
         st.session_state.sb_user_delete = None
         return
 
-    # remove user's data csv file
+    # remove user's data csv file, after pending writes are done
+    writer.flush()
     os.remove(os.path.join("data", st.session_state.user_db.loc[idx, "name"] + ".csv"))
+    catalog.remove(st.session_state.user_db.loc[idx, "name"])
+    history.remove(st.session_state.user_db.loc[idx, "name"])
+    recent.forget(st.session_state.user_db.loc[idx, "name"])
+    smoothing.remove(st.session_state.user_db.loc[idx, "name"])
 
     # delete user from user_db
+    name = st.session_state.user_db.loc[idx, "name"]
     st.session_state.user_db = st.session_state.user_db.drop(idx).reset_index(drop=True)
+    st.session_state.user_reg = Registry(st.session_state.user_db)
 
     # save users.csv
-    st.session_state.user_db.to_csv(os.path.join("data", "users.csv"), index=False)
+    save_db(removed=name)
 
     # handle 'active user' when user was deleted
     select_user(src="deletion", input_idx=idx)
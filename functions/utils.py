@@ -1,7 +1,35 @@
 import os
+import gc
+import uuid
+import logging
 import streamlit as st
+import plotly.graph_objects as go
 import functions.user as user
 import functions.data as data
+import functions.watcher as watcher
+import functions.writer as writer
+import functions.ingest as ingest
+import functions.figures as fgs
+import functions.kiosk as kiosk
+import functions.recent as recent
+import functions.smoothing as smoothing
+
+log = logging.getLogger("OnTheScales.charts")
+
+# log size of every chart sent to the browser, switched on by ONTHESCALES_CHART_SIZES=1, costs another serialization per chart
+CHART_SIZES = os.environ.get("ONTHESCALES_CHART_SIZES", "0").lower() not in (
+    "",
+    "0",
+    "false",
+)
+if CHART_SIZES:
+    # shown in a plain `streamlit run` as well, which configures no logging of the app
+    log.setLevel(logging.INFO)
+    if not logging.getLogger().handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(name)s: %(message)s"))
+        log.addHandler(handler)
+        log.propagate = False
 
 
 def init_vars() -> None:
@@ -15,14 +43,31 @@ def init_vars() -> None:
         None
     """
 
+    # local API for measurements pushed by a scale, once per process
+    ingest.start()
+
+    # stay below the memory ceiling in kiosk mode
+    if kiosk.ENABLED:
+        check_memory()
+
+    # id of session, it undoes and redoes only its own changes
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+
     # a collection of flags in a dict
     if "flags" not in st.session_state:
         st.session_state.flags = {
             "data_add": False,
             "data_upd": False,
             "data_del": False,
+            "data_edit": False,
+            "data_edit_clash": False,
+            "data_undo": False,
+            "data_redo": False,
+            "data_outlier": False,
             "usr_add_ok": False,
             "usr_add_exists": False,
+            "usr_add_invalid": False,
             "usr_update_ok": False,
             "usr_del_ok": False,
         }
@@ -30,6 +75,7 @@ def init_vars() -> None:
     # load user database
     if "user_db" not in st.session_state:
         st.session_state.user_db = user.load_db()
+        st.session_state.user_reg = user.Registry(st.session_state.user_db)
         if st.session_state.user_db.shape[0] == 0:
             st.session_state.user_idx = None
         else:
@@ -50,6 +96,20 @@ def init_vars() -> None:
         else:
             st.session_state.db = data.create_df()
 
+    # value shown for days with several measurements
+    if "daily_how" not in st.session_state:
+        st.session_state.daily_how = "first"
+
+    # whether outliers are highlighted or excluded in figures
+    if "outlier_how" not in st.session_state:
+        st.session_state.outlier_how = "highlight"
+
+    # smoothing of weights, and whether trend is fitted on smoothed weights
+    if "smooth_how" not in st.session_state:
+        st.session_state.smooth_how = "off"
+    if "trend_input" not in st.session_state:
+        st.session_state.trend_input = "weight"
+
     if "fig_main_style" not in st.session_state:
         st.session_state.fig_main_style = "lines"
         st.session_state.fig_body_comp_type = "%"
@@ -57,6 +117,53 @@ def init_vars() -> None:
         st.session_state.fig_body_comp_style = "lines"
 
 
+def check_memory() -> None:
+    """
+    Drops the shared caches of data and figures if the process exceeds the memory ceiling, see kiosk.MEMORY_MB. They refill with the data of users in use.
+
+    Resources shared between sessions which are no caches, like the ingestion API and the histories, are kept.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+
+    used = kiosk.memory_mb()
+    if used <= kiosk.MEMORY_MB:
+        return
+
+    st.cache_data.clear()
+    fgs.clear_trend_cards()
+    data.sorted_desc.clear()
+    recent.forget()
+    smoothing.clear()
+    gc.collect()
+    kiosk.log.warning(
+        "%.0f MB above ceiling of %d MB, caches dropped: %.0f MB",
+        used,
+        kiosk.MEMORY_MB,
+        kiosk.memory_mb(),
+    )
+
+
+def keep_selected(key: str, default: str) -> None:
+    """
+    Restores the default of a segmented control when its selection was cleared, as a click on the selected option deselects it. Used as on_change callback of controls which need a value.
+
+    Args:
+        key (str): Key of the control in session_state
+        default (str): Option selected instead of none
+
+    Returns:
+        None
+    """
+
+    if st.session_state[key] is None:
+        st.session_state[key] = default
+
+
 def set_user_sessionstate(what: str) -> None:
     """
     Sets session state variables related to the user or trend settings.
@@ -75,12 +182,13 @@ def set_user_sessionstate(what: str) -> None:
                 st.session_state.user_name = st.session_state.user_db.loc[
                     st.session_state.user_idx, "name"
                 ]
-                st.session_state.user_cm = st.session_state.user_db.loc[
-                    st.session_state.user_idx, "height"
-                ]
-                st.session_state.user_kg = st.session_state.user_db.loc[
-                    st.session_state.user_idx, "target"
-                ]
+                # native types, numpy scalars would hash differently in cache keys
+                st.session_state.user_cm = int(
+                    st.session_state.user_db.loc[st.session_state.user_idx, "height"]
+                )
+                st.session_state.user_kg = float(
+                    st.session_state.user_db.loc[st.session_state.user_idx, "target"]
+                )
             else:
                 # when no user in user_db
                 st.session_state.user_name = "..."
@@ -96,9 +204,11 @@ def set_user_sessionstate(what: str) -> None:
                 st.session_state.trend_start = st.session_state.user_db.loc[
                     st.session_state.user_idx, "trend_start"
                 ]
-                st.session_state.trend_range = st.session_state.user_db.loc[
-                    st.session_state.user_idx, "trend_range"
-                ]
+                st.session_state.trend_range = int(
+                    st.session_state.user_db.loc[
+                        st.session_state.user_idx, "trend_range"
+                    ]
+                )
             else:
                 # when no user in user_db
                 st.session_state.trend_how = "..."
@@ -121,35 +231,80 @@ def create_menu() -> None:
     st.sidebar.markdown("# On<br>The<br>Scales", unsafe_allow_html=True)
     st.sidebar.divider()
 
-    # user selectbox
-    usr_idx = [i for i, _ in st.session_state.user_db.iterrows()]
-    usr_name = [r["name"] for i, r in st.session_state.user_db.iterrows()]
-
+    # user selectbox, options are precomputed by user registry - typing filters users
     st.sidebar.selectbox(
         "select user:",
-        options=usr_idx,
-        format_func=lambda i: usr_name[i],
+        options=st.session_state.user_reg.options,
+        format_func=st.session_state.user_reg.name,
         index=st.session_state.user_idx,
         key="sb_user",
         on_change=user.select_user,
         args=("sidebar", None),
         placeholder=(
-            "add new user" if len(st.session_state.user_db) == 0 else "select user"
+            "add new user" if len(st.session_state.user_reg) == 0 else "select user"
         ),
     )
     st.sidebar.divider()
 
+    # changes kept in memory only, until the disk accepts them again
+    failed = writer.failures()
+    st.session_state.write_failing = bool(failed)
+    if failed:
+        st.sidebar.error(
+            "Not saved to disk yet, retrying: "
+            + ", ".join(os.path.basename(path) for path in failed),
+            icon=":material/error:",
+        )
+
     # pages
     st.sidebar.page_link("OnTheScales.py", label=":material/trending_down: Graphs")
     st.sidebar.page_link(
         os.path.join("pages", "measurements.py"), label=":material/notes: Measurements"
     )
+    st.sidebar.page_link(
+        os.path.join("pages", "cohort.py"), label=":material/leaderboard: Compare"
+    )
     st.sidebar.page_link(
         os.path.join("pages", "manage_users.py"), label=":material/groups: Manage Users"
     )
     st.sidebar.divider()
 
 
+@st.fragment(run_every=2)
+def live_updates() -> None:
+    """
+    Reloads the current user's data when it was changed by another session or process, e.g. a measurement entered on the phone while the wall display shows the same user.
+
+    Runs as fragment every 2 seconds, but only looks at the change events published by the data watcher. Versions are compared after an event only, and the page reruns only when the current user's data actually changed. It also reruns when writes start or stop failing, so the menu shows their warning.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+
+    # show or clear the warning of failed writes in the menu
+    failing = bool(writer.failures())
+    if failing != st.session_state.get("write_failing", False):
+        st.session_state.write_failing = failing
+        st.rerun()
+
+    if st.session_state.user_idx is None:
+        return
+
+    # any change event of current user's file?
+    events = watcher.events(st.session_state.user_name)
+    if events == st.session_state.get("db_events"):
+        return
+    st.session_state.db_events = events
+
+    # reload when data was changed elsewhere, cached figures/trends follow the new data version
+    if data.version(st.session_state.user_name) != st.session_state.db_version:
+        st.session_state.db = data.load_db()
+        st.rerun()
+
+
 def default_style() -> None:
     """
     Defines defaults styling and layout settings.
@@ -172,6 +327,30 @@ def default_style() -> None:
     st.markdown(css, unsafe_allow_html=True)
 
 
+def chart(fig: go.Figure, key: str) -> None:
+    """
+    Shows a plotly figure at full width without mode bar, and logs the size of the payload sent to the browser if CHART_SIZES is set.
+
+    Args:
+        fig (go.Figure): Plotly figure
+        key (str): Key of chart element
+
+    Returns:
+        None
+    """
+
+    # sizing needs another serialization, streamlit does not expose its own
+    if CHART_SIZES:
+        log.info("chart '%s': %.1f kB", key, fgs.size(fig) / 1000)
+
+    st.plotly_chart(
+        fig,
+        use_container_width=True,
+        config={"displayModeBar": False},
+        key=key,
+    )
+
+
 def h_spacer(height: int = 0, sb: bool = False) -> None:
     """
     Adds empty lines.
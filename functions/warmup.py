@@ -0,0 +1,138 @@
+import os
+import sys
+import time
+import logging
+import streamlit.logger as st_logger
+import streamlit.web.cli as stcli
+
+log = logging.getLogger("OnTheScales.warmup")
+
+
+def plotting_stack() -> None:
+    """
+    Pre-imports the plotting stack and builds throwaway figures, so plotly loads its validators and serializers before the first figure is drawn.
+
+    Returns:
+        None
+    """
+
+    import plotly.io as pio
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+    import functions.figures  # noqa: F401
+
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    fig.add_trace(go.Scatter(x=[0, 1], y=[0, 1], mode="markers+lines"))
+    fig.add_annotation(x=1, y=1, text="warm-up")
+    fig.update_layout(hovermode="x unified", legend=dict(orientation="h"))
+    fig.update_xaxes(type="date", rangeselector=dict(buttons=[dict(step="all")]))
+    pio.to_json(fig, validate=False)
+
+
+def user_data(usr: dict) -> None:
+    """
+    Loads the measurements of a user into the shared cache and precomputes the trend card for the user's saved trend settings.
+
+    Args:
+        usr (dict): Row of the user database
+
+    Returns:
+        None
+    """
+
+    import functions.data as data
+    import functions.figures as fgs
+
+    db = data.load_db(usr["name"])
+    if db.shape[0] > 1:
+        fgs.trend_card(
+            usr["name"],
+            data.version(usr["name"]),
+            "first",
+            "highlight",
+            "off",
+            usr["trend_how"],
+            usr["trend_start"],
+            usr["trend_range"],
+            usr["target"],
+        )
+
+
+def run() -> None:
+    """
+    Warms up all shared caches: plotting stack, user database, every user's measurements incl. trend cards, and the comparison of all users. Also starts the ingestion API.
+
+    Errors of single users are logged and skipped, so a broken .csv never prevents the app from starting. Modules of the app are imported in here, so their import time is part of the warm-up.
+
+    Returns:
+        None
+    """
+
+    import functions.user as user
+    import functions.catalog as catalog
+    import functions.cohort as cohort
+    import functions.ingest as ingest
+    import functions.kiosk as kiosk
+
+    t_start = time.perf_counter()
+
+    # plotting stack
+    t0 = time.perf_counter()
+    plotting_stack()
+    log.info("plotting stack ready (%.2fs)", time.perf_counter() - t0)
+
+    # user database
+    t0 = time.perf_counter()
+    users = user.load_db()
+    log.info(
+        "user database ready, %d users (%.2fs)", len(users), time.perf_counter() - t0
+    )
+
+    # summary catalog of all users
+    t0 = time.perf_counter()
+    catalog.load()
+    log.info("catalog ready (%.2fs)", time.perf_counter() - t0)
+
+    # measurements of each user
+    for usr in users.to_dict("records"):
+        t0 = time.perf_counter()
+        try:
+            user_data(usr)
+        except Exception:
+            log.exception("warm-up failed for user '%s'", usr["name"])
+            continue
+        log.info("user '%s' ready (%.2fs)", usr["name"], time.perf_counter() - t0)
+
+    # comparison of all users, on first visit of its page in kiosk mode
+    t0 = time.perf_counter()
+    try:
+        if not kiosk.ENABLED:
+            cohort.load(users)
+            log.info("cohort ready (%.2fs)", time.perf_counter() - t0)
+    except Exception:
+        log.exception("warm-up failed for cohort")
+
+    # ingestion API, so a scale can push before the first client connects
+    ingest.start()
+
+    log.info(
+        "warm-up done, ready in %.2fs, %.0f MB%s",
+        time.perf_counter() - t_start,
+        kiosk.memory_mb(),
+        " (kiosk mode)" if kiosk.ENABLED else "",
+    )
+
+
+if __name__ == "__main__":
+    # usage: python -m functions.warmup [streamlit run options]
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    # quiet bare-mode warnings of streamlit, no session exists yet
+    st_logger.set_log_level("error")
+    run()
+    st_logger.set_log_level("info")
+
+    # start app within the same process, so caches are shared with all sessions
+    sys.argv = ["streamlit", "run", "OnTheScales.py", *sys.argv[1:]]
+    sys.exit(stcli.main())
@@ -0,0 +1,57 @@
+import os
+import threading
+import streamlit as st
+from watchdog.events import FileSystemEvent, FileSystemEventHandler
+from watchdog.observers import Observer
+
+# number of change events per user file: name -> count
+_events: dict[str, int] = {}
+_lock = threading.Lock()
+
+
+class _Handler(FileSystemEventHandler):
+    """
+    Publishes a change event for each user .csv file touched in the data directory
+    """
+
+    def on_any_event(self, event: FileSystemEvent) -> None:
+        if event.is_directory or event.event_type in ("opened", "closed_no_write"):
+            return
+
+        for path in (event.src_path, getattr(event, "dest_path", "")):
+            name, ext = os.path.splitext(os.path.basename(str(path)))
+            if ext == ".csv":
+                with _lock:
+                    _events[name] = _events.get(name, 0) + 1
+
+
+@st.cache_resource(show_spinner=False)
+def start() -> Observer:
+    """
+    Starts watching the data directory, once per process for all sessions
+
+    Returns:
+        Observer: running watchdog observer
+    """
+
+    observer = Observer()
+    observer.schedule(_Handler(), "data", recursive=False)
+    observer.daemon = True
+    observer.start()
+    return observer
+
+
+def events(usr_name: str) -> int:
+    """
+    Returns the number of change events of a user's .csv file since watching started
+
+    Args:
+        usr_name (str): name of user
+
+    Returns:
+        int: number of change events
+    """
+
+    start()
+    with _lock:
+        return _events.get(usr_name, 0)
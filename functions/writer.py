@@ -0,0 +1,227 @@
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+import pandas as pd
+from typing import Callable
+
+log = logging.getLogger("OnTheScales.writer")
+
+# files waiting to be written: path -> (version, dataframe, csv text, callback when written)
+_pending: dict[str, tuple[int, pd.DataFrame, str, Callable | None]] = {}
+_lock = threading.Lock()
+
+# files written by the writer: path -> (version, modification time)
+_written: dict[str, tuple[int, int]] = {}
+
+# files whose last write failed, kept pending and retried: path -> (attempts, error)
+_failed: dict[str, tuple[int, str]] = {}
+
+# delay of first retry of a failed write in seconds, doubled per attempt up to the maximum
+RETRY_S = 1.0
+RETRY_MAX_S = 60.0
+
+# bounded queue of paths to be written, blocks callers when disk falls behind
+_queue: queue.Queue = queue.Queue(maxsize=64)
+_thread: threading.Thread | None = None
+
+
+def save(
+    path: str,
+    df: pd.DataFrame,
+    version: int | None = None,
+    done: Callable[[int, int, int], None] | None = None,
+) -> int:
+    """
+    Hands a dataframe to the background writer, to be saved as .csv file
+
+    The dataframe is converted to csv text right away, so the writer thread never touches pandas objects shared with sessions. Several saves of the same file before it is written are coalesced, only the latest one is written.
+
+    Args:
+        path (str): path of .csv file
+        df (pd.DataFrame): data to be saved, must not be changed afterwards
+        version (int|None): version of the data, e.g. of its history, defaults to the current time in ns
+        done (Callable|None): called by the writer with version, modification time and size of the file once written, e.g. to persist the version
+
+    Returns:
+        int: version of the saved data, valid as long as the file is pending or unchanged since written
+    """
+
+    _start()
+
+    text = df.to_csv(index=False)
+    if version is None:
+        version = time.time_ns()
+    with _lock:
+        queued = path in _pending
+        _pending[path] = (version, df, text, done)
+
+    if not queued:
+        _queue.put(path)
+
+    return version
+
+
+def pending(path: str) -> tuple[int, pd.DataFrame] | None:
+    """
+    Returns data of a file which is not yet written
+
+    Args:
+        path (str): path of .csv file
+
+    Returns:
+        tuple[int, pd.DataFrame] | None: version and data waiting to be written, or None
+    """
+
+    with _lock:
+        if path not in _pending:
+            return None
+        return _pending[path][:2]
+
+
+def version(path: str) -> int | None:
+    """
+    Returns the version of a file handed to the writer, as long as the file is pending or unchanged since written
+
+    Keeps the version of own writes stable after they reached the disk, so they are not mistaken for changes made elsewhere.
+
+    Args:
+        path (str): path of .csv file
+
+    Returns:
+        int | None: version of file, or None if unknown or changed by someone else
+    """
+
+    with _lock:
+        if path in _pending:
+            return _pending[path][0]
+        if path not in _written:
+            return None
+        version, mtime = _written[path]
+
+    try:
+        return version if os.stat(path).st_mtime_ns == mtime else None
+    except FileNotFoundError:
+        return None
+
+
+def failures() -> dict[str, str]:
+    """
+    Returns files whose last write failed, they stay pending and are retried
+
+    Returns:
+        dict[str, str]: error by path of .csv file
+    """
+
+    with _lock:
+        return {path: error for path, (_, error) in _failed.items()}
+
+
+def flush() -> None:
+    """
+    Blocks until all pending files are written, or their write failed and is retried later, see failures()
+
+    Returns:
+        None
+    """
+
+    if _thread is not None:
+        _queue.join()
+
+
+def _start() -> None:
+    """
+    Starts writer thread on first use and registers flushing on exit
+
+    Returns:
+        None
+    """
+
+    global _thread
+
+    with _lock:
+        if _thread is not None:
+            return
+        _thread = threading.Thread(target=_run, name="OnTheScales-writer", daemon=True)
+        _thread.start()
+    atexit.register(_exit)
+
+
+def _exit() -> None:
+    """
+    Flushes on exit, and reports data which never reached the disk
+
+    Returns:
+        None
+    """
+
+    flush()
+    for path, error in failures().items():
+        log.error("'%s' not written on exit, changes are lost: %s", path, error)
+
+
+def _run() -> None:
+    """
+    Loop of writer thread: writes queued files until the latest version of each is on disk
+
+    Returns:
+        None
+    """
+
+    while True:
+        path = _queue.get()
+        try:
+            while True:
+                with _lock:
+                    version, _, text, done = _pending[path]
+                stat = _write(path, text)
+                with _lock:
+                    _written[path] = (version, stat.st_mtime_ns)
+                    _failed.pop(path, None)
+                if done is not None:
+                    try:
+                        done(version, stat.st_mtime_ns, stat.st_size)
+                    except Exception:
+                        log.exception("callback after writing '%s' failed", path)
+                with _lock:
+                    # done, unless a newer version arrived while writing
+                    if _pending[path][0] == version:
+                        del _pending[path]
+                        break
+        except Exception as e:
+            # keep data pending, so sessions keep it and the write is retried
+            with _lock:
+                attempts = _failed.get(path, (0, ""))[0] + 1
+                _failed[path] = (attempts, f"{type(e).__name__}: {e}")
+            delay = min(RETRY_S * 2 ** (attempts - 1), RETRY_MAX_S)
+            log.exception(
+                "writing '%s' failed, attempt %d, retry in %.0fs", path, attempts, delay
+            )
+            retry = threading.Timer(delay, _queue.put, (path,))
+            retry.daemon = True
+            retry.start()
+        finally:
+            _queue.task_done()
+
+
+def _write(path: str, text: str) -> os.stat_result:
+    """
+    Writes csv text durably: into a temporary file, synced to disk, then renamed
+
+    Args:
+        path (str): path of .csv file
+        text (str): csv text to be saved
+
+    Returns:
+        os.stat_result: status of written file
+    """
+
+    tmp = path + ".tmp"
+    with open(tmp, "w", newline="") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return os.stat(path)
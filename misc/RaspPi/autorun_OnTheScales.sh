@@ -6,4 +6,7 @@ cd $SCRIPT_DIR/../..
 #echo "i am here now:"
 #pwd
 source .venv/bin/activate
-streamlit run OnTheScales.py
+# low-memory mode, see README
+export ONTHESCALES_KIOSK=${ONTHESCALES_KIOSK:-1}
+# warm up caches, then start app in the same process
+python -m functions.warmup
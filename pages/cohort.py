@@ -0,0 +1,64 @@
+import streamlit as st
+import functions.utils as ut
+import functions.cohort as cohort
+import functions.figures as fgs
+
+# init default values
+ut.init_vars()
+ut.default_style()
+ut.create_menu()
+
+# prepare histories of all users, only changed ones are recomputed
+weekly, summary = cohort.load(st.session_state.user_db)
+
+# compare users -------------------------------------------------------------
+st.subheader("Compare Users")
+with st.container(border=True):
+    fig_cohort = fgs.cohort(
+        weekly, st.session_state.get("cohort_metric") or "change_pct"
+    )
+
+    # draw and show figure
+    if fig_cohort is None:
+        st.markdown("_No measurements stored yet._")
+    else:
+        ut.chart(fig_cohort, "fig_cohort")
+
+    # select metric to compare
+    st.divider()
+    st.segmented_control(
+        "compare:",
+        options=["change_pct", "change", "rate"],
+        format_func={
+            "change_pct": "change [%]",
+            "change": "change [kg]",
+            "rate": "rate [kg/week]",
+        }.get,
+        default="change_pct",
+        key="cohort_metric",
+        on_change=ut.keep_selected,
+        args=("cohort_metric", "change_pct"),
+    )
+
+# progress towards targets ----------------------------------------------------
+ut.h_spacer(2)
+st.subheader("Progress")
+st.dataframe(
+    summary,
+    use_container_width=True,
+    hide_index=True,
+    column_config={
+        "name": st.column_config.Column(label="Name"),
+        "start": st.column_config.DateColumn(label="Since", format="DD.MM.YYYY"),
+        "weight": st.column_config.NumberColumn(label="Weight", format="%.1f kg"),
+        "change": st.column_config.NumberColumn(label="Change", format="%+.1f kg"),
+        "change_pct": st.column_config.NumberColumn(label="Change", format="%+.1f %%"),
+        "rate": st.column_config.NumberColumn(
+            label="Last 4 weeks", format="%+.2f kg/week"
+        ),
+        "target": st.column_config.NumberColumn(label="Target", format="%d kg"),
+        "progress": st.column_config.ProgressColumn(
+            label="Progress", format="%.0f %%", min_value=0, max_value=100
+        ),
+    },
+)
@@ -2,13 +2,31 @@ import time
 import streamlit as st
 import functions.utils as ut
 import functions.user as user
+import functions.catalog as catalog
 
 # init default values
 ut.init_vars()
 ut.default_style()
 ut.create_menu()
 
+# overview users --------------------------------------------------------------
+st.subheader("Overview")
+st.dataframe(
+    catalog.load(),
+    use_container_width=True,
+    hide_index=True,
+    column_config={
+        "name": st.column_config.Column(label="Name"),
+        "count": st.column_config.NumberColumn(label="Measurements", format="%d"),
+        "first": st.column_config.DateColumn(label="First", format="DD.MM.YYYY"),
+        "last": st.column_config.DateColumn(label="Last", format="DD.MM.YYYY"),
+        "weight": st.column_config.NumberColumn(label="Weight", format="%.1f kg"),
+        "trend": st.column_config.NumberColumn(label="Trend", format="%+.2f kg/week"),
+    },
+)
+
 # update users ----------------------------------------------------------------
+ut.h_spacer(2)
 st.subheader("Manage Users")
 st.markdown("Edit the fields accordingly and press [enter].")
 edited_user = st.data_editor(
@@ -99,14 +117,11 @@ with st.container(border=True):
     col_del_sb, col_del_btn = st.columns([1, 1], gap="medium")
     # select box
     with col_del_sb:
-        usr_idx = [i for i, _ in st.session_state.user_db.iterrows()]
-        usr_name = [r["name"] for i, r in st.session_state.user_db.iterrows()]
-
         st.selectbox(
             "select user:",
             label_visibility="collapsed",
-            options=usr_idx,
-            format_func=lambda i: usr_name[i],
+            options=st.session_state.user_reg.options,
+            format_func=st.session_state.user_reg.name,
             key="sb_user_delete",
             placeholder="...",
             index=None,
@@ -123,7 +138,7 @@ with st.container(border=True):
 
             # last question
             st.subheader(
-                f"Are you sure to delete _'{usr_name[st.session_state.sb_user_delete] if st.session_state.sb_user_delete is not None else ''}'_?"
+                f"Are you sure to delete _'{st.session_state.user_reg.name(st.session_state.sb_user_delete) if st.session_state.sb_user_delete is not None else ''}'_?"
             )
             st.caption(
                 f"This is not reversible and all data will be lost! Maybe consider _copying_ your data first? It's all saved in the _'data/{st.session_state.user_name}.csv'_ file."
@@ -179,6 +194,15 @@ if st.session_state.flags["usr_add_exists"]:
     time.sleep(2)
     container_add.empty()
 
+if st.session_state.flags["usr_add_invalid"]:
+    st.session_state.flags["usr_add_invalid"] = False
+    container_add.warning(
+        "Name must not contain / or \\\\ and cannot be 'users'",
+        icon=":material/warning:",
+    )
+    time.sleep(2)
+    container_add.empty()
+
 # show feedback
 if st.session_state.flags["usr_del_ok"]:
     st.session_state.flags["usr_del_ok"] = False
@@ -1,39 +1,50 @@
-import time
 import streamlit as st
+from datetime import datetime
 import functions.utils as ut
 import functions.data as data
+import functions.lookup as lookup
+import functions.history as history
 
 ut.init_vars()
 ut.default_style()
 ut.create_menu()
+ut.live_updates()
 
 # manage measurement ---------------------------------------------------------
 st.subheader("Manage Measurements")
 with st.container(border=True):
-    # get date first
-    date = st.date_input("Date", "today", format="DD.MM.YYYY")
-
-    # get measurements to fill in form
-    if st.session_state.db.shape[0] == 0:
-        # if database is empty, use default values
-        value_wgt = 80.0
-        value_fat = 25.0
-        value_h2o = 50.0
-        value_msc = 25.0
-    else:
-        # else get last measurements before current date
-        # find index of last measurement before current date
-        if date < st.session_state.db["date"].min().date():
-            idx_date = 0
-        else:
-            dates = st.session_state.db["date"][::-1].dt.date <= date
-            idx_date = dates.idxmax()
+    # date and time of measurement, now by default, so a new one is added
+    data.entry_now()
+
+    # get date first, time follows the date or a picked saved measurement
+    col_date, col_time, col_saved = st.columns([1, 1, 1], gap="small")
+    with col_date:
+        day = st.date_input(
+            "Date", format="DD.MM.YYYY", key="entry_date", on_change=data.entry_pick
+        )
+    with col_time:
+        tme = st.time_input(
+            "Time", key="entry_time", step=60, on_change=data.entry_pick
+        )
+    with col_saved:
+        st.selectbox(
+            "Saved",
+            options=data.entry_saved(day),
+            index=None,
+            format_func=lambda t: t.strftime("%H:%M"),
+            placeholder="pick to update",
+            key="entry_saved",
+            on_change=data.entry_pick,
+            args=(True,),
+        )
+    when = datetime.combine(day, tme)
 
-        # get values of last measurement before current date
-        value_wgt = st.session_state.db.loc[idx_date, "weight"]
-        value_fat = st.session_state.db.loc[idx_date, "fat"]
-        value_h2o = st.session_state.db.loc[idx_date, "water"]
-        value_msc = st.session_state.db.loc[idx_date, "muscle"]
+    # get last measurements before current date to fill in form, or defaults
+    prefill = lookup.prefill(st.session_state.db, day)
+    value_wgt = prefill["weight"]
+    value_fat = prefill["fat"]
+    value_h2o = prefill["water"]
+    value_msc = prefill["muscle"]
 
     # create form to fill in measurements
     with st.form("data_entry", border=False):
@@ -77,8 +88,8 @@ with st.container(border=True):
                 format="%.1f",
             )
 
-        # check if measurements for this day are already saved
-        if any(st.session_state.db["date"].dt.date == date):
+        # check if measurement at this time is already saved
+        if lookup.find(st.session_state.db, when) is not None:
             btn_add_upd_lbl = "**update** measurement"
             btn_add_upd_icn = ":material/update:"
             btn_del_disabled = False
@@ -88,72 +99,236 @@ with st.container(border=True):
             btn_del_disabled = True
 
         # submit button
-        col_btn_add_upd, col_fdb_add_upd = st.columns([2, 3], gap="small")
-        with col_btn_add_upd:
-            submitted_add_upd = st.form_submit_button(
-                label=btn_add_upd_lbl, icon=btn_add_upd_icn
-            )
-        with col_fdb_add_upd:
-            container_add_upd = st.empty()
-
-    # delete button and feedback
-    col_btn_del, col_fdb_del = st.columns([2, 3], gap="small")
-    with col_btn_del:
-        submitted_del = st.button(
-            label="**delete** measurement",
-            icon=":material/delete:",
-            disabled=btn_del_disabled,
+        submitted_add_upd = st.form_submit_button(
+            label=btn_add_upd_lbl, icon=btn_add_upd_icn
         )
-    with col_fdb_del:
-        container_del = st.empty()
+
+    # delete button
+    submitted_del = st.button(
+        label="**delete** measurement",
+        icon=":material/delete:",
+        disabled=btn_del_disabled,
+    )
+
+    # undo and redo of this session's changes
+    if st.session_state.user_idx is not None:
+        col_undo, col_redo = st.columns([1, 1], gap="small")
+        with col_undo:
+            st.button(
+                label="**undo** last change",
+                icon=":material/undo:",
+                disabled=history.undoable(
+                    st.session_state.user_name, "undo", st.session_state.session_id
+                )
+                is None,
+                on_click=data.undo,
+                args=("undo",),
+            )
+        with col_redo:
+            st.button(
+                label="**redo** change",
+                icon=":material/redo:",
+                disabled=history.undoable(
+                    st.session_state.user_name, "redo", st.session_state.session_id
+                )
+                is None,
+                on_click=data.undo,
+                args=("redo",),
+            )
 
     # handle ADDING/UPDATING
     if submitted_add_upd:
         # add data entry
-        data.add_update(date, wgt, fat, h2o, msc)
+        data.add_update(when, wgt, fat, h2o, msc)
         # rerun 4 feedback
         st.rerun()
 
     # handle DELETION
     if submitted_del:
         # delete entry
-        data.delete(date)
+        data.delete(when)
         # rerun 4 feedback
         st.rerun()
 
 # overview database entries -----------------------------------------------
 ut.h_spacer(2)
 st.subheader("All Measurements")
-st.dataframe(
-    st.session_state.db.sort_values(by="date", ascending=False),
+
+# search by date range and metric thresholds
+with st.expander("search", icon=":material/search:"):
+    col_dates, col_metric, col_lo, col_hi = st.columns([3, 2, 2, 2], gap="small")
+    with col_dates:
+        search_dates = st.date_input(
+            "Date range", value=(), format="DD.MM.YYYY", key="tbl_dates"
+        )
+    with col_metric:
+        search_metric = st.selectbox(
+            "Metric",
+            options=["weight", "fat", "water", "muscle"],
+            index=None,
+            placeholder="...",
+            key="tbl_metric",
+        )
+    with col_lo:
+        search_lo = st.number_input(
+            "min", value=None, step=0.1, format="%.1f", key="tbl_lo"
+        )
+    with col_hi:
+        search_hi = st.number_input(
+            "max", value=None, step=0.1, format="%.1f", key="tbl_hi"
+        )
+
+# find rows in cached, date-descending view
+if st.session_state.user_idx is None:
+    db_desc = data.create_df()
+else:
+    db_desc = data.sorted_desc(st.session_state.user_name, st.session_state.db_version)
+rows = data.search(
+    db_desc,
+    start=search_dates[0] if len(search_dates) > 0 else None,
+    end=search_dates[-1] if len(search_dates) > 0 else None,
+    metric=search_metric,
+    lo=search_lo,
+    hi=search_hi,
+)
+
+# pagination, only the visible page is sent to the browser
+col_size, col_page, col_info = st.columns(
+    [2, 2, 3], gap="small", vertical_alignment="bottom"
+)
+with col_size:
+    page_size = st.selectbox(
+        "Rows per page", options=[25, 50, 100, 250], index=1, key="tbl_size"
+    )
+n_pages = max(1, -(-len(rows) // page_size))
+if st.session_state.get("tbl_page", 1) > n_pages:
+    st.session_state.tbl_page = n_pages
+with col_page:
+    page = st.number_input(
+        "Page", min_value=1, max_value=n_pages, step=1, key="tbl_page"
+    )
+with col_info:
+    st.caption(
+        f"{min(len(rows), (page - 1) * page_size + 1)}-{min(len(rows), page * page_size)} of {len(rows)} measurements"
+    )
+
+# editable grid, all changes are saved as one batch
+st.caption("Edit, add or delete rows, changes are saved when leaving the grid.")
+db_page = db_desc.iloc[rows[(page - 1) * page_size : page * page_size]].reset_index(
+    drop=True
+)
+grid_key = f"db_edited_{st.session_state.get('grid_id', 0)}"
+st.data_editor(
+    db_page,
     use_container_width=True,
     hide_index=True,
+    num_rows="dynamic",
     column_config={
-        "date": st.column_config.DateColumn(
-            label="Date", format="DD.MM.YYYY", pinned=True
+        "date": st.column_config.DatetimeColumn(
+            label="Date", format="DD.MM.YYYY HH:mm", pinned=True, required=True
+        ),
+        "weight": st.column_config.NumberColumn(
+            label="Weight",
+            format="%.1f kg",
+            required=True,
+            min_value=0.0,
+            max_value=200.0,
+        ),
+        "fat": st.column_config.NumberColumn(
+            label="% Fat",
+            format="%.1f %%",
+            required=True,
+            min_value=0.0,
+            max_value=100.0,
         ),
-        "weight": st.column_config.NumberColumn(label="Weight", format="%.1f kg"),
-        "fat": st.column_config.NumberColumn(label="% Fat", format="%.1f %%"),
-        "water": st.column_config.NumberColumn(label="% Water", format="%.1f %%"),
-        "muscle": st.column_config.NumberColumn(label="% Muscle", format="%.1f %%"),
+        "water": st.column_config.NumberColumn(
+            label="% Water",
+            format="%.1f %%",
+            required=True,
+            min_value=0.0,
+            max_value=100.0,
+        ),
+        "muscle": st.column_config.NumberColumn(
+            label="% Muscle",
+            format="%.1f %%",
+            required=True,
+            min_value=0.0,
+            max_value=100.0,
+        ),
+        "outlier": st.column_config.CheckboxColumn(label="Outlier", disabled=True),
     },
+    disabled=st.session_state.user_idx is None,
+    on_change=data.apply_edits,
+    args=(db_page, grid_key),
+    key=grid_key,
 )
 
-# display messages ----------------------
+# history of changes, and data as of an earlier version
+if st.session_state.user_idx is not None:
+    with st.expander("history", icon=":material/history:"):
+        versions = history.log(st.session_state.user_name)
+        if versions.shape[0] == 0:
+            st.caption("No changes recorded yet.")
+        else:
+            st.dataframe(
+                versions,
+                hide_index=True,
+                use_container_width=True,
+                column_config={
+                    "time": st.column_config.DatetimeColumn(
+                        format="DD.MM.YYYY HH:mm:ss"
+                    )
+                },
+            )
+            as_of = st.selectbox(
+                "Measurements as of version",
+                options=versions["version"].tolist(),
+                key="tbl_as_of",
+            )
+            st.dataframe(
+                data.as_of(st.session_state.user_name, as_of).iloc[::-1],
+                hide_index=True,
+                use_container_width=True,
+                column_config={
+                    "date": st.column_config.DatetimeColumn(
+                        label="Date", format="DD.MM.YYYY HH:mm"
+                    )
+                },
+            )
+
+# display messages, as toasts to not block the page ----------------------
 if st.session_state.flags["data_add"]:
     st.session_state.flags["data_add"] = False
-    container_add_upd.success("new entry **added**", icon=":material/add_circle:")
-    time.sleep(2)
-    container_add_upd.empty()
+    st.toast("new entry **added**", icon=":material/add_circle:")
+
+if st.session_state.flags["data_outlier"]:
+    st.session_state.flags["data_outlier"] = False
+    st.toast("new entry looks like an **outlier**", icon=":material/warning:")
 
 if st.session_state.flags["data_upd"]:
     st.session_state.flags["data_upd"] = False
-    container_add_upd.success("old entry **updated**", icon=":material/update:")
-    time.sleep(2)
-    container_add_upd.empty()
+    st.toast("old entry **updated**", icon=":material/update:")
+
+if st.session_state.flags["data_edit"]:
+    st.session_state.flags["data_edit"] = False
+    st.toast("changes **saved**", icon=":material/edit:")
+
+if st.session_state.flags["data_edit_clash"]:
+    st.toast(
+        "changes **not saved**, another entry exists at "
+        + st.session_state.flags["data_edit_clash"],
+        icon=":material/warning:",
+    )
+    st.session_state.flags["data_edit_clash"] = False
 
 if st.session_state.flags["data_del"]:
     st.session_state.flags["data_del"] = False
-    container_del.success("entry **deleted**", icon=":material/delete:")
-    time.sleep(2)
-    container_del.empty()
+    st.toast("entry **deleted**", icon=":material/delete:")
+
+if st.session_state.flags["data_undo"]:
+    st.session_state.flags["data_undo"] = False
+    st.toast("last change **undone**", icon=":material/undo:")
+
+if st.session_state.flags["data_redo"]:
+    st.session_state.flags["data_redo"] = False
+    st.toast("change **redone**", icon=":material/redo:")
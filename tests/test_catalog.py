@@ -0,0 +1,68 @@
+import os
+import pandas as pd
+import functions.data as data
+import functions.writer as writer
+import functions.catalog as catalog
+import functions.history as history
+
+
+def test_catalog_follows_changes_outside_the_app(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data")
+    pd.DataFrame(
+        [["mock", 180, 72.0, "date range", "2024-09-27", 12]],
+        columns=["name", "height", "target", "trend_how", "trend_start", "trend_range"],
+    ).to_csv(os.path.join("data", "users.csv"), index=False)
+    path = os.path.join("data", "mock.csv")
+    with open(path, "w") as f:
+        f.write("date,weight,fat,water,muscle\n2025-01-01,80.0,25.0,50.0,35.0\n")
+    catalog._catalog.clear()
+
+    assert catalog.load()["count"].tolist() == [1]
+
+    # appended by another tool
+    with open(path, "a") as f:
+        f.write("2025-01-02,79.5,25.0,50.0,35.0\n")
+    os.utime(path, ns=(os.stat(path).st_mtime_ns + 10**9,) * 2)
+
+    row = catalog.load().iloc[0]
+    assert row["count"] == 2
+    assert row["weight"] == 79.5
+
+    # a user named like the catalog has a file of its own
+    assert os.path.abspath(catalog.PATH) != os.path.abspath(
+        os.path.join("data", "catalog.csv")
+    )
+
+    # written before leaving the temporary directory
+    writer.flush()
+
+
+def test_rows_saved_by_the_app_stay_valid_after_restart(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data")
+    pd.DataFrame(
+        [["mock", 180, 72.0, "date range", "2024-09-27", 12]],
+        columns=["name", "height", "target", "trend_how", "trend_start", "trend_range"],
+    ).to_csv(os.path.join("data", "users.csv"), index=False)
+    with open(os.path.join("data", "mock.csv"), "w") as f:
+        f.write("date,weight,fat,water,muscle\n2025-01-01,80.0,25.0,50.0,35.0\n")
+    for cache in [data.read_db, catalog._catalog, history._histories]:
+        cache.clear()
+
+    db = data.read_db("mock", data.version("mock"))
+    db = pd.concat([db, db.assign(date=db["date"] + pd.Timedelta(days=1))])
+    data.save("mock", db, "date range", "2024-09-27", 12)
+    writer.flush()
+
+    # restart, no data is read again
+    monkeypatch.setattr(writer, "_written", {})
+    for cache in [data.read_db, catalog._catalog, history._histories]:
+        cache.clear()
+
+    def summarize(*args):
+        raise AssertionError("summarized again")
+
+    monkeypatch.setattr(catalog, "summarize", summarize)
+    assert catalog.load()["count"].tolist() == [2]
+    writer.flush()
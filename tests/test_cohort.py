@@ -0,0 +1,32 @@
+import pandas as pd
+import functions.benchmark as benchmark
+import functions.cohort as cohort
+import functions.data as data
+
+
+def test_helper_process_prepares_like_the_app(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    benchmark.household(str(tmp_path), 2, 1)
+    jobs = {name: (f"data/{name}.csv", 75.0) for name in ["user0", "user1"]}
+
+    prepared = cohort.prepare_all(jobs)
+
+    for name, job in jobs.items():
+        weekly, summary = cohort.prepare(*job)
+        assert prepared[name][0].equals(weekly)
+        assert prepared[name][1] == summary
+
+
+def test_small_household_is_prepared_without_helper(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    benchmark.household(str(tmp_path), 2, 1)
+    data.read_db.clear()
+    cohort._results()["users"].clear()
+
+    def helper(jobs):
+        raise AssertionError("helper started")
+
+    monkeypatch.setattr(cohort, "prepare_all", helper)
+    weekly, summary = cohort.load(pd.read_csv("data/users.csv"))
+    assert summary["name"].tolist() == ["user0", "user1"]
+    assert all(weekly[name].shape[0] > 0 for name in ["user0", "user1"])
@@ -0,0 +1,49 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import functions.forecast as forecast
+import functions.figures as fgs
+
+
+def test_damped_backtest_is_out_of_sample():
+    rng = np.random.default_rng(0)
+    x = np.arange(40, dtype=float)
+    y = 80 - 0.05 * x + rng.normal(0, 0.3, x.shape[0])
+    origins = np.arange(x.shape[0] - forecast.FOLDS, x.shape[0])
+
+    # a forecast must not change with the value it forecasts
+    pred = forecast._damped(x, y, origins[0])["pred"]
+    y_changed = y.copy()
+    y_changed[origins[-1]] += 5
+    pred_changed = forecast._damped(x, y_changed, origins[0])["pred"]
+    assert pred[origins[-1]] == pred_changed[origins[-1]]
+
+
+def test_no_trend_without_measurements_in_window():
+    assert forecast.fit(np.array([]), np.array([])) is None
+
+    db = pd.DataFrame(
+        {
+            "date": pd.date_range("2025-01-01", periods=5),
+            "input": [80.0, 79.8, 79.9, 79.5, 79.4],
+        }
+    )
+    assert fgs.fit(db, "start date", datetime(2025, 2, 1), 4) == (None, None)
+
+
+def test_piecewise_fits_only_requested_parts():
+    rng = np.random.default_rng(1)
+    x = np.arange(30, dtype=float)
+    y = 80 - 0.1 * np.maximum(0, x - 12) + rng.normal(0, 0.2, x.shape[0])
+
+    # same break as a least squares fit at every knot of the leading part
+    pw = forecast._piecewise(x, y, np.array([2, 19, 29]))
+    assert np.isnan(pw["knot"][0])
+    for end, knot in zip([19, 29], pw["knot"][1:]):
+        sse = []
+        for k in x[1 : end - 1]:
+            a = np.column_stack(
+                [np.ones(end + 1), x[: end + 1], np.maximum(0, x[: end + 1] - k)]
+            )
+            sse.append(np.linalg.lstsq(a, y[: end + 1], rcond=None)[1][0])
+        assert knot == x[1 + int(np.argmin(sse))]
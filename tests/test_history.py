@@ -0,0 +1,131 @@
+import os
+import pandas as pd
+import functions.data as data
+import functions.writer as writer
+import functions.history as history
+
+
+def frame(*weights: float) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "date": pd.date_range("2025-01-01 07:00", periods=len(weights), freq="D"),
+            "weight": list(weights),
+            "fat": 25.0,
+            "water": 50.0,
+            "muscle": 35.0,
+        }
+    )
+
+
+def test_external_changes_and_undo_per_session(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    history._histories.clear()
+
+    v1 = history.record("mock", frame(80.0), frame(80.0, 79.5), session="a")
+    v2 = history.record("mock", frame(80.0, 79.5), frame(80.0, 79.5, 79.0))
+    assert (v1, v2) == (1, 2)
+
+    # changed by hand since, recorded before the next change
+    edited = frame(80.5, 79.5, 79.0)
+    v = history.record(
+        "mock", edited, frame(80.5, 79.5, 79.0, 78.8), current=123, session="b"
+    )
+    assert v == 4
+    assert history.log("mock")["kind"].tolist()[:2] == ["edit", "external"]
+    assert history.replay("mock", 3).equals(edited)
+
+    # each session undoes only its own change, the API's never
+    assert history.undoable("mock", "undo", "a")[0] == 1
+    assert history.undoable("mock", "undo", "b")[0] == 4
+    assert history.undoable("mock", "undo", "c") is None
+    assert history.undoable("mock", "undo") is None
+
+    target, ops = history.undoable("mock", "undo", "a")
+    history.record(
+        "mock",
+        frame(80.5, 79.5, 79.0, 78.8),
+        history.apply(frame(80.5, 79.5, 79.0, 78.8), ops),
+        "undo",
+        session="a",
+        target=target,
+    )
+    assert history.undoable("mock", "undo", "a") is None
+    assert history.undoable("mock", "undo", "b")[0] == 4
+    assert history.undoable("mock", "redo", "a")[0] == 5
+
+
+def test_removed_user_keeps_version_after_restart(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    history._histories.clear()
+
+    history.record("mock", frame(80.0), frame(80.0, 79.5))
+    history.remove("mock")
+
+    # restart
+    history._histories.clear()
+    assert history.record("mock", frame(), frame(81.0)) == 2
+    writer.flush()
+    assert os.path.isfile(os.path.join(history.DIR, "mock", "1.csv"))
+    assert history.replay("mock", 1).shape[0] == 0
+
+
+def test_deltas_before_latest_snapshot_are_read_from_log(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(history, "SNAPSHOT_EVERY", 3)
+    history._histories.clear()
+
+    frames = [frame(*[80.0 - 0.5 * i for i in range(n + 1)]) for n in range(6)]
+    for n in range(5):
+        history.record("mock", frames[n], frames[n + 1], session="a")
+    writer.flush()
+
+    # restart
+    history._histories.clear()
+    with history._histories()["lock"]:
+        hist = history._load("mock")
+    assert (hist["since"], list(hist["ops"])) == (3, [4, 5])
+    assert history.log("mock")["added"].tolist()[:5] == [1] * 5
+
+    assert history.replay("mock", 2).equals(frames[2])
+    assert history.replay("mock", 5).equals(frames[5])
+    target, ops = history.undoable("mock", "undo", "a")
+    assert target == 5 and ops == history.invert(history.diff(frames[4], frames[5]))
+
+    # undo back past the snapshot, deltas come from the log
+    for v in [5, 4, 3, 2]:
+        target, ops = history.undoable("mock", "undo", "a")
+        assert target == v
+        history.record(
+            "mock",
+            frames[v],
+            history.apply(frames[v], ops),
+            "undo",
+            session="a",
+            target=target,
+        )
+    assert history.undoable("mock", "undo", "a")[0] == 1
+    writer.flush()
+
+
+def test_data_version_is_history_head_after_restart(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data")
+    frame(80.0).to_csv(os.path.join("data", "mock.csv"), index=False)
+    history._histories.clear()
+    data.read_db.clear()
+
+    _, saved = data.save("mock", frame(80.0, 79.5), "date range", "2025-01-01", 12)
+    writer.flush()
+    assert saved == history.log("mock")["version"].iloc[0]
+
+    # restart, the written file keeps its recorded version
+    monkeypatch.setattr(writer, "_written", {})
+    history._histories.clear()
+    assert data.version("mock") == saved
+
+    # changed by another tool
+    path = os.path.join("data", "mock.csv")
+    with open(path, "a") as f:
+        f.write("2025-01-03T07:00:00,79.0,25.0,50.0,35.0,False\n")
+    assert data.version("mock") == os.stat(path).st_mtime_ns
+    writer.flush()
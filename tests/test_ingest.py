@@ -0,0 +1,90 @@
+import os
+import json
+import time
+import socket
+import http.client
+import pandas as pd
+from streamlit.testing.v1 import AppTest
+import functions.data as data
+import functions.writer as writer
+import functions.ingest as ingest
+import functions.history as history
+
+
+def session() -> None:
+    import streamlit as st
+    import functions.data as data
+
+    if "db" not in st.session_state:
+        st.session_state.session_id = "session"
+        st.session_state.user_name = "mock"
+        st.session_state.trend_how = "date range"
+        st.session_state.trend_start = "2025-01-01"
+        st.session_state.trend_range = 12
+        st.session_state.db = data.load_db()
+    else:
+        st.session_state.db.loc[0, "weight"] = 81.0
+        data.save_db()
+
+
+def post(port: int, body: bytes, headers: dict | None = None) -> int:
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    conn.request("POST", "/measurements", body, headers or {})
+    status = conn.getresponse().status
+    conn.close()
+    return status
+
+
+def test_pushed_row_survives_a_session_saving_an_older_frame(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("TZ", "Europe/Berlin")
+    time.tzset()
+    history._histories.clear()
+    os.makedirs("data")
+    pd.DataFrame(
+        [["mock", 180, 72.0, "date range", "2025-01-01", 12]],
+        columns=["name", "height", "target", "trend_how", "trend_start", "trend_range"],
+    ).to_csv(os.path.join("data", "users.csv"), index=False)
+    with open(os.path.join("data", "mock.csv"), "w") as f:
+        f.write(
+            "date,weight,fat,water,muscle\n2025-01-01T07:00:00,80.0,25.0,50.0,35.0\n"
+        )
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    ingest.start(port)
+
+    # session holds the frame from before the push
+    at = AppTest.from_function(session).run()
+    assert not at.exception
+
+    push = {
+        "user": "mock",
+        "date": "2025-01-02T07:00+01:00",
+        "weight": 79.5,
+        "fat": 25.0,
+        "water": 50.0,
+        "muscle": 35.0,
+    }
+    assert post(port, json.dumps(push).encode()) == 202
+    ingest.flush()
+
+    # session saves its own edit afterwards
+    at.session_state["edit"] = True
+    at.run()
+    assert not at.exception
+    writer.flush()
+
+    db = data.parse(os.path.join("data", "mock.csv"))
+    assert db["date"].tolist() == [
+        pd.Timestamp("2025-01-01 07:00"),
+        pd.Timestamp("2025-01-02 07:00"),
+    ]
+    assert db["weight"].tolist() == [81.0, 79.5]
+
+    # invalid length is rejected instead of read until the client closes
+    assert post(port, b"{}", {"Content-Length": "-1"}) == 400
+
+    monkeypatch.delenv("TZ")
+    time.tzset()
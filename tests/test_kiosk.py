@@ -0,0 +1,17 @@
+import pandas as pd
+import functions.kiosk as kiosk
+
+
+def test_window_limits_drawn_rows_only(monkeypatch):
+    monkeypatch.setattr(kiosk, "ENABLED", True)
+    db = pd.DataFrame({"date": pd.date_range("2020-01-01", periods=1800)})
+
+    pos = kiosk.window(db)
+    assert len(pos) == min(kiosk.WINDOW_DAYS, kiosk.MAX_POINTS)
+    assert db["date"].iloc[-1] - db["date"].iloc[pos[0]] < pd.Timedelta(
+        days=kiosk.WINDOW_DAYS
+    )
+    assert pos[-1] == db.shape[0] - 1
+
+    monkeypatch.setattr(kiosk, "ENABLED", False)
+    assert len(kiosk.window(db)) == db.shape[0]
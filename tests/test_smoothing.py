@@ -0,0 +1,49 @@
+import os
+import numpy as np
+import functions.data as data
+import functions.writer as writer
+import functions.smoothing as smoothing
+
+
+def test_appended_measurement_continues_kept_state(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data")
+    path = os.path.join("data", "mock.csv")
+    with open(path, "w") as f:
+        f.write("date,weight,fat,water,muscle\n")
+        for day, weight in enumerate([80.0, 79.6, 80.2, 79.4, 79.1], start=1):
+            f.write(f"2025-01-0{day}T07:00:00,{weight},25.0,50.0,35.0\n")
+    smoothing.clear()
+
+    first = smoothing.smoothed(
+        "mock", data.version("mock"), "first", "highlight", "kalman"
+    )
+    writer.flush()
+    assert os.path.isfile(smoothing._path("mock", "first", "highlight", "kalman"))
+
+    # appended after a restart, the kept state is read back from disk
+    smoothing.clear()
+    with open(path, "a") as f:
+        f.write("2025-01-06T07:00:00,78.8,25.0,50.0,35.0\n")
+    os.utime(path, ns=(os.stat(path).st_mtime_ns + 10**9,) * 2)
+
+    steps = []
+    run = smoothing.run
+    monkeypatch.setattr(
+        smoothing, "run", lambda *args: steps.append(len(args[2])) or run(*args)
+    )
+    second = smoothing.smoothed(
+        "mock", data.version("mock"), "first", "highlight", "kalman"
+    )
+
+    assert steps == [1]
+    np.testing.assert_allclose(second[:-1], first)
+    np.testing.assert_allclose(
+        second,
+        smoothing.smooth(
+            data.daily("mock", data.version("mock"), "first", "highlight"), "kalman"
+        ),
+    )
+
+    smoothing.remove("mock")
+    assert not os.path.exists(os.path.join(smoothing.DIR, "mock"))
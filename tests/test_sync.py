@@ -0,0 +1,157 @@
+import os
+import sys
+import time
+import socket
+import threading
+import subprocess
+import pytest
+from streamlit.testing.v1 import AppTest
+import functions.data as data
+import functions.user as user
+import functions.sync as sync
+import functions.writer as writer
+import functions.catalog as catalog
+import functions.history as history
+
+USERS = "name,height,target,trend_how,trend_start,trend_range\n"
+HEADER = "date,weight,fat,water,muscle\n"
+
+
+def test_sync_into_app_data_goes_through_the_app(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for folder in ["data", "peer"]:
+        os.makedirs(folder)
+    with open(os.path.join("data", "users.csv"), "w") as f:
+        f.write(USERS + "mock,180,72.0,date range,2025-01-01,12\n")
+    with open(os.path.join("data", "mock.csv"), "w") as f:
+        f.write(HEADER + "2025-01-01T07:00:00,80.0,25.0,50.0,35.0\n")
+    with open(os.path.join("peer", "users.csv"), "w") as f:
+        f.write(
+            USERS
+            + "mock,180,72.0,date range,2025-01-01,12\n"
+            + "newbie,170,60.0,date range,2025-01-01,12\n"
+        )
+    with open(os.path.join("peer", "mock.csv"), "w") as f:
+        f.write(
+            HEADER
+            + "2025-01-01T07:00:00,80.0,25.0,50.0,35.0\n"
+            + "2025-01-02T07:00:00,79.5,25.0,50.0,35.0\n"
+        )
+    for cache in [data.read_db, user.read_db, catalog._catalog, history._histories]:
+        cache.clear()
+
+    local = sync.Store("data")
+    assert local.app
+    sync.sync(local, sync.Store("peer"))
+
+    # user added by the sync can be selected
+    assert data.read_db("newbie", data.version("newbie")).shape[0] == 0
+
+    # synced rows are recorded and summarized like changes made in the app
+    version = data.version("mock")
+    assert history.log("mock")["version"].iloc[0] == version
+    assert history.replay("mock", version)["weight"].tolist() == [80.0, 79.5]
+    assert catalog.load().set_index("name").loc["mock", "count"] == 2
+
+    # written before leaving the temporary directory
+    writer.flush()
+
+
+def test_sync_server_needs_secret_beyond_local_host(tmp_path):
+    store = sync.Store(str(tmp_path))
+    with pytest.raises(ValueError):
+        sync.serve(store, "0.0.0.0", secret=None)
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = threading.Thread(
+        target=sync.serve, args=(store, "127.0.0.1", port, "right"), daemon=True
+    )
+    server.start()
+    for _ in range(50):
+        try:
+            remote = sync.Remote("127.0.0.1", port, "wrong")
+            break
+        except ConnectionRefusedError:
+            threading.Event().wait(0.05)
+
+    with pytest.raises(RuntimeError):
+        remote.id()
+    remote.close()
+    server.join(5)
+
+
+def test_names_from_other_installation_are_checked(tmp_path):
+    store = sync.Store(str(tmp_path))
+    row = ["../mock", "180", "72", "date range", "2025-01-01", "12"]
+    with pytest.raises(ValueError):
+        store.write_users({"../mock": row})
+    with pytest.raises(ValueError):
+        store.write("users", {"2025-01": []})
+    with pytest.raises(ValueError):
+        store.base(os.path.join("..", "peer"))
+    assert not os.path.exists(os.path.join(tmp_path, "..", "mock.csv"))
+
+
+def test_save_waits_for_lock_of_other_process(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(data.LOCKS)
+    with open(os.path.join("data", "mock.csv"), "w") as f:
+        f.write(HEADER + "2025-01-01T07:00:00,80.0,25.0,50.0,35.0\n")
+    for cache in [data.read_db, catalog._catalog, history._histories]:
+        cache.clear()
+
+    # another process, e.g. a sync, saves meanwhile
+    other = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            "import fcntl, sys, time\n"
+            "f = open(sys.argv[1], 'w')\n"
+            "fcntl.flock(f, fcntl.LOCK_EX)\n"
+            "print(flush=True)\n"
+            "time.sleep(0.5)\n",
+            os.path.join(data.LOCKS, "mock.lock"),
+        ],
+        stdout=subprocess.PIPE,
+    )
+    other.stdout.readline()
+
+    start = time.perf_counter()
+    db = data.read_db("mock", data.version("mock"))
+    data.save("mock", db.assign(weight=79.0), "date range", "2025-01-01", 12)
+    assert time.perf_counter() - start > 0.3
+    other.wait()
+    writer.flush()
+
+
+def session() -> None:
+    import streamlit as st
+    import functions.user as user
+
+    if "user_db" not in st.session_state:
+        st.session_state.user_db = user.load_db()
+    else:
+        user.save_db()
+
+
+def test_session_keeps_users_added_meanwhile(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data")
+    path = os.path.join("data", "users.csv")
+    with open(path, "w") as f:
+        f.write(USERS + "mock,180,72.0,date range,2025-01-01,12\n")
+    user.read_db.clear()
+
+    at = AppTest.from_function(session).run()
+
+    # added by a sync
+    with open(path, "a") as f:
+        f.write("newbie,170,60.0,date range,2025-01-01,12\n")
+    os.utime(path, ns=(os.stat(path).st_mtime_ns + 10**9,) * 2)
+
+    at.run()
+    assert not at.exception
+    writer.flush()
+    assert user.load_db()["name"].tolist() == ["mock", "newbie"]
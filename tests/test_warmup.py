@@ -0,0 +1,35 @@
+import hashlib
+from datetime import date
+import pandas as pd
+from streamlit.runtime.caching.cache_type import CacheType
+from streamlit.runtime.caching.hashing import update_hash
+import functions.figures as fgs
+
+
+def _hash(args: tuple) -> str:
+    hasher = hashlib.new("md5")
+    update_hash(args, hasher, CacheType.RESOURCE)
+    return hasher.hexdigest()
+
+
+def test_trend_keys_of_warmup_and_sessions_match():
+    users = pd.DataFrame(
+        [["mock", 180, 72.0, "date range", pd.Timestamp("2024-09-27"), 12]],
+        columns=["name", "height", "target", "trend_how", "trend_start", "trend_range"],
+    )
+
+    # warm-up takes records, sessions take rows of the user database and widgets
+    record = users.to_dict("records")[0]
+    row = users.loc[0]
+    warmup = fgs.trend_key(
+        record["trend_how"],
+        record["trend_start"],
+        record["trend_range"],
+        record["target"],
+    )
+    session = fgs.trend_key(
+        row["trend_how"], row["trend_start"], row["trend_range"], row["target"]
+    )
+    widgets = fgs.trend_key("date range", date(2024, 9, 27), 12, 72)
+
+    assert _hash(warmup) == _hash(session) == _hash(widgets)
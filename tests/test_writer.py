@@ -0,0 +1,36 @@
+import os
+import time
+import pandas as pd
+import functions.writer as writer
+
+
+def test_failed_write_stays_pending_and_is_retried(tmp_path, monkeypatch):
+    path = str(tmp_path / "mock.csv")
+    df = pd.DataFrame({"weight": [80.0]})
+
+    # disk refuses the first write
+    calls = []
+    write = writer._write
+
+    def flaky(p: str, text: str) -> int:
+        calls.append(p)
+        if len(calls) == 1:
+            raise OSError("disk full")
+        return write(p, text)
+
+    monkeypatch.setattr(writer, "_write", flaky)
+    monkeypatch.setattr(writer, "RETRY_S", 0.1)
+
+    version = writer.save(path, df)
+    writer.flush()
+    assert path in writer.failures()
+    assert writer.pending(path)[0] == version
+
+    # retried until written
+    for _ in range(50):
+        if not writer.failures() and writer.pending(path) is None:
+            break
+        time.sleep(0.05)
+    assert os.path.exists(path)
+    assert writer.failures() == {}
+    assert writer.version(path) == version